@@ -0,0 +1,170 @@
+"""Local archive of all read-outs in memory-mapped column files"""
+from datetime import datetime as _dt
+import os
+import re
+import threading
+import numpy as _np
+from hexesvm import history as _hist
+
+
+# One file per column. The status column holds the bits of history.STATUS_BITS
+COLUMN_TYPES = {"t_wall": _np.float64, "t_mono": _np.float64,
+                "voltage": _np.float64, "current": _np.float64,
+                "set_voltage": _np.float64, "ramp_speed": _np.float64,
+                "status": _np.int64}
+
+# Number of valid records of a day, written after the records themselves
+COUNT_FILE = "count"
+
+
+def channel_key(module_name, channel_name):
+    # Directory name of a channel, only characters safe in file names
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", module_name+"__"+channel_name)
+
+
+def day_of(t_wall):
+    return _dt.fromtimestamp(t_wall).strftime("%Y%m%d")
+
+
+class _DayFiles():
+    # Column files of one channel and day, opened for writing
+
+    def __init__(self, path, block_records):
+        self.path = path
+        self.block_records = block_records
+        os.makedirs(path, exist_ok=True)
+        count_name = os.path.join(path, COUNT_FILE)
+        if not os.path.exists(count_name):
+            _np.zeros(1, dtype=_np.int64).tofile(count_name)
+        self.count = _np.memmap(count_name, dtype=_np.int64, mode="r+", shape=(1,))
+        self.n_records = int(self.count[0])
+        self.capacity = max(self.block_records, self.n_records)
+        self.columns = {}
+        self._map_columns()
+
+    def _map_columns(self):
+        for column, dtype in COLUMN_TYPES.items():
+            file_name = os.path.join(self.path, column)
+            size = self.capacity*_np.dtype(dtype).itemsize
+            # Preallocate whole blocks, so the file is not grown every record
+            with open(file_name, "ab") as column_file:
+                if column_file.tell() < size:
+                    column_file.truncate(size)
+            self.columns[column] = _np.memmap(file_name, dtype=dtype, mode="r+",
+                                              shape=(self.capacity,))
+
+    def append(self, values):
+        if self.n_records >= self.capacity:
+            self.flush()
+            self.columns = {}
+            self.capacity += self.block_records
+            self._map_columns()
+        for column, value in values.items():
+            self.columns[column][self.n_records] = value
+        # Only now the record becomes visible to readers
+        self.n_records += 1
+        self.count[0] = self.n_records
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+        self.count.flush()
+
+
+class ArchiveWriter():
+    """Appends channel snapshots to the archive
+
+    The archive holds one directory per day and channel with one file of
+    fixed size records per column, see COLUMN_TYPES. The files are memory
+    mapped and grown in blocks of block_records records. Appending a record
+    costs a few array assignments, the operating system writes the pages to
+    disk, flush() forces it.
+    """
+
+    def __init__(self, directory, block_records=65536):
+        self.directory = directory
+        self.block_records = block_records
+        self.lock = threading.Lock()
+        self.open_files = {}
+        self.records_written = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, key, snapshot):
+        if _np.isnan(snapshot.t_wall):
+            return
+        values = {column: getattr(snapshot, column) for column in COLUMN_TYPES
+                  if column != "status"}
+        values["status"] = _hist.encode_status(snapshot)
+        day = day_of(snapshot.t_wall)
+        with self.lock:
+            day_files = self.open_files.get(key)
+            if day_files is None or day_files[0] != day:
+                # Start the files of a new day
+                if day_files is not None:
+                    day_files[1].flush()
+                day_files = (day, _DayFiles(os.path.join(self.directory, day, key),
+                                            self.block_records))
+                self.open_files[key] = day_files
+            day_files[1].append(values)
+            self.records_written += 1
+
+    def flush(self):
+        with self.lock:
+            for day, day_files in self.open_files.values():
+                day_files.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.open_files = {}
+
+
+class ArchiveReader():
+    """Reads time ranges from the archive
+
+    The column files are memory mapped read-only, so the returned arrays are
+    views on the files and nothing is copied until the values are used. The
+    archive can be read while the writer keeps appending to it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def days(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if re.fullmatch(r"\d{8}", name))
+
+    def channels(self, day):
+        return sorted(os.listdir(os.path.join(self.directory, day)))
+
+    def read_day(self, key, day, t_start=-_np.inf, t_end=_np.inf):
+        # Dict of column arrays with t_start <= t_wall <= t_end of one day.
+        # None if the channel has no records that day
+        path = os.path.join(self.directory, day, key)
+        try:
+            n_records = int(_np.fromfile(os.path.join(path, COUNT_FILE),
+                                         dtype=_np.int64, count=1)[0])
+        except (FileNotFoundError, IndexError):
+            return None
+        if not n_records:
+            return None
+        columns = {column: _np.memmap(os.path.join(path, column), dtype=dtype,
+                                      mode="r", shape=(n_records,))
+                   for column, dtype in COLUMN_TYPES.items()}
+        start = _np.searchsorted(columns["t_wall"], t_start, side="left")
+        end = _np.searchsorted(columns["t_wall"], t_end, side="right")
+        return {column: values[start:end] for column, values in columns.items()}
+
+    def read(self, key, t_start, t_end):
+        # List of the read_day results of all days between t_start and t_end
+        first_day = day_of(t_start)
+        last_day = day_of(t_end)
+        segments = []
+        for day in self.days():
+            if first_day <= day <= last_day:
+                segment = self.read_day(key, day, t_start, t_end)
+                if segment is not None and len(segment["t_wall"]):
+                    segments.append(segment)
+        return segments
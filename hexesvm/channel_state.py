@@ -0,0 +1,23 @@
+"""Consistent snapshots of the state of an HV channel"""
+from collections import namedtuple
+import time
+
+
+# Values read from the hardware, published together
+STATE_FIELDS = ("voltage", "current", "voltage_t_mono", "voltage_t_wall",
+                "current_t_mono", "current_t_wall", "set_voltage", "ramp_speed",
+                "voltage_limit", "current_limit", "trip_current",
+                "channel_in_error", "channel_is_tripped", "hardware_inhibit",
+                "kill_enable_switch", "hv_switch_off", "polarity_positive",
+                "manual_control", "channel_is_ramping", "status",
+                "arc_detected")
+
+# Immutable record of one channel state. seq counts the publications,
+# t_mono (time.monotonic) and t_wall (time.time) give the publication time
+ChannelSnapshot = namedtuple("ChannelSnapshot", ("seq", "t_mono", "t_wall") + STATE_FIELDS)
+
+
+def take_snapshot(channel, seq):
+    # Copy the current state attributes of channel into a new snapshot
+    return ChannelSnapshot(seq, time.monotonic(), time.time(),
+                           *[getattr(channel, field) for field in STATE_FIELDS])
@@ -0,0 +1,143 @@
+"""Priority queue serializing the commands sent to an HV module"""
+from collections import deque
+import heapq
+import itertools
+import threading
+import time
+
+
+# Lower values are executed first. Routine reads of the reader thread have
+# the lowest priority of all
+PRIORITY_EMERGENCY = 0
+PRIORITY_SET = 1
+PRIORITY_READ = 2
+
+
+class CommandTimeout(Exception):
+    """A command was not executed within its timeout"""
+
+
+class HvCommand():
+    """A function to be executed with exclusive access to the module
+
+    The time stamps (time.monotonic) of submission, start and end are kept,
+    so the latency of every command can be inspected afterwards.
+    """
+
+    def __init__(self, function, priority, name=""):
+        self.function = function
+        self.priority = priority
+        self.name = name
+        self.t_submit = time.monotonic()
+        self.t_start = None
+        self.t_done = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.cancelled = False
+        self.state_lock = threading.Lock()
+
+    def execute(self):
+        with self.state_lock:
+            if self.cancelled:
+                # The caller gave up waiting, don't act on the board any more
+                return
+            self.t_start = time.monotonic()
+        try:
+            self.result = self.function()
+        except Exception as err:
+            self.error = err
+        self.t_done = time.monotonic()
+        self.done.set()
+
+    def cancel(self):
+        # Prevent a command which did not start yet from being executed.
+        # Returns False if it is already running or done
+        with self.state_lock:
+            if self.t_start is not None:
+                return False
+            self.cancelled = True
+            return True
+
+    def wait(self, timeout=None):
+        # Wait for the command to finish and return its result. Exceptions
+        # raised by the command are re-raised in the waiting thread
+        if not self.done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def waiting_time(self):
+        if self.t_start is None:
+            return None
+        return self.t_start - self.t_submit
+
+    def latency(self):
+        if self.t_done is None:
+            return None
+        return self.t_done - self.t_submit
+
+
+class CommandQueue():
+    """Commands waiting for the thread owning the board of a module
+
+    Commands are only queued while an owner thread is registered, which
+    executes them between its own read-outs. Completed commands are kept in
+    a history of limited length.
+    """
+
+    def __init__(self, history_length=200):
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.owner = None
+        self.history = deque(maxlen=history_length)
+
+    def set_owner(self, ident):
+        with self.condition:
+            self.owner = ident
+
+    def clear_owner(self):
+        with self.condition:
+            self.owner = None
+
+    def is_owner(self, ident):
+        return self.owner is not None and self.owner == ident
+
+    def submit(self, command):
+        # Queue the command. Returns False if there is no owner to execute it
+        with self.condition:
+            if self.owner is None:
+                return False
+            heapq.heappush(self.queue, (command.priority, next(self.counter), command))
+            self.condition.notify_all()
+        return True
+
+    def pending(self):
+        return len(self.queue)
+
+    def get(self):
+        with self.condition:
+            if not self.queue:
+                return None
+            return heapq.heappop(self.queue)[2]
+
+    def execute_pending(self):
+        # Execute all queued commands in order of their priority
+        command = self.get()
+        while command is not None:
+            command.execute()
+            self.history.append(command)
+            command = self.get()
+
+    def wait(self, timeout, stop_event=None):
+        # Sleep until a command is queued, the stop event is set or timeout
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue or
+                                    (stop_event is not None and stop_event.is_set()),
+                                    timeout)
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
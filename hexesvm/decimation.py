@@ -0,0 +1,91 @@
+"""Multi-resolution min/max history for trend plots"""
+import threading
+import numpy as _np
+from hexesvm.ring_buffer import RingBuffer
+
+
+class MinMaxDecimator():
+    """Keeps a time series at several resolutions
+
+    Level 0 holds the last level_size raw values. Every further level holds
+    the minimum and maximum of buckets of factor entries of the level below,
+    so level k covers factor**k times the duration of level 0 with the same
+    memory. envelope() returns the finest level which fits into the number
+    of points a plot can show, which keeps drawing cheap for any time span.
+    """
+
+    def __init__(self, level_size=4096, factor=8, n_levels=5):
+        self.level_size = level_size
+        self.factor = factor
+        self.lock = threading.Lock()
+        self.levels = [(RingBuffer(level_size), RingBuffer(level_size),
+                        RingBuffer(level_size)) for i in range(n_levels)]
+        # Bucket being filled for every level above 0: [time, min, max, count]
+        self.pending = [None]*n_levels
+        self.last_time = -_np.inf
+
+    def append(self, time_stamp, value):
+        # Values are only taken with increasing time, so repeated calls with
+        # the same read-out are ignored
+        self.append_envelope(time_stamp, value, value)
+
+    def append_envelope(self, time_stamp, low, high):
+        # A value range at one time, e.g. the minimum and maximum of a time
+        # bucket read from the database
+        with self.lock:
+            if not time_stamp > self.last_time:
+                return
+            self.last_time = time_stamp
+            self._push(0, time_stamp, low, high)
+
+    def _push(self, level, time_stamp, low, high):
+        times, lows, highs = self.levels[level]
+        if len(times) >= self.level_size:
+            for buffer in self.levels[level]:
+                buffer.drop(1)
+        times.append(time_stamp)
+        lows.append(low)
+        highs.append(high)
+        if level + 1 >= len(self.levels):
+            return
+        bucket = self.pending[level + 1]
+        if bucket is None:
+            bucket = [time_stamp, low, high, 0]
+            self.pending[level + 1] = bucket
+        else:
+            bucket[1] = _np.fmin(bucket[1], low)
+            bucket[2] = _np.fmax(bucket[2], high)
+        bucket[3] += 1
+        if bucket[3] >= self.factor:
+            self.pending[level + 1] = None
+            self._push(level + 1, bucket[0], bucket[1], bucket[2])
+
+    def envelope(self, t_start, t_end, max_points):
+        # (times, minima, maxima) between t_start and t_end, using the finest
+        # level that covers t_start with at most max_points points
+        with self.lock:
+            first_times = [level[0].first() for level in self.levels if len(level[0])]
+            if not first_times:
+                return (_np.empty(0), _np.empty(0), _np.empty(0))
+            oldest = min(first_times)
+            for idx, level in enumerate(self.levels):
+                if not len(level[0]):
+                    continue
+                view = level[0].view()
+                start = _np.searchsorted(view, t_start, side="left")
+                end = _np.searchsorted(view, t_end, side="right")
+                chosen = (idx, level, start, end)
+                if view[0] <= max(t_start, oldest) and end - start <= max_points:
+                    break
+            idx, (times, lows, highs), start, end = chosen
+            result = [times.view()[start:end], lows.view()[start:end],
+                      highs.view()[start:end]]
+            # Add the partially filled buckets, which are not yet part of
+            # this level. Those of the coarser levels are the older ones
+            tail = [bucket for bucket in reversed(self.pending[1:idx + 1])
+                    if bucket is not None and t_start <= bucket[0] <= t_end]
+            if tail:
+                for column in range(3):
+                    result[column] = _np.concatenate(
+                        (result[column], [bucket[column] for bucket in tail]))
+            return tuple(_np.array(column, dtype=_np.float64) for column in result)
@@ -267,143 +267,171 @@ class Serial:
             ######################
             # NHR virtualization #
             ######################
-            
-            if "(@" in self.sum_receivedData:
-                # Extract the channel number on which to act the command
-                split_command = self.sum_receivedData.split('(@')
-                channel_trail = split_command[1]
-                channel_number = int(channel_trail.split(')')[0])
-
-            
-            if self.sum_receivedData == "*IDN?\r\n":
-                answer = "iseg Spezialelektronik GmbH,NR042060r4050000200,8200002,1.12"
-            if self.sum_receivedData == "*OPC?\r\n":
-                answer = "1"
-
-            if "*RST;*OPC?" in self.sum_receivedData:
-                for idx in range(self.n_channels):
-                    self.d[idx] = 0
-                    self.ch_state[idx] = "H2L"
-                    self.turning_off[idx] = True
-                answer = "1"
-                    
-            if "MEAS:VOLT?" in self.sum_receivedData:
-                answer = ("%.6fE3V" % (self.u[channel_number]/1e3))
-                
-            if "MEAS:CURR?" in self.sum_receivedData:
-                answer = ("%.6fE-6A" % (self.i[channel_number]*1e6))
-
-            if "READ:VOLT:LIM?" in self.sum_receivedData:
-                answer = "100.0%"
-            if "READ:CURR:LIM?" in self.sum_receivedData:
-                answer = "10.0%"            
-
-            if "READ:VOLT?" in self.sum_receivedData:
-                answer = str(self.d[channel_number]/1e3)+"E3V"  
-
-            if ":VOLT " in self.sum_receivedData:
-                if " ON,(" in self.sum_receivedData:
-                    # Turn on HV channel
-                    if not (self.ch_tripped[channel_number] and self.in_emcy_off[channel_number]):
-                        self.hv_on[channel_number] = True
-                        self.chan_g_time[channel_number] = time.time()
-                        if abs(self.d[channel_number]) > abs(self.u[channel_number]):
-                            self.ch_state[channel_number]="L2H"
-                        if abs(self.d[channel_number]) < abs(self.u[channel_number]):
-                            self.ch_state[channel_number]="H2L"
-
-                elif " OFF,(" in self.sum_receivedData:
-                    # Turn off HV channel
-                    self.ch_state[channel_number] = "H2L"
-                    self.turning_off[channel_number] = True
-
-                elif "EMCY OFF,(" in self.sum_receivedData:
-                    self.in_emcy_off[channel_number] = True
-                    self.hv_on[channel_number] = False
-                    self.ch_state[channel_number] = ""
-                    self.u[channel_number] = 0
-                    self.i[channel_number] = 0
-                    # Turn off channel without ramp set emcy state
 
+            # A frame may contain several ';' separated commands, each of them
+            # possibly acting on a list of channels like (@0-3) or (@0,2).
+            # Queries are answered ';' separated, channel lists ',' separated
+            query_answers = []
+            for command in self.sum_receivedData.split('\r\n')[0].split(';'):
+                channel_answers = []
+                for channel_number in self.expand_channel_list(command):
+                    channel_answers.append(str(self.nhr_command(command, channel_number)))
+                if "?" in command:
+                    query_answers.append(",".join(channel_answers))
                 else:
-                    value_trail = self.sum_receivedData.split('VOLT ')[1]
-                    value = float(value_trail.split(',(')[0])
-                    self.d[channel_number] = value
-                    if self.hv_on[channel_number]:
-                        if abs(self.d[channel_number]) > abs(self.u[channel_number]):
-                            self.ch_state[channel_number]="L2H"
-                        if abs(self.d[channel_number]) < abs(self.u[channel_number]):
-                            self.ch_state[channel_number]="H2L"
-                answer = "1"
-           
-         
-            if ":CONF:RAMP:VOLT:UP?" in self.sum_receivedData:
-                answer = str(self.v[channel_number]/1e3)+"E3V/s"   
-
-            if ":CONF:RAMP:VOLT:UP " in self.sum_receivedData: 
-                value_trail = self.sum_receivedData.split(':CONF:RAMP:VOLT:UP ')[1]
-                value = float(value_trail.split(',(')[0])
-                self.v[channel_number] = value
-                answer = "1"
+                    answer = channel_answers[-1]
+            if query_answers:
+                answer = ";".join(query_answers)
 
-            if ":CONF:RAMP:VOLT:DOWN " in self.sum_receivedData:
-                value_trail = self.sum_receivedData.split(':CONF:RAMP:VOLT:DOWN ')[1]
-                value = float(value_trail.split(',(')[0])
-                self.v[channel_number] = value
-                answer = "1"
-                
-            
-            if ":CONF:OUTP:POL " in self.sum_receivedData:
-                value_trail = self.sum_receivedData.split(':CONF:OUTP:POL ')[1]
-                value = value_trail.split(',(')[0]
-                if not self.hv_on[channel_number]:
-                    if abs(self.u[channel_number]) < 0.002 * 6E3:
-                        self.is_positive[channel_number] = value == "p"
-                        answer = "1"                
-                else:
-                    answer = "0"            
-              
-            if ":READ:CHAN:STAT?" in self.sum_receivedData:
-                #calculate the binary state
-                POS = self.is_positive[channel_number]
-                HVON = self.hv_on[channel_number]
-                RAMP = self.ch_ramping[channel_number]
-                RUP = self.ch_ramp_up[channel_number]
-                RDOWN = self.ch_ramp_down[channel_number]
-                bin_state = _np.array((POS,0,0,HVON,RAMP,0,0,0,
-                                      0,0,0,0,0,0,0,0,
-                                      1,0,0,0,0,0,0,0,
-                                      0,0,0,0,0,0,0,0))
-                int_state = 0
-                for idx, byte in enumerate(bin_state):
-                    int_state += byte*(2**idx)
-                answer = int_state
-                                    
-            if ":READ:CHAN:EV:STAT?" in self.sum_receivedData:
-                TRIP = self.ch_tripped[channel_number]
-                EMCY = self.in_emcy_off[channel_number]
-                bin_state = _np.array((0,0,0,0,EMCY,0,0,0,
-                                      0,0,0,0,0,TRIP,0,0,
-                                      1,0,0,0,0,0,0,0,
-                                      0,0,0,0,0,0,0,0))
-                                      
-                int_state = 0
-                for idx, byte in enumerate(bin_state):
-                    int_state += byte*(2**idx)
-                answer = int_state
-
-            if ":EV CLEAR,(@" in self.sum_receivedData:
-                self.ch_tripped[channel_number] = False
-                self.in_emcy_off[channel_number] = False
-                answer = "1"
-
-            # Since for the NHR board, we don't need to wait for each character
-            # To echo, we prepend the echo to the answer of the command
-            answer = answer
-
-
-                                                                                     
         answer = str(answer) +"\r"
         self.sum_receivedData = ""
         time.sleep(0.03)
         return answer.encode()
+
+    def expand_channel_list(self, command):
+        # Return the channel numbers a NHR command acts on (None if no list given)
+        if not "(@" in command:
+            return [None]
+        channel_trail = command.split('(@')[1].split(')')[0]
+        channel_numbers = []
+        for this_part in channel_trail.split(','):
+            if '-' in this_part:
+                first, last = this_part.split('-')
+                channel_numbers.extend(range(int(first), int(last)+1))
+            else:
+                channel_numbers.append(int(this_part))
+        return channel_numbers
+
+    def nhr_command(self, command, channel_number):
+        # Execute a single NHR command for a single channel and return the answer
+        answer = "????"
+
+        if command == "*IDN?":
+            answer = "iseg Spezialelektronik GmbH,NR042060r4050000200,8200002,1.12"
+        if command == "*OPC?":
+            answer = "1"
+
+        if command == "*RST":
+            for idx in range(self.n_channels):
+                self.d[idx] = 0
+                self.ch_state[idx] = "H2L"
+                self.turning_off[idx] = True
+            answer = "1"
+
+        if "MEAS:VOLT?" in command:
+            answer = ("%.6fE3V" % (self.u[channel_number]/1e3))
+
+        if "MEAS:CURR?" in command:
+            answer = ("%.6fE-6A" % (self.i[channel_number]*1e6))
+
+        if "READ:VOLT:LIM?" in command:
+            answer = "100.0%"
+        if "READ:CURR:LIM?" in command:
+            answer = "10.0%"
+
+        if "READ:VOLT?" in command:
+            answer = str(self.d[channel_number]/1e3)+"E3V"
+
+        if ":READ:VOLT:ON?" in command:
+            answer = "1" if self.hv_on[channel_number] else "0"
+
+        if ":CONF:TRIP:ACT?" in command:
+            answer = "2"
+
+        if ":VOLT " in command:
+            if " ON,(" in command:
+                # Turn on HV channel
+                if not (self.ch_tripped[channel_number] and self.in_emcy_off[channel_number]):
+                    self.hv_on[channel_number] = True
+                    self.chan_g_time[channel_number] = time.time()
+                    if abs(self.d[channel_number]) > abs(self.u[channel_number]):
+                        self.ch_state[channel_number]="L2H"
+                    if abs(self.d[channel_number]) < abs(self.u[channel_number]):
+                        self.ch_state[channel_number]="H2L"
+
+            elif " OFF,(" in command:
+                # Turn off HV channel
+                self.ch_state[channel_number] = "H2L"
+                self.turning_off[channel_number] = True
+
+            elif "EMCY OFF,(" in command:
+                self.in_emcy_off[channel_number] = True
+                self.hv_on[channel_number] = False
+                self.ch_state[channel_number] = ""
+                self.u[channel_number] = 0
+                self.i[channel_number] = 0
+                # Turn off channel without ramp set emcy state
+
+            else:
+                value_trail = command.split('VOLT ')[1]
+                value = float(value_trail.split(',(')[0])
+                self.d[channel_number] = value
+                if self.hv_on[channel_number]:
+                    if abs(self.d[channel_number]) > abs(self.u[channel_number]):
+                        self.ch_state[channel_number]="L2H"
+                    if abs(self.d[channel_number]) < abs(self.u[channel_number]):
+                        self.ch_state[channel_number]="H2L"
+            answer = "1"
+
+
+        if ":CONF:RAMP:VOLT:UP?" in command:
+            answer = str(self.v[channel_number]/1e3)+"E3V/s"
+
+        if ":CONF:RAMP:VOLT:UP " in command:
+            value_trail = command.split(':CONF:RAMP:VOLT:UP ')[1]
+            value = float(value_trail.split(',(')[0])
+            self.v[channel_number] = value
+            answer = "1"
+
+        if ":CONF:RAMP:VOLT:DOWN " in command:
+            value_trail = command.split(':CONF:RAMP:VOLT:DOWN ')[1]
+            value = float(value_trail.split(',(')[0])
+            self.v[channel_number] = value
+            answer = "1"
+
+
+        if ":CONF:OUTP:POL " in command:
+            value_trail = command.split(':CONF:OUTP:POL ')[1]
+            value = value_trail.split(',(')[0]
+            if not self.hv_on[channel_number]:
+                if abs(self.u[channel_number]) < 0.002 * 6E3:
+                    self.is_positive[channel_number] = value == "p"
+                    answer = "1"
+            else:
+                answer = "0"
+
+        if ":READ:CHAN:STAT?" in command:
+            #calculate the binary state
+            POS = self.is_positive[channel_number]
+            HVON = self.hv_on[channel_number]
+            RAMP = self.ch_ramping[channel_number]
+            RUP = self.ch_ramp_up[channel_number]
+            RDOWN = self.ch_ramp_down[channel_number]
+            bin_state = _np.array((POS,0,0,HVON,RAMP,0,0,0,
+                                  0,0,0,0,0,0,0,0,
+                                  1,0,0,0,0,0,0,0,
+                                  0,0,0,0,0,0,0,0))
+            int_state = 0
+            for idx, byte in enumerate(bin_state):
+                int_state += byte*(2**idx)
+            answer = int_state
+
+        if ":READ:CHAN:EV:STAT?" in command:
+            TRIP = self.ch_tripped[channel_number]
+            EMCY = self.in_emcy_off[channel_number]
+            bin_state = _np.array((0,0,0,0,EMCY,0,0,0,
+                                  0,0,0,0,0,TRIP,0,0,
+                                  1,0,0,0,0,0,0,0,
+                                  0,0,0,0,0,0,0,0))
+
+            int_state = 0
+            for idx, byte in enumerate(bin_state):
+                int_state += byte*(2**idx)
+            answer = int_state
+
+        if ":EV CLEAR,(@" in command:
+            self.ch_tripped[channel_number] = False
+            self.in_emcy_off[channel_number] = False
+            answer = "1"
+
+        return answer
@@ -8,6 +8,7 @@ import pandas as _pd
 from datetime import datetime as _dt
 import time
 import json
+import threading
 from collections import OrderedDict
 from PyQt5 import QtCore as _qc
 from PyQt5 import QtGui as _qg
@@ -16,7 +17,13 @@ from PyQt5 import QtSvg as _qs
 from functools import partial
 
 from hexesvm import iSeg_tools as _iseg
+from hexesvm.sql_io import SqlContainer as _sql_container
 from hexesvm.sql_io_writer import SqlWriter as _sql_writer
+from hexesvm.sql_io_writer import BufferedSqlWriter as _buffered_sql_writer
+from hexesvm.spool import SqlSpool as _sql_spool
+from hexesvm import sql_engine as _sql_engine
+from hexesvm.archive import ArchiveWriter as _archive_writer
+from hexesvm.trip_capture import TripRecorder as _trip_recorder
 from hexesvm.interlock import Interlock as _interlock
 from hexesvm import threads as _thr 
 from hexesvm import mail as _mail
@@ -54,11 +61,30 @@ class MainWindow(_qw.QMainWindow):
         self.locker.set_interlock_parameter(self.defaults['interlock_parameter'], 
                                             self.defaults['interlock_value'])        
         self.interlock_value = True
+        # The interlock thread kills the HV directly and notifies the GUI afterwards
+        self.kill_lock = threading.Lock()
+        self.locker.set_kill_function(self.kill_all_hv_hardware)
+        self.locker.interlock_triggered.connect(self.interlock_triggered)
         # create database flag
         self.db_insertion_names = []
+        self.last_db_row_time = None
+        # Rows not written since no new read-out arrived
+        self.db_rows_skipped = 0
+        self.db_skipping = False
         self.db_connection = False
         self.db_connection_write = False
-        self.output_buffer_file = open(self.defaults['temp_data_filename'], 'a')
+        self.db_writer = None
+        # Rows that could not be written are spooled and replayed later. The
+        # acquisition time columns are restored as time stamps on replay
+        acquisition_columns = [this_channel[key] for this_module in self.defaults['modules']
+                               for this_channel in this_module['channels']
+                               for key in ('db_u_time_name', 'db_i_time_name')
+                               if this_channel.get(key)]
+        self.spool = _sql_spool(self.defaults['spool_directory'],
+                                self.defaults['db_time_variable'],
+                                time_columns=acquisition_columns)
+        # Table structures are cached on disk to skip the reflection on connect
+        _sql_engine.set_schema_cache_file(self.defaults.get('schema_cache_file'))
         # create heartbeat sender
         self.heartbeat = _hrtbt(self)
         self.heartbeat.connect_socket()
@@ -72,6 +98,12 @@ class MainWindow(_qw.QMainWindow):
         self.timer.timeout.connect(self.updateUI)
         self.timer.start(1000)
 
+        # The reader threads write to the archive, here it is only flushed
+        if self.archive is not None:
+            self.archive_timer = _qc.QTimer(self)
+            self.archive_timer.timeout.connect(self.archive.flush)
+            self.archive_timer.start(int(self.defaults.get('archive_flush_interval', 60)*1000))
+
         self.startUI()
         self.updateUI()
                 
@@ -88,6 +120,9 @@ class MainWindow(_qw.QMainWindow):
         self.update_overview()
         for module_tab in self.mod_tabs.values():
             module_tab.update_module_tab()
+        if self.trip_recorder is not None:
+            for capture in self.trip_recorder.poll():
+                self.send_trip_capture_mail(capture)
         # The current time stamp needs to be updated for the hearbeat detection
         self.time_stamp = time.time()
 
@@ -98,6 +133,10 @@ class MainWindow(_qw.QMainWindow):
         self.modules = OrderedDict()
         self.channels = OrderedDict()
         self.index_list = [] # Helper dict for sorting later on
+        # Local archive of all read-outs, disabled if no directory is set
+        self.archive = None
+        if self.defaults.get('archive_directory'):
+            self.archive = _archive_writer(self.defaults['archive_directory'])
         for idx, this_module in enumerate(self.defaults['modules']):
            if this_module['type'] == "NHQ":
                self.modules.update({this_module['name']: _iseg.nhq_hv_module(this_module['name'], this_module['port'], this_module)})
@@ -106,12 +145,24 @@ class MainWindow(_qw.QMainWindow):
            else:
               print("MODULE OF TYPE:", this_module['type'], " is not supported!!")
               continue
+           self.modules[this_module['name']].set_archive(self.archive)
            this_mod_chan = OrderedDict()
            for jdx, this_channel in enumerate(this_module['channels']):
                this_mod_chan.update({this_channel['name']: self.modules[this_module['name']].add_channel(this_channel['index'], this_channel['name'], this_channel)})
                self.index_list.append([this_channel['img_pos'], this_module['name'], this_channel['name']])
            self.channels.update({this_module['name']: this_mod_chan})
 
+        # Record the history of all channels around trips
+        self.trip_recorder = None
+        if self.defaults.get('trip_capture_directory'):
+            self.trip_recorder = _trip_recorder(self.defaults['trip_capture_directory'],
+                [this_channel for this_module in self.modules.values()
+                 for this_channel in this_module.child_channels],
+                self.defaults.get('trip_capture_pre_seconds', 30),
+                self.defaults.get('trip_capture_post_seconds', 10))
+            for this_module in self.modules.values():
+                this_module.set_trip_recorder(self.trip_recorder)
+
         # Also construct one dict which holds the module/channel combination in the order
         # they should appear on the overview page
         self.channel_order_dict = []
@@ -126,15 +177,43 @@ class MainWindow(_qw.QMainWindow):
     def kill_all_hv(self):
         MainWindow.log.debug("Called KILL ALL HV method!")
         self.statusBar().showMessage("Called KILL ALL HV method!")
-        response = []
+        self.show_hv_kill(self.kill_all_hv_hardware())
+
+    def kill_all_hv_hardware(self):
+        # Kills the HV of all modules. No GUI access here, as this is also
+        # called by the interlock thread. Returns the module responses, the
+        # notifications are sent by show_hv_kill
+        with self.kill_lock:
+            # This will prevent from ramping HV up again
+            self.interlock_value = False
+            # All modules are killed in parallel. kill_hv is queued with emergency
+            # priority and executed by the reader thread before its next read-out
+            response = _iseg.kill_modules([module for module in self.modules.values()
+                                           if module.is_connected],
+                                          self.defaults.get('kill_timeout', 5))
+        return response
+
+    def notify_hv_kill(self):
+        # Send Mail & SMS notification for HV Kill
+        dummy_module = self.modules[list(self.modules.keys())[0]]
+        dummy_channel = dummy_module.child_channels[0]
+        return self.email_sender.send_in_background("HV kill notification",
+            (self.email_sender.send_alarm, dummy_channel, 2, 'kill'),
+            (self.email_sender.send_sms, dummy_channel, 2, 'kill'))
+
+    def show_hv_kill(self, response):
+        self.notify_hv_kill()
         message = "High Voltage KILL was triggered and performed!\nModule responses:"        
+        for response_mod in response:
+            message+="\n"+response_mod["module"]
+            if response_mod["duration"] is not None:
+                message+=" ("+str(round(response_mod["duration"], 2))+" s)"
+            if response_mod["error"] is not None:
+                message+="\tERROR: "+response_mod["error"]
+            for channel_name, outcome in response_mod["channels"]:
+                message+="\n    "+channel_name+"\t"+("OK" if outcome else "FAILED")
         # stop any ramp plan that is executed.
         self.stop_ramp_schedule()
-        # Tell the threads of all modules to terminate
-        for key in self.modules.keys():
-            if not self.modules[key].is_connected:
-                continue
-            self.modules[key].stop_running_thread()      
 
         # Disable the auto-reramp boxes
         for this_module_tab in self.mod_tabs.values():
@@ -142,30 +221,6 @@ class MainWindow(_qw.QMainWindow):
                 this_channel_tab.auto_reramp_box.setCheckState(False)
                 this_channel_tab.auto_reramp_box.setEnabled(False)
 
-        for key in self.modules.keys():
-            if not self.modules[key].is_connected:
-                continue
-            while self.modules[key].board_occupied:
-                MainWindow.log.debug("Waiting for thread "+key+" to stop"+str(self.modules[key].stop_thread))
-                time.sleep(0.2)
-            MainWindow.log.debug("thread "+key+" stopped")                
-            response_mod = self.modules[key].kill_hv()
-            response.append((key, response_mod))
-            message+="\n"+key+"\t"+str(response_mod)
-        # Send Mail & SMS notification for HV Kill
-        dummy_module = self.modules[list(self.modules.keys())[0]]
-        dummy_channel = dummy_module.child_channels[0]
-        self.email_sender.send_alarm(dummy_channel, 2, 'kill')
-        self.email_sender.send_sms(dummy_channel, 2, 'kill')
-
-        # restart the reader threads
-        for key in self.modules.keys():
-            if not self.modules[key].is_connected:
-                continue        
-            self.mod_tabs[key].start_reader_thread()               
-
-        # This will prevent from ramping HV up again
-        self.interlock_value = False
         self.hv_kill_msg = _qw.QMessageBox()
         self.hv_kill_msg.setText(message)
         # window modality = 0 prevents the kill window to block the rest of the UI
@@ -178,17 +233,16 @@ class MainWindow(_qw.QMainWindow):
         if not self.defaults['interlock_enabled']:
             self.locker.lock_state = True
             return
-        # if too slow, the interlocker must be outsourced to an own thread?
+        # The interlock thread kills the HV itself, see interlock_triggered
         if not self.locker.is_running:
             self.locker.start()
-        response = self.locker.lock_state
-        if not response and self.locker.is_connected:
-            if self.interlock_value:
-                self.statusBar().showMessage("Interlock triggered: "+ str(self.locker.parameter_value))
-                MainWindow.log.debug("Interlock triggered: "+ str(self.locker.parameter_value))
-                self.kill_all_hv()
-                self.locker.lock_state = False
-                self.interlock_value = False
+
+    @_qc.pyqtSlot('PyQt_PyObject')
+    def interlock_triggered(self, response):
+        # Called via signal after the interlock thread killed the HV
+        self.statusBar().showMessage("Interlock triggered: "+ str(self.locker.parameter_value))
+        MainWindow.log.debug("Interlock triggered: "+ str(self.locker.parameter_value))
+        self.show_hv_kill(response)
 
     def _init_geom(self):
         """Initializes the main window's geometry"""
@@ -280,7 +334,16 @@ class MainWindow(_qw.QMainWindow):
             new_palette.setColor(_qg.QPalette.WindowText, _qg.QColor(0,204,0))
             self.database_widget.setPalette(new_palette)
             self.database_widget.setText("Database: OK")
-            self.database_widget.setToolTip("HeXeSVM has write access to the dabase")
+            self.database_widget.setToolTip("HeXeSVM has write access to the dabase"
+                "\nRows queued: "+str(self.db_writer.depth())+
+                " (max. "+str(self.db_writer.max_depth)+")"
+                "\nRows dropped: "+str(self.db_writer.dropped)+
+                "\nRows skipped (no new read-out): "+str(self.db_rows_skipped)+
+                "\nLast flush: "+str(round(self.db_writer.last_flush_duration, 3))+" s"
+                "\nRows spooled/replayed: "+str(self.spool.rows_spooled)+
+                "/"+str(self.spool.rows_replayed)+
+                "\nSpool segments refused: "+str(self.spool.segments_quarantined)+
+                "\nConnection pool: "+self.sql_cont.db.pool_status())
         else:
             new_palette = self.database_widget.palette()
             new_palette.setColor(_qg.QPalette.WindowText, _qg.QColor(255,0,0))
@@ -404,17 +467,19 @@ class MainWindow(_qw.QMainWindow):
 
             #this_hv_channel = self.channels[key]
             this_hv_channel = self.channels[this_pair[0]][this_pair[1]]
-            
-            if _np.isnan(this_hv_channel.voltage):
+            # Show one consistent read-out of the channel
+            state = this_hv_channel.snapshot
+
+            if _np.isnan(state.voltage):
                 self.channel_voltage_lcds[i].display("Error")
                 self.channel_voltage_lcds[i].setToolTip("Please connect the HV module!")
                 #self.channel_voltage_lcds[i].setText("Error")                
             else:
-                self.channel_voltage_lcds[i].display(round(this_hv_channel.voltage,0))
+                self.channel_voltage_lcds[i].display(round(state.voltage,0))
                 self.channel_voltage_lcds[i].setToolTip("Actual voltage of the channel")                
                 #self.channel_voltage_lcds[i].setText(str(this_hv_channel.voltage))
 
-            current_value = this_hv_channel.current
+            current_value = state.current
             if this_hv_channel.module.is_high_precission or this_hv_channel.module.type == "NHR":
                 self.current_units[i].setText("nA")
                 current_value = current_value*1E9
@@ -422,7 +487,7 @@ class MainWindow(_qw.QMainWindow):
                 self.current_units[i].setText("µA") 
                 current_value = current_value*1E6
                                
-            if _np.isnan(this_hv_channel.current):
+            if _np.isnan(state.current):
                 self.channel_current_lcds[i].display("Error")
                 self.channel_current_lcds[i].setToolTip("Please connect the HV module!")                
                 #self.channel_current_lcds[i].setText("Error")                
@@ -433,7 +498,7 @@ class MainWindow(_qw.QMainWindow):
                 
             palette = self.channel_voltage_lcds[i].palette()
             palette.setColor(palette.Background, _qg.QColor(10,10,10))
-            if _np.isnan(this_hv_channel.voltage) or this_hv_channel.channel_is_tripped:
+            if _np.isnan(state.voltage) or state.channel_is_tripped:
                 palette.setColor(palette.WindowText, _qg.QColor(255,0,0))
             else:
                 palette.setColor(palette.WindowText, _qg.QColor(0,255,0))
@@ -808,14 +873,29 @@ class MainWindow(_qw.QMainWindow):
                                    "or database/table name "
                                    "invalid!")
             return
+        # The values are written by a background thread, so a slow database
+        # does not block the GUI
+        self.db_writer = _buffered_sql_writer(self.sql_cont,
+            batch_size=self.defaults.get('db_write_batch_size', 50),
+            flush_interval=self.defaults.get('db_write_flush_interval', 5),
+            max_queue_size=self.defaults.get('db_write_queue_size', 10000),
+            spool=self.spool)
+        self.db_writer.start()
         self.db_connection = True
+        self.db_connection_write = True
         self.statusBar().showMessage("sql connection established")
         self.sql_conn_button.setEnabled(False)
         self.form_email_info.setEnabled(False)
         self.form_email_alarm.setEnabled(False)
         self.form_email_sms.setEnabled(False)
         #self.locker.set_sql_container(self.sql_cont_interlock)
-        self.locker.set_psycopg_conn(address, dbname, username, password, tablename_interlock)
+        # The interlock reads with the pooled engine shared with the writer
+        self.locker.set_engine(self.sql_cont.db, tablename_interlock)
+        if self.defaults.get('interlock_notify_channel'):
+            self.locker.set_notify_channel(self.defaults['interlock_notify_channel'],
+                                           self.defaults.get('interlock_notify_timeout', 10))
+            if self.defaults.get('interlock_install_notify_trigger', False):
+                self.locker.install_notify_trigger()
         
         # Also read from the settings file the db_insertion names for the moduels
         for idx, this_module in enumerate(self.defaults['modules']):
@@ -824,40 +904,152 @@ class MainWindow(_qw.QMainWindow):
                 try:
                     this_db_tag_voltage = this_channel['db_u_name']
                     this_db_tag_current = this_channel['db_i_name']
-                    self.db_insertion_names.append([this_module['name'], this_channel['name'], this_db_tag_voltage, this_db_tag_current])
+                    # Optional columns for the acquisition times of the values
+                    this_db_tag_voltage_time = this_channel.get('db_u_time_name')
+                    this_db_tag_current_time = this_channel.get('db_i_time_name')
+                    self.db_insertion_names.append([this_module['name'], this_channel['name'], this_db_tag_voltage, this_db_tag_current,
+                                                    this_db_tag_voltage_time, this_db_tag_current_time])
                 except KeyError:
                     # This channel does not have a db identifier, so we can't add it
                     # to the insertion array
                     print("No Database identifier for:", this_channel)        
-        
-        
-    def insert_values_in_database(self):
+        self.load_trend_history(dialect, address, dbname, tablename, username, password)
 
-        current_datetime = _dt.now()
+    def load_trend_history(self, dialect, address, dbname, tablename, username, password):
+        # Fill the trend plots of channels without read-outs yet with the
+        # values stored in the database, e.g. after a restart. The query runs
+        # in a worker thread, fill_trend_history gets the result
+        if not self.defaults.get('trend_history_hours', 24) or not self.db_insertion_names:
+            return
+        self.trend_history_loader = _thr.LoadTrendHistory(partial(self.read_trend_history,
+            dialect, address, dbname, tablename, username, password))
+        self.trend_history_loader.history_loaded.connect(self.fill_trend_history)
+        self.trend_history_loader.start()
+
+    def read_trend_history(self, dialect, address, dbname, tablename, username, password):
+        # Executed by the worker thread, must not touch the GUI. The database
+        # averages the rows in buckets, so only a few thousand rows are read
+        hours = self.defaults.get('trend_history_hours', 24)
+        bucket_seconds = self.defaults.get('trend_history_bucket', 60)
+        t_first = time.time() - hours*3600
+        t_end = _dt.now()
+        t_start = _dt.fromtimestamp(t_first)
+        try:
+            history = _sql_container(dialect, address, dbname, tablename, username, password)
+            for this_insertion in self.db_insertion_names:
+                history.add_param(this_insertion[2])
+                history.add_param(this_insertion[3])
+            history.update(self.defaults['db_time_variable'], t_start, t_end,
+                           bucket_seconds=bucket_seconds)
+        except (_sql.exc.SQLAlchemyError, KeyError) as err:
+            MainWindow.log.warning("Could not read the trend history: "+str(err))
+            return None
+        if not history.params_min:
+            # Buckets are only read from PostgreSQL
+            return None
+        times = history.times
+        if not getattr(history.table.columns[self.defaults['db_time_variable']].type,
+                       "timezone", False):
+            # Time stamps without time zone are local times, but were
+            # converted to UNIX time as if they were UTC
+            times = _np.array([_dt.utcfromtimestamp(this_time).timestamp()
+                               for this_time in times])
+        # The first bucket may start up to bucket_seconds early
+        return {"times": times, "t_first": t_first - bucket_seconds,
+                "min": history.params_min, "max": history.params_max}
+
+    def fill_trend_history(self, history):
+        # Slot for the result of read_trend_history, None if nothing was read
+        if history is None:
+            return
+        times = history["times"]
+        for this_insertion in self.db_insertion_names:
+            channel = self.channels[this_insertion[0]][this_insertion[1]]
+            for quantity, column in (("voltage", this_insertion[2]), ("current", this_insertion[3])):
+                trend = channel.trends[quantity]
+                if trend.last_time > -_np.inf:
+                    # Already fed by the reader thread
+                    continue
+                # An empty result is a single row of zeros
+                valid = ((times >= history["t_first"]) &
+                         _np.isfinite(history["min"][column]) &
+                         _np.isfinite(history["max"][column]))
+                for this_time, low, high in zip(times[valid],
+                                                history["min"][column][valid],
+                                                history["max"][column][valid]):
+                    trend.append_envelope(this_time, low, high)
+
+
+    def insert_values_in_database(self):
 
         # inizialize empty dict, which will hold the pairs of SQL field names
         # and respective values
         insert_array = {}
-        insert_array["time"] = current_datetime
+        # The row is stamped with the time of its newest measurement
+        newest_acquisition = float('nan')
 
         for this_insertion in self.db_insertion_names:
-            this_voltage = self.channels[this_insertion[0]][this_insertion[1]].voltage
-            this_current = self.channels[this_insertion[0]][this_insertion[1]].current
-            insert_array[this_insertion[2]] = this_voltage
-            insert_array[this_insertion[3]] = this_current
-        
-        try:
-            self.sql_cont.write_values(insert_array)
-            self.db_connection_write = True
+            # voltage and current of the same read-out
+            state = self.channels[this_insertion[0]][this_insertion[1]].snapshot
+            insert_array[this_insertion[2]] = state.voltage
+            insert_array[this_insertion[3]] = state.current
+            if this_insertion[4] is not None:
+                insert_array[this_insertion[4]] = self.acquisition_datetime(state.voltage_t_wall)
+            if this_insertion[5] is not None:
+                insert_array[this_insertion[5]] = self.acquisition_datetime(state.current_t_wall)
+            newest_acquisition = _np.fmax(newest_acquisition,
+                                          _np.fmax(state.voltage_t_wall, state.current_t_wall))
+
+        if _np.isnan(newest_acquisition):
+            # Nothing measured yet (e.g. no module connected)
+            row_time = _dt.now()
+        else:
+            row_time = _dt.fromtimestamp(newest_acquisition)
+        if self.last_db_row_time is not None and row_time <= self.last_db_row_time:
+            # No new measurement since the last row. Reported once per gap,
+            # the count is shown with the database status
+            if not self.db_skipping:
+                message = ("No new read-out since "+str(self.last_db_row_time)+
+                           ", database rows are skipped")
+                MainWindow.log.warning(message)
+                self.statusBar().showMessage(message)
+                self.db_skipping = True
+            self.db_rows_skipped += 1
             return True
-            
-        except _sql.exc.ProgrammingError:
+        if self.db_skipping:
+            MainWindow.log.info("New read-outs, database rows are written again")
+            self.db_skipping = False
+        self.last_db_row_time = row_time
+        insert_array[self.defaults['db_time_variable']] = row_time
         
-            self.output_buffer_file.write(str(insert_array)+"\n")
-            self.db_connection_write = False
+        self.db_connection_write = self.db_writer.healthy and self.sql_cont.db.healthy
+        if not self.db_writer.put(insert_array):
+            # The writer can not keep up, keep the values in the spool
+            self.spool.append([insert_array])
             return False
+        return True
 
 
+    @staticmethod
+    def acquisition_datetime(t_wall):
+        if _np.isnan(t_wall):
+            return None
+        return _dt.fromtimestamp(t_wall)
+
+    def send_trip_capture_mail(self, capture):
+        # Mail the capture to the recipients of single trip alarms
+        print("Trip capture saved: "+capture.filename)
+        hv_channel = capture.channel
+        this_channel_tab = self.mod_tabs[hv_channel.module.name].channel_tabs[hv_channel.name]
+        priority = this_channel_tab.single_button_group.checkedId()
+        if not self.defaults.get('trip_capture_mail', True) or priority == 0:
+            return False
+        # Sending is left to a worker, the GUI thread must not wait for SMTP
+        self.email_sender.send_in_background("trip capture",
+            (self.email_sender.send_trip_capture, hv_channel, priority,
+             capture.filename, capture.metadata))
+        return True
+
     def send_mail(self, mod_key, channel_key, alarm_mode):
 
         this_channel_tab = self.mod_tabs[mod_key].channel_tabs[channel_key]
@@ -904,6 +1096,12 @@ class MainWindow(_qw.QMainWindow):
             for this_module in self.mod_tabs.values():
                 if this_module.module.is_connected:
                     this_module.disconnect_hv_module()
+            # Write the values still waiting in the queue
+            if self.db_writer is not None:
+                self.db_writer.stop()
+                self.db_writer.wait()
+            if self.archive is not None:
+                self.archive.close()
             return(True)
         else:
             return(False)
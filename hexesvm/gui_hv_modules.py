@@ -11,6 +11,8 @@ from PyQt5 import QtXml as _xml
 from functools import partial
 
 from hexesvm import threads as _thr 
+from hexesvm import command_queue as _cmdq
+from hexesvm import gui_trend_plot as _trend
 # we need to import from pyserial for the exception handeling
 from serial.serialutil import SerialException
 
@@ -152,14 +154,37 @@ class gen_module_tab(_qw.QWidget):
     def disconnect_hv_module(self):
         gen_module_tab.log.debug("disconnecting "+ self.module.name)
         self.main_ui.statusBar().showMessage("disconnecting " + self.module.name)
-        self.stop_reader_thread()
-        
+        if self.module.is_connected and not self.stop_reader_thread():
+            # Closing the port under the running reader thread could leave
+            # a command half sent
+            self.err_msg_module = _qw.QMessageBox.warning(self, "HV module",
+                "The reader thread of "+self.module.name+" does not respond, "
+                "the module was not disconnected!")
+            return False
+
         self.module.close_connection()
         self.module_com_line_edit.setDisabled(False)      
         self.module_disconnect_button.setEnabled(False)        
         self.module_connect_button.setEnabled(True)
         return
         
+    def execute_command(self, function, priority, name, failed=None):
+        # Run a command on the module. Returns failed if the module does not
+        # respond in time or the command raised an error, so the GUI never
+        # hangs on a busy board. Callers pass the value they take as failure,
+        # e.g. True for the write methods of the channels
+        try:
+            return self.module.execute(function, priority, name)
+        except _cmdq.CommandTimeout as err:
+            message = str(err)
+        except Exception as err:
+            # Raised by the command in the reader thread and passed on by
+            # HvCommand.wait(). Uncaught in a slot it would end the GUI
+            message = name+" failed on "+self.module.name+": "+str(err)
+        gen_module_tab.log.warning(message)
+        self.main_ui.statusBar().showMessage(message)
+        return failed
+
     def start_reader_thread(self):
         if self.module.is_connected:
             if not self.module.reader_thread:
@@ -175,10 +200,15 @@ class gen_module_tab(_qw.QWidget):
             return False
         self.module.stop_running_thread()      
 
-        while self.module.board_occupied:
-            gen_module_tab.log.debug("Waiting for thread "+self.module.name+" to stop")
-            self.main_ui.statusBar().showMessage("Waiting for thread "+self.module.name+" to stop")
-            time.sleep(0.2)
+        gen_module_tab.log.debug("Waiting for thread "+self.module.name+" to stop")
+        self.main_ui.statusBar().showMessage("Waiting for thread "+self.module.name+" to stop")
+        # The reader thread releases the board right after its current command
+        stop_timeout = self.main_ui.defaults.get('reader_stop_timeout', 15)
+        if not self.module.wait_board_free(stop_timeout):
+            gen_module_tab.log.warning("thread "+self.module.name+" did not stop within "+
+                                       str(stop_timeout)+" s")
+            self.main_ui.statusBar().showMessage("thread "+self.module.name+" did not stop!")
+            return False
         gen_module_tab.log.debug("thread "+self.module.name+" stopped")
         self.main_ui.statusBar().showMessage("thread "+self.module.name+" stopped")
         return True
@@ -358,10 +388,14 @@ class nhr_module_tab(gen_module_tab):
                 "Module is not connected!")
             return False
 
-        self.stop_reader_thread()
-        while self.module.board_occupied:
-            time.sleep(0.2)        
-        self.module.board_occupied = True
+        success = self.execute_command(self.write_safe_values, _cmdq.PRIORITY_SET,
+                                       "set_safe_values", failed=False)
+        if success:
+            self.save_values_success = _qw.QMessageBox.information(self, "Module", 
+                "Successfully set safe values!")
+        return success
+
+    def write_safe_values(self):
         # Due to strange Hardware behaviour, the set_safe_values() won't be used...
         # success = self.module.set_safe_values()
         # Rather set good values for each channel individually
@@ -370,11 +404,6 @@ class nhr_module_tab(gen_module_tab):
             this_answer_1 = this_channel.channel.turn_off_hv()
             this_answer_2 = this_channel.channel.write_set_voltage(0)
             success = success and (not this_answer_1) and (not this_answer_2)
-        self.module.board_occupied = False
-        self.start_reader_thread()
-        if success:
-            self.save_values_success = _qw.QMessageBox.information(self, "Module", 
-                "Successfully set safe values!")
         return success
 
 
@@ -451,9 +480,10 @@ class nhq_module_tab(gen_module_tab):
         self.module_is_high_precission_box.setEnabled(False)
         
     def disconnect_hv_module(self):
-        super().disconnect_hv_module()
-        self.module_is_high_precission_box.setEnabled(True)        
-        return    
+        if super().disconnect_hv_module() is False:
+            return False
+        self.module_is_high_precission_box.setEnabled(True)
+        return
     
     def build_indicator_svg_string(self):
         new_string = ""
@@ -620,6 +650,16 @@ class gen_channel_tab(_qw.QWidget):
         self.frequent_test_button.setToolTip("Send a test email for this event with the current settings")
         self.single_test_button.clicked.connect(partial(self.main_ui.send_mail, self.host_module.name, self.channel.name, "single"))
         self.frequent_test_button.clicked.connect(partial(self.main_ui.send_mail, self.host_module.name, self.channel.name, "frequent"))
+        # Trend plots of voltage and current
+        self.trend_label = _qw.QLabel("Trend")
+        self.trend_span_box = _qw.QComboBox()
+        for span_label, span_seconds in _trend.TREND_SPANS:
+            self.trend_span_box.addItem(span_label, span_seconds)
+        self.trend_span_box.setToolTip("Time span shown in the trend plots")
+        self.trend_span_box.currentIndexChanged.connect(self.set_trend_span)
+        self.voltage_plot = _trend.TrendPlot(self.channel.trends["voltage"], "Voltage", "V")
+        self.current_plot = _trend.TrendPlot(self.channel.trends["current"], "Current", "nA", 1E9,
+                                             color=(255, 160, 0))
         
         #### Define and insert everything into the grid layout
         self.grid = _qw.QGridLayout()
@@ -670,8 +710,13 @@ class gen_channel_tab(_qw.QWidget):
         self.grid.addWidget(self.frequent_alarm_button, 12, 4, _qc.Qt.AlignHCenter)
         self.grid.addWidget(self.frequent_sms_box, 12, 5,  _qc.Qt.AlignLeft)
         self.grid.addWidget(self.single_test_button, 11, 6, _qc.Qt.AlignHCenter)
-        self.grid.addWidget(self.frequent_test_button, 12, 6, _qc.Qt.AlignHCenter) 
-        
+        self.grid.addWidget(self.frequent_test_button, 12, 6, _qc.Qt.AlignHCenter)
+        # Trend Section
+        self.grid.addWidget(self.trend_label, 13, 1)
+        self.grid.addWidget(self.trend_span_box, 13, 2)
+        self.grid.addWidget(self.voltage_plot, 14, 1, 1, 6)
+        self.grid.addWidget(self.current_plot, 15, 1, 1, 6)
+
         self.setLayout(self.grid)
         
         # Add widgets to list, which should be enabled/disabled when schedule is running
@@ -682,9 +727,17 @@ class gen_channel_tab(_qw.QWidget):
         return
 
     def update_channel_section(self):
-    
+
         # Exectue the trip detection and auto-reramp subroutine
         self.trip_detection_autoreramp()
+
+        # Same current units as in the overview
+        if self.host_module.is_high_precission or self.host_module.type == "NHR":
+            self.current_plot.set_unit("nA", 1E9)
+        else:
+            self.current_plot.set_unit("µA", 1E6)
+        self.voltage_plot.update()
+        self.current_plot.update()
     
         none_pix = _qg.QPixmap('hexesvm/icons/hexe_circle_gray_small.svg')
         ok_pix = _qg.QPixmap('hexesvm/icons/hexe_circle_green_small.svg')
@@ -725,11 +778,7 @@ class gen_channel_tab(_qw.QWidget):
         elif self.channel.status == "ON":
             self.hv_ramp_sign.setPixmap(_qg.QPixmap('hexesvm/icons/hexe_bar.svg'))
 
-        self.channel.trip_rate = 0
-        now = time.time()
-        for trip_time in self.channel.trip_time_stamps:
-            if now - trip_time < 24*3600:
-                self.channel.trip_rate += 1
+        self.channel.trip_rate = self.channel.trip_events.count_last(24*3600)
         self.trip_rate_field.setText(str(self.channel.trip_rate))
         self.trip_rate_field.setToolTip("Trips for this channel in the last 24 hours")
 
@@ -744,6 +793,11 @@ class gen_channel_tab(_qw.QWidget):
         self.set_voltage_field.setPlaceholderText(str(self.channel.set_voltage))
         self.ramp_speed_field.setPlaceholderText(str(self.channel.ramp_speed))            
             
+    def set_trend_span(self, index):
+        span = self.trend_span_box.itemData(index)
+        self.voltage_plot.set_span(span)
+        self.current_plot.set_span(span)
+
     def trip_detection_autoreramp(self):
     
         # check for trips, and auto-reramp
@@ -764,12 +818,15 @@ class gen_channel_tab(_qw.QWidget):
                 
                     if not self.channel.trip_detected:
                         # channel is probably tripped
-                        self.channel.trip_detected = True        
-                        self.channel.trip_time_stamps.append(time.time())
-                        if len(self.channel.trip_time_stamps) < 2:
+                        self.channel.trip_detected = True
+                        if self.main_ui.trip_recorder is not None:
+                            self.main_ui.trip_recorder.trigger(self.channel, "software")
+                        self.channel.trip_events.add(time.time())
+                        previous_trip = self.channel.trip_events.last(2)
+                        if previous_trip is None:
                             dt_last_trip = self.channel.min_time_trips*60
                         else:
-                            dt_last_trip = time.time() - self.channel.trip_time_stamps[-2]    
+                            dt_last_trip = time.time() - previous_trip
                         if dt_last_trip < self.channel.min_time_trips*60:
                             # This was a frequent trip
                             self.main_ui.send_mail(self.host_module.name, self.channel.name, "frequent")
@@ -898,10 +955,6 @@ class nhq_channel_tab(gen_channel_tab):
             self.err_msg_set_module_no_conn = _qw.QMessageBox.warning(self, "Module", 
                 "Module is not connected!")
             return False
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)
-        self.host_module.board_occupied = True
         
         ramp_speed_text = self.ramp_speed_field.text().strip()
         set_voltage_text = self.set_voltage_field.text().strip()
@@ -926,8 +979,6 @@ class nhq_channel_tab(gen_channel_tab):
         except (ValueError, TypeError):
             self.err_msg_set_hv_values = _qw.QMessageBox.warning(self, "Values",
             "Invalid input for the Board parameters!")
-            self.host_module.board_occupied = False
-       	    self.mother_widget.start_reader_thread()
             return False
 
         # Check that required set voltage has the correct sign
@@ -935,21 +986,17 @@ class nhq_channel_tab(gen_channel_tab):
             if _np.logical_xor(self.channel.polarity_positive, set_voltage > 0):
                 self.err_msg_set_hv_values = _qw.QMessageBox.warning(self, "Values",
                 "Requested Set Voltage has the wrong sign for the settings of the channel!")
-                self.host_module.board_occupied = False            
-                self.mother_widget.start_reader_thread()
                 return False
             
-        if self.channel.write_ramp_speed(ramp_speed):
+        if self.mother_widget.execute_command(partial(self.channel.write_ramp_speed, ramp_speed),
+                                              _cmdq.PRIORITY_SET, "write_ramp_speed", failed=True):
             self.err_msg_set_hv_values_speed = _qw.QMessageBox.warning(self, "Set Ramp speed", 
             "Invalid response from HV Channel for set Ramp speed. Check values!")
-            self.host_module.board_occupied = False            
-            self.mother_widget.start_reader_thread()
             return False
-        if self.channel.write_set_voltage(set_voltage):
+        if self.mother_widget.execute_command(partial(self.channel.write_set_voltage, set_voltage),
+                                              _cmdq.PRIORITY_SET, "write_set_voltage", failed=True):
             self.err_msg_set_hv_values_voltage = _qw.QMessageBox.warning(self, "Set Voltage",
-                           	"Invalid response from HV Channel for set Voltage. Check values!")
-            self.host_module.board_occupied = False
-            self.mother_widget.start_reader_thread()
+                "Invalid response from HV Channel for set Voltage. Check values!")
             return False
         self.channel.min_time_trips = set_min_trip_time
         self.ramp_speed_field.setText("")
@@ -961,9 +1008,6 @@ class nhq_channel_tab(gen_channel_tab):
         self.ramp_speed_field.setPlaceholderText("")
         self.set_voltage_field.setPlaceholderText("")
         self.time_between_trips_field.setPlaceholderText("")  
-
-        self.host_module.board_occupied = False         
-        self.mother_widget.start_reader_thread()
         return True        
         
     def start_hv_change(self, auto=False):
@@ -989,33 +1033,28 @@ class nhq_channel_tab(gen_channel_tab):
             "\nRamp Speed: "+str(self.channel.ramp_speed)+
             "\nPlease Confirm!", _qw.QMessageBox.Yes, _qw.QMessageBox.No)
             confirmation = (answer == _qw.QMessageBox.Yes)
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)        
-        self.host_module.board_occupied = True
         
         if confirmation:
-            self.channel.read_status()        
-            answer = self.channel.start_voltage_change()
-            if not ("H2L" in answer or "L2H" in answer or "ON" in answer):
+            answer = self.mother_widget.execute_command(self.read_status_and_start_change,
+                                                        _cmdq.PRIORITY_SET, "start_voltage_change",
+                                                        failed="")
+            if not (answer and ("H2L" in answer or "L2H" in answer or "ON" in answer)):
                 self.err_msg_voltage_change = _qw.QMessageBox.warning(self, "Voltage Change",
-               	"Invalid response from HV Channel. Check values!")
-       	        self.host_module.board_occupied = False
-               	self.mother_widget.start_reader_thread()
-               	return False
+                    "Invalid response from HV Channel. Check values!")
+                return False
             else:
                 if not auto:
                     self.err_msg_voltage_change_good = _qw.QMessageBox.information(self, "Voltage Change",
                     "Voltage is changing!")
-       	        self.host_module.board_occupied = False
-                self.mother_widget.start_reader_thread()
                 return True
         else:
             self.err_msg_voltage_change_abort = _qw.QMessageBox.warning(self, "Voltage Change",
-               	"Operation aborted!")
-            self.host_module.board_occupied = False
-            self.mother_widget.start_reader_thread()
+                "Operation aborted!")
             return False
+
+    def read_status_and_start_change(self):
+        self.channel.read_status()        
+        return self.channel.start_voltage_change()
             
     # Methods connected to the ramp schedule
     def schedule_change_settings(self, set_voltage, ramp_spped):
@@ -1108,46 +1147,33 @@ class nhr_channel_tab(gen_channel_tab):
             self.err_msg_set_module_no_conn = _qw.QMessageBox.warning(self, "Module", 
                 "Module is not connected!")
             return False
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)
-        self.host_module.board_occupied = True
         
         print("Swapping polarity")
-        if not self.channel.switch_polarity():
+        if not self.mother_widget.execute_command(self.channel.switch_polarity,
+                                                  _cmdq.PRIORITY_SET, "switch_polarity",
+                                                  failed=False):
             self.err_msg_set_hv_values_speed = _qw.QMessageBox.warning(self, "Switch polarity", 
             "Invalid response from HV Channel for Polarity switch. Check values!")
-            self.host_module.board_occupied = False            
-            self.mother_widget.start_reader_thread()
-
-        self.host_module.board_occupied = False         
-        self.mother_widget.start_reader_thread()        
+            return False
+        return True
         
     def clear_all_channel_events(self):
         if not self.host_module.is_connected:
             self.err_msg_set_module_no_conn = _qw.QMessageBox.warning(self, "Module", 
                 "Module is not connected!")
             return False
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)
-        self.host_module.board_occupied = True
 
-        self.channel.clear_all_channel_events()
-
-        self.host_module.board_occupied = False
-        self.mother_widget.start_reader_thread()
-        return True
+        # The answer of the module is not checked, only whether the command ran
+        cleared = self.mother_widget.execute_command(self.channel.clear_all_channel_events,
+                                                     _cmdq.PRIORITY_SET,
+                                                     "clear_all_channel_events")
+        return cleared is not None
 
     def apply_hv_settings(self, auto=False):
         if not self.host_module.is_connected:
             self.err_msg_set_module_no_conn = _qw.QMessageBox.warning(self, "Module", 
                 "Module is not connected!")
             return False
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)
-        self.host_module.board_occupied = True
         
         ramp_speed_text = self.ramp_speed_field.text().strip()
         set_voltage_text = self.set_voltage_field.text().strip()
@@ -1172,8 +1198,6 @@ class nhr_channel_tab(gen_channel_tab):
         except (ValueError, TypeError):
             self.err_msg_set_hv_values = _qw.QMessageBox.warning(self, "Values",
             "Invalid input for the Board parameters!")
-            self.host_module.board_occupied = False
-       	    self.mother_widget.start_reader_thread()
             return False
 
         # Check that required set voltage has the correct sign
@@ -1181,8 +1205,6 @@ class nhr_channel_tab(gen_channel_tab):
             if _np.logical_xor(self.channel.polarity_positive, set_voltage > 0):
                 self.err_msg_set_hv_values = _qw.QMessageBox.warning(self, "Values",
                 "Requested Set Voltage has the wrong sign for the settings of the channel!")
-                self.host_module.board_occupied = False            
-                self.mother_widget.start_reader_thread()
                 return False
             
         confirmation = auto
@@ -1196,26 +1218,27 @@ class nhr_channel_tab(gen_channel_tab):
         elif self.channel.hv_switch_off:
             confirmation = True
               
-        self.host_module.board_occupied = True
-        
         if confirmation:            
 
-            if self.channel.write_ramp_speed(ramp_speed):
+            if self.mother_widget.execute_command(partial(self.channel.write_ramp_speed, ramp_speed),
+                                                  _cmdq.PRIORITY_SET, "write_ramp_speed", failed=True):
                 self.err_msg_set_hv_values_speed = _qw.QMessageBox.warning(self, "Set Ramp speed", 
                 "Invalid response from HV Channel for set Ramp speed. Check values!")
-                self.host_module.board_occupied = False            
-                self.mother_widget.start_reader_thread()
                 return False
             # In case set voltage of 0 is desired, also turn the HV off, to prevent
             # a strange bug in the Hardware...
             if set_voltage == 0:
-                self.channel.turn_off_hv()
+                if self.mother_widget.execute_command(self.channel.turn_off_hv,
+                                                      _cmdq.PRIORITY_SET, "turn_off_hv",
+                                                      failed=True):
+                    self.err_msg_set_hv_values_voltage = _qw.QMessageBox.warning(self, "Turn off",
+                    "Invalid response from HV Channel for turning off the HV. Check values!")
+                    return False
                 
-            if self.channel.write_set_voltage(set_voltage):
+            if self.mother_widget.execute_command(partial(self.channel.write_set_voltage, set_voltage),
+                                                  _cmdq.PRIORITY_SET, "write_set_voltage", failed=True):
                 self.err_msg_set_hv_values_voltage = _qw.QMessageBox.warning(self, "Set Voltage",
-                               	"Invalid response from HV Channel for set Voltage. Check values!")
-                self.host_module.board_occupied = False
-                self.mother_widget.start_reader_thread()
+                "Invalid response from HV Channel for set Voltage. Check values!")
                 return False
             self.channel.min_time_trips = set_min_trip_time
             self.ramp_speed_field.setText("")
@@ -1227,14 +1250,10 @@ class nhr_channel_tab(gen_channel_tab):
             self.ramp_speed_field.setPlaceholderText("")
             self.set_voltage_field.setPlaceholderText("")
             self.time_between_trips_field.setPlaceholderText("")  
-            self.host_module.board_occupied = False         
-            self.mother_widget.start_reader_thread()
         
         else:
             self.err_msg_voltage_change_abort = _qw.QMessageBox.warning(self, "Voltage Change",
-               	"Operation aborted!")
-            self.host_module.board_occupied = False
-            self.mother_widget.start_reader_thread()
+                "Operation aborted!")
             return False        
 
         return True        
@@ -1268,37 +1287,36 @@ class nhr_channel_tab(gen_channel_tab):
             "\nRamp Speed: "+str(self.channel.ramp_speed)+
             "\nPlease Confirm!", _qw.QMessageBox.Yes, _qw.QMessageBox.No)
             confirmation = (answer == _qw.QMessageBox.Yes)
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)        
-        self.host_module.board_occupied = True
         
         if auto and not self.channel.channel_in_error:
             # Clear channel events (from possible previous trip) but only if EMCY OFF is not set
-            self.channel.clear_all_channel_events()
+            if self.mother_widget.execute_command(self.channel.clear_all_channel_events,
+                                                  _cmdq.PRIORITY_SET,
+                                                  "clear_all_channel_events") is None:
+                return False
             
         if confirmation:
-            self.channel.read_device_status()        
-            answer = self.channel.turn_on_hv()
+            if self.mother_widget.execute_command(self.read_status_and_turn_on,
+                                                  _cmdq.PRIORITY_SET, "turn_on_hv", failed=True):
+                self.err_msg_voltage_change = _qw.QMessageBox.warning(self, "Voltage Change",
+                "Invalid response from HV Channel. Check values!")
+                return False
+            # The reader thread keeps polling while the channel reacts
             time.sleep(0.75)
-            self.channel.read_device_status()
-            if self.channel.hv_switch_off:
+            if (not self.mother_widget.execute_command(self.channel.read_device_status,
+                                                       _cmdq.PRIORITY_SET, "read_device_status",
+                                                       failed=False) or
+                    self.channel.hv_switch_off):
                 self.err_msg_voltage_change = _qw.QMessageBox.warning(self, "Voltage Change",
-               	"Invalid response from HV Channel. Check values!")
-       	        self.host_module.board_occupied = False
-               	self.mother_widget.start_reader_thread()
-               	return False
+                "Invalid response from HV Channel. Check values!")
+                return False
             else:
                 if not auto:
                     self.err_msg_voltage_change_good = _qw.QMessageBox.information(self, "Voltage Change", "Voltage is changing!")
-       	        self.host_module.board_occupied = False
-                self.mother_widget.start_reader_thread()
                 return True
         else:
             self.err_msg_voltage_change_abort = _qw.QMessageBox.warning(self, "Voltage Change",
-               	"Operation aborted!")
-            self.host_module.board_occupied = False
-            self.mother_widget.start_reader_thread()
+                "Operation aborted!")
             return False
         
     def turn_hv_off(self, auto=False):
@@ -1309,26 +1327,30 @@ class nhr_channel_tab(gen_channel_tab):
         # If HV switch is off already, skip the rest
         if self.channel.hv_switch_off:
             return True
-        self.mother_widget.stop_reader_thread()
-        while self.host_module.board_occupied:
-            time.sleep(0.2)        
-        self.host_module.board_occupied = True
         
-        self.channel.read_device_status()        
-        answer = self.channel.turn_off_hv()
+        if self.mother_widget.execute_command(self.read_status_and_turn_off,
+                                              _cmdq.PRIORITY_SET, "turn_off_hv", failed=True):
+            self.err_msg_voltage_change = _qw.QMessageBox.warning(self, "Voltage Change", "Invalid response from HV Channel. Check values!")
+            return False
         time.sleep(0.75)
-        self.channel.read_device_status()
-        if not (self.channel.channel_is_ramping or self.channel.hv_switch_off):
+        if (not self.mother_widget.execute_command(self.channel.read_device_status,
+                                                   _cmdq.PRIORITY_SET, "read_device_status",
+                                                   failed=False) or
+                not (self.channel.channel_is_ramping or self.channel.hv_switch_off)):
             self.err_msg_voltage_change = _qw.QMessageBox.warning(self, "Voltage Change", "Invalid response from HV Channel. Check values!")
-            self.host_module.board_occupied = False
-            self.mother_widget.start_reader_thread()
             return False
         if not auto:
             self.err_msg_voltage_change_good = _qw.QMessageBox.information(self, "Voltage Change",
                     "High Voltage is turning off!")            
-        self.host_module.board_occupied = False
-        self.mother_widget.start_reader_thread()
         return True
+
+    def read_status_and_turn_on(self):
+        self.channel.read_device_status()
+        return self.channel.turn_on_hv()
+
+    def read_status_and_turn_off(self):
+        self.channel.read_device_status()
+        return self.channel.turn_off_hv()
         
     # Methods connected to the ramp schedule
     def schedule_change_settings(self, set_voltage, ramp_spped):
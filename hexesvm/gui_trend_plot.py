@@ -0,0 +1,81 @@
+import time
+import numpy as _np
+
+from PyQt5 import QtCore as _qc
+from PyQt5 import QtGui as _qg
+from PyQt5 import QtWidgets as _qw
+
+# Time spans selectable for the trend plots (label, seconds)
+TREND_SPANS = [("10 min", 600), ("1 h", 3600), ("6 h", 6*3600), ("24 h", 24*3600)]
+
+
+class TrendPlot(_qw.QWidget):
+    # Plot of the min/max envelope of a MinMaxDecimator over the last span
+    # seconds. Only about one point per pixel column is drawn
+
+    def __init__(self, decimator, title, unit, scale=1., color=(0, 120, 255), parent=None):
+        super().__init__(parent)
+        self.decimator = decimator
+        self.title = title
+        self.unit = unit
+        self.scale = scale
+        self.color = _qg.QColor(*color)
+        self.span = TREND_SPANS[0][1]
+        self.setMinimumHeight(110)
+        self.setSizePolicy(_qw.QSizePolicy.Expanding, _qw.QSizePolicy.Expanding)
+
+    def set_span(self, seconds):
+        self.span = seconds
+        self.update()
+
+    def set_unit(self, unit, scale):
+        self.unit = unit
+        self.scale = scale
+
+    def paintEvent(self, event):
+        painter = _qg.QPainter(self)
+        painter.fillRect(self.rect(), _qg.QColor(10, 10, 10))
+        metrics = painter.fontMetrics()
+        margin_left = metrics.width("-0000.00") + 6
+        margin = metrics.height()
+        plot = _qc.QRectF(margin_left, margin, self.width() - margin_left - 5,
+                          self.height() - 2*margin - 2)
+        painter.setPen(_qg.QColor(90, 90, 90))
+        painter.drawRect(plot)
+        painter.setPen(_qg.QColor(200, 200, 200))
+        painter.drawText(int(margin_left), metrics.ascent(), self.title+" ["+self.unit+"]")
+
+        t_end = time.time()
+        t_start = t_end - self.span
+        times, lows, highs = self.decimator.envelope(t_start, t_end, max(int(plot.width()), 1))
+        valid = _np.isfinite(lows) & _np.isfinite(highs)
+        times = times[valid]
+        lows = lows[valid]*self.scale
+        highs = highs[valid]*self.scale
+        painter.drawText(int(plot.left()), self.height() - 2,
+                         time.strftime("%H:%M:%S", time.localtime(t_start)))
+        end_label = time.strftime("%H:%M:%S", time.localtime(t_end))
+        painter.drawText(int(plot.right()) - metrics.width(end_label), self.height() - 2, end_label)
+        if not len(times):
+            painter.drawText(plot, _qc.Qt.AlignCenter, "No data")
+            return
+
+        y_min = lows.min()
+        y_max = highs.max()
+        if y_max - y_min < 1e-12:
+            y_min -= 1.
+            y_max += 1.
+        painter.drawText(2, int(plot.top()) + metrics.ascent(), "{:.2f}".format(y_max))
+        painter.drawText(2, int(plot.bottom()), "{:.2f}".format(y_min))
+
+        x = plot.left() + (times - t_start)/self.span*plot.width()
+        y_low = plot.bottom() - (lows - y_min)/(y_max - y_min)*plot.height()
+        y_high = plot.bottom() - (highs - y_min)/(y_max - y_min)*plot.height()
+        # Envelope between the maxima (forward) and the minima (backward)
+        polygon = _qg.QPolygonF([_qc.QPointF(this_x, this_y) for this_x, this_y
+                                 in zip(_np.concatenate((x, x[::-1])),
+                                        _np.concatenate((y_high, y_low[::-1])))])
+        painter.setRenderHint(_qg.QPainter.Antialiasing)
+        painter.setPen(self.color)
+        painter.setBrush(self.color)
+        painter.drawPolygon(polygon)
@@ -0,0 +1,113 @@
+"""Recent read-out history of an HV channel, kept in memory"""
+import threading
+import time
+import numpy as _np
+from hexesvm.ring_buffer import RingBuffer
+
+
+# Numerical columns of the history, taken from the channel snapshots
+VALUE_COLUMNS = ("t_mono", "t_wall", "voltage", "current", "set_voltage", "ramp_speed")
+
+# Boolean state fields stored as bits of the "status" column
+STATUS_BITS = {"channel_in_error": 1 << 0,
+               "channel_is_tripped": 1 << 1,
+               "hardware_inhibit": 1 << 2,
+               "kill_enable_switch": 1 << 3,
+               "hv_switch_off": 1 << 4,
+               "polarity_positive": 1 << 5,
+               "channel_is_ramping": 1 << 6,
+               "arc_detected": 1 << 7}
+
+COLUMNS = VALUE_COLUMNS + ("status",)
+
+DEFAULT_HISTORY_SIZE = 36000
+
+
+def encode_status(snapshot):
+    # The state fields of a snapshot packed into one integer
+    status = 0
+    for name, bit in STATUS_BITS.items():
+        if getattr(snapshot, name):
+            status |= bit
+    return status
+
+
+def status_flag(status, name):
+    # Boolean array of one state field from the status column
+    return (_np.asarray(status) & STATUS_BITS[name]) != 0
+
+
+class ChannelHistory():
+    """Fixed size history of channel snapshots
+
+    The last capacity snapshots are kept in one ring buffer per column. Once
+    the history is full, every new snapshot replaces the oldest one. All
+    queries return copies, so their results stay valid while the reader
+    thread keeps appending. Time ranges are found by bisection on the time
+    columns, which always increase.
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_SIZE):
+        self.capacity = max(int(capacity), 1)
+        self.lock = threading.Lock()
+        self.buffers = {column: RingBuffer(self.capacity) for column in VALUE_COLUMNS}
+        self.buffers["status"] = RingBuffer(self.capacity, _np.int64)
+
+    def __len__(self):
+        return len(self.buffers["t_mono"])
+
+    def append(self, snapshot):
+        status = encode_status(snapshot)
+        with self.lock:
+            full = len(self) >= self.capacity
+            for column, buffer in self.buffers.items():
+                if full:
+                    buffer.drop(1)
+                if column == "status":
+                    buffer.append(status)
+                else:
+                    buffer.append(getattr(snapshot, column))
+
+    def clear(self):
+        with self.lock:
+            for buffer in self.buffers.values():
+                buffer.clear()
+
+    def last(self, n_values=1):
+        # The n_values latest entries as dict of arrays, oldest first
+        with self.lock:
+            start = max(len(self) - int(n_values), 0)
+            return self._slice(start, len(self))
+
+    def between(self, t_start, t_end, clock="t_wall"):
+        # All entries with t_start <= time <= t_end. clock selects the time
+        # column, "t_wall" (time.time) or "t_mono" (time.monotonic)
+        with self.lock:
+            times = self.buffers[clock].view()
+            start = _np.searchsorted(times, t_start, side="left")
+            end = _np.searchsorted(times, t_end, side="right")
+            return self._slice(start, end)
+
+    def window(self, seconds, now=None):
+        # The entries of the last seconds before now (time.monotonic). Pass
+        # the time of the last entry to get the last seconds of data instead,
+        # e.g. of a channel which is no longer read out
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            times = self.buffers["t_mono"].view()
+            start = _np.searchsorted(times, now - seconds, side="left")
+            return self._slice(start, len(times))
+
+    def stats(self, column, seconds, now=None):
+        # (min, max, mean) of column over the last seconds, ignoring nan.
+        # All nan if there are no valid values in the window
+        values = self.window(seconds, now)[column]
+        values = values[~_np.isnan(values)]
+        if not len(values):
+            return (_np.nan, _np.nan, _np.nan)
+        return (values.min(), values.max(), values.mean())
+
+    def _slice(self, start, end):
+        return {column: buffer.view()[start:end].copy()
+                for column, buffer in self.buffers.items()}
@@ -1,4 +1,14 @@
 from hexesvm import threads as _thr
+from hexesvm import poll_scheduler as _sched
+from hexesvm import command_queue as _cmdq
+from hexesvm import iseg_replies as _rep
+from hexesvm import channel_state as _state
+from hexesvm import history as _hist
+from hexesvm import decimation as _dec
+from hexesvm import archive as _archive
+from hexesvm import trip_log as _trip_log
+import os
+import threading
 import time
 import json
 
@@ -19,7 +29,11 @@ class gen_hv_module:
         self.defaults = defaults
         self.sleep_time = 1
         self.response_timeout = 5
+        # Longest time (s) a caller of execute waits for the board
+        self.command_timeout = self.defaults.get('command_timeout', defs.get('command_timeout', 15))
         self.is_high_precission = self.defaults['is_high_precission']
+        # Send commands as one buffer instead of character by character
+        self.bulk_transmit = self.defaults.get('bulk_transmit', False)
         self.type = None
         self.polarity_switchable = None
         self.is_connected = False
@@ -29,17 +43,94 @@ class gen_hv_module:
         self.model_no = ""
         self.firmware_vers = ""
         self.stop_thread = False
+        # Set together with stop_thread, so waiting threads wake up immediately
+        self.stop_event = threading.Event()
         self.board_occupied = False
+        # Guards board_occupied. Waiters are notified when the board is released
+        self.board_condition = threading.Condition()
+        # Commands of other threads, executed by the thread owning the board
+        self.command_queue = _cmdq.CommandQueue()
         self.reader_thread = None
+        # Local archive of all read-outs (archive.ArchiveWriter), optional
+        self.archive = None
+        # Captures the history around trips (trip_capture.TripRecorder), optional
+        self.trip_recorder = None
        
     def set_comport(self, port):
         self.port = port
         
     def set_reader_thread(self, thread):
         self.reader_thread = thread
+
+    def set_archive(self, archive):
+        self.archive = archive
+
+    def set_trip_recorder(self, trip_recorder):
+        self.trip_recorder = trip_recorder
         
     def stop_running_thread(self):
         self.stop_thread = True       
+        self.stop_event.set()
+        self.command_queue.wake()
+
+    def reset_stop_request(self):
+        self.stop_thread = False
+        self.stop_event.clear()
+
+    def acquire_board(self, timeout=None):
+        # Wait until the board is free and occupy it. False if timed out
+        with self.board_condition:
+            if not self.board_condition.wait_for(lambda: not self.board_occupied, timeout):
+                return False
+            self.board_occupied = True
+        return True
+
+    def release_board(self):
+        with self.board_condition:
+            self.board_occupied = False
+            self.board_condition.notify_all()
+
+    def wait_board_free(self, timeout=None):
+        with self.board_condition:
+            return self.board_condition.wait_for(lambda: not self.board_occupied, timeout)
+
+    def execute(self, function, priority=_cmdq.PRIORITY_SET, name="", timeout=None):
+        # Run function with exclusive access to the board and return its result.
+        # If a reader thread owns the board, the function is queued and executed
+        # by it, ahead of its routine reads. Otherwise the board is occupied here.
+        # Raises command_queue.CommandTimeout if the board is not available
+        # within timeout seconds (default command_timeout)
+        if timeout is None:
+            timeout = self.command_timeout
+        command = _cmdq.HvCommand(function, priority, name)
+        if self.command_queue.is_owner(threading.get_ident()):
+            command.execute()
+            self.command_queue.history.append(command)
+            self.publish_snapshots()
+            return command.wait()
+        if self.command_queue.submit(command):
+            if not command.done.wait(timeout):
+                if command.cancel():
+                    raise _cmdq.CommandTimeout(name+" not executed by "+self.name+
+                                               " within "+str(timeout)+" s, cancelled")
+                raise _cmdq.CommandTimeout(name+" on "+self.name+" still running after "+
+                                           str(timeout)+" s")
+            return command.wait()
+        if not self.acquire_board(timeout):
+            raise _cmdq.CommandTimeout("Board of "+self.name+" not free within "+
+                                       str(timeout)+" s, "+name+" not executed")
+        try:
+            command.execute()
+            self.command_queue.history.append(command)
+            self.publish_snapshots()
+        finally:
+            self.release_board()
+        return command.wait()
+
+    def publish_snapshots(self):
+        # Make the values read by a command visible to the GUI
+        for channel in self.child_channels:
+            channel.publish_snapshot()
 
     def establish_connection(self):
         self.serial_conn = serial.Serial(port=self.port, timeout=self.response_timeout)
@@ -49,6 +140,8 @@ class gen_hv_module:
         print(self.serial_conn)
 
     def send_long_command(self, command):
+        if self.bulk_transmit:
+            return self.send_bulk_command(command)
         command += "\r\n"
         for i in range(len(command)):
             self.serial_conn.write(command[i].encode())
@@ -65,7 +158,42 @@ class gen_hv_module:
         result_1 = self.serial_conn.readline()
         return result_1.decode().split('\r')[0]        
 
+    def send_bulk_command(self, command):
+        # Write the command body in one go and verify its echo as a batch,
+        # instead of waiting for the echo of every single character. The
+        # module only acts on a command once "\r\n" is received, so the
+        # terminator is sent only after the echo of the body was correct
+        for part in (command, "\r\n"):
+            self.serial_conn.write(part.encode())
+            answer_echo = self.serial_conn.read(len(part)).decode()
+            if answer_echo != part:
+                # Show what was expected and what came back, the command for context
+                print(repr(command) + ": expected echo " + repr(part) +
+                      ", received " + repr(answer_echo))
+                print("inconsistent response from module!")
+                # To prevent faiulure of the HV, diconnect it immediatly, when this happens!
+                self.close_connection()
+                return None
+        result_1 = self.serial_conn.readline()
+        return result_1.decode().split('\r')[0]
+
+    def poll_tasks(self, tasks):
+        # Execute the due read-out tasks of the reader thread one by one.
+        # Returns the tasks which have been executed
+        done = []
+        for task in tasks:
+            if self.stop_thread:
+                break
+            # Queued commands (e.g. a kill) go ahead of the routine reads
+            self.command_queue.execute_pending()
+            task.run()
+            done.append(task)
+        return done
+
     def kill_hv(self):
+        return self.execute(self.kill_channels, _cmdq.PRIORITY_EMERGENCY, "kill_hv")
+
+    def kill_channels(self):
         result = []
         for channel in self.child_channels:
             outcome = channel.kill_hv()
@@ -79,11 +207,46 @@ class gen_hv_module:
         self.i_max = ""
         self.model_no = ""
         self.firmware_vers = ""
-        self.stop_thread = False
-        self.board_occupied = False
+        self.reset_stop_request()
+        self.release_board()
         self.reader_thread = None
 
 
+def kill_modules(modules, timeout=5):
+    """Kill the HV of all modules at the same time, one worker per module
+
+    Waits at most timeout seconds for all modules. Returns a list with one
+    dict per module, holding the outcome of each channel, the duration of
+    the kill and an error message (e.g. timeout), if any.
+    """
+    results = []
+    workers = []
+    for module in modules:
+        result = {"module": module.name, "channels": [], "duration": None, "error": None}
+        worker = threading.Thread(target=_kill_module, args=(module, result),
+                                  name="kill_"+module.name, daemon=True)
+        worker.start()
+        results.append(result)
+        workers.append(worker)
+    deadline = time.monotonic() + timeout
+    for worker, result in zip(workers, results):
+        worker.join(max(deadline - time.monotonic(), 0.))
+        if worker.is_alive():
+            result["error"] = "no response within "+str(timeout)+" s"
+    return results
+
+
+def _kill_module(module, result):
+    t_start = time.monotonic()
+    try:
+        outcomes = module.kill_hv()
+        result["channels"] = [(channel.name, outcome) for channel, outcome
+                              in zip(module.child_channels, outcomes)]
+    except Exception as err:
+        result["error"] = str(err)
+    result["duration"] = time.monotonic() - t_start
+
+
 class gen_hv_channel:
 
     def __init__(self, name, host_module, this_hv_channel, defaults):
@@ -94,6 +257,11 @@ class gen_hv_channel:
         
         self.voltage = float('nan')
         self.current = float('nan')
+        # Acquisition times of voltage and current, time.monotonic() and time.time()
+        self.voltage_t_mono = float('nan')
+        self.voltage_t_wall = float('nan')
+        self.current_t_mono = float('nan')
+        self.current_t_wall = float('nan')
         self.resistance = self.defaults["resistance"]
         self.resistance_tolerance = self.defaults["resistance_tolerance"]
         self.set_voltage = float('nan')
@@ -121,8 +289,86 @@ class gen_hv_channel:
         # Voltage below which channel is considered tripped
         self.trip_voltage = self.defaults["trip_detect_voltage"]
         self.trip_rate = 0
-        self.trip_time_stamps = []
+        # Trip times, kept on disk if a trip log directory is set
+        trip_log_filename = None
+        if defs.get('trip_log_directory'):
+            trip_log_filename = os.path.join(defs['trip_log_directory'],
+                _archive.channel_key(self.module.name, self.name)+".jsonl")
+        self.trip_events = _trip_log.TripEventStore(trip_log_filename,
+            defs.get('trip_log_max_age_days', 7)*24*3600)
         self.trip_detected = False
+        self.arc_detected = False
+
+        # Read-out intervals (seconds) of the reader thread per quantity
+        self.poll_intervals = dict(_sched.DEFAULT_POLL_INTERVALS)
+        self.poll_intervals.update(defs.get('poll_intervals', {}))
+        self.poll_intervals.update(self.defaults.get('poll_intervals', {}))
+        # Faster intervals used while the channel is ramping or sparking
+        self.fast_poll_intervals = dict(_sched.DEFAULT_FAST_POLL_INTERVALS)
+        self.fast_poll_intervals.update(defs.get('fast_poll_intervals', {}))
+        self.fast_poll_intervals.update(self.defaults.get('fast_poll_intervals', {}))
+        self.fast_poll_hold = self.defaults.get('fast_poll_hold',
+                                                defs.get('fast_poll_hold', _sched.DEFAULT_FAST_POLL_HOLD))
+        self.fast_polling = False
+
+        # The attributes above are written by the thread accessing the
+        # hardware. Other threads read the latest published snapshot, which
+        # is replaced as a whole and thus always consistent
+        self.snapshot_lock = threading.Lock()
+        self.snapshot = _state.take_snapshot(self, 0)
+        self.archive_key = _archive.channel_key(self.module.name, self.name)
+        # Snapshots of the recent read-outs, filled by the reader thread
+        self.history = _hist.ChannelHistory(defs.get('history_size', _hist.DEFAULT_HISTORY_SIZE))
+        # Long term voltage and current trends at several resolutions
+        self.trends = {"voltage": _dec.MinMaxDecimator(), "current": _dec.MinMaxDecimator()}
+        # Acquisition time (time.monotonic) of the latest recorded readings
+        self.recorded_t_mono = {"voltage": float('-inf'), "current": float('-inf')}
+
+    def record_history(self, snapshot):
+        # Called by the reader thread for every published snapshot. A record
+        # is only added for a new voltage or current reading and is stamped
+        # with its acquisition time, so polls of other quantities add none
+        new_readings = [quantity for quantity in ("voltage", "current")
+                        if getattr(snapshot, quantity+"_t_mono") > self.recorded_t_mono[quantity]]
+        for quantity in new_readings:
+            self.recorded_t_mono[quantity] = getattr(snapshot, quantity+"_t_mono")
+            self.trends[quantity].append(getattr(snapshot, quantity+"_t_wall"),
+                                         getattr(snapshot, quantity))
+        if new_readings:
+            newest = max(new_readings, key=lambda quantity: self.recorded_t_mono[quantity])
+            record = snapshot._replace(t_mono=getattr(snapshot, newest+"_t_mono"),
+                                       t_wall=getattr(snapshot, newest+"_t_wall"))
+            self.history.append(record)
+            if self.module.archive is not None:
+                self.module.archive.append(self.archive_key, record)
+        if self.module.trip_recorder is not None:
+            self.module.trip_recorder.check_hardware_trip(self, snapshot)
+
+    def stamp_acquisition(self, quantity, acquired=None):
+        # Remember when the answer for "voltage" or "current" was received.
+        # acquired is a (time.monotonic(), time.time()) pair, default is now
+        if acquired is None:
+            acquired = (time.monotonic(), time.time())
+        setattr(self, quantity+"_t_mono", acquired[0])
+        setattr(self, quantity+"_t_wall", acquired[1])
+
+    def publish_snapshot(self):
+        with self.snapshot_lock:
+            self.snapshot = _state.take_snapshot(self, self.snapshot.seq + 1)
+        return self.snapshot
+
+    def needs_fast_polling(self):
+        # Channel is ramping, shows a suspicious resistance or a trip capture
+        # is recording its post-trigger samples
+        ramping = self.channel_is_ramping or self.status in ("L2H", "H2L")
+        recording = (self.module.trip_recorder is not None and
+                     self.module.trip_recorder.is_recording(self))
+        return bool(ramping or self.arc_detected or recording)
+
+    def poll(self, quantity):
+        # Read one quantity (see poll_methods of the derived classes)
+        for method_name in self.poll_methods[quantity]:
+            getattr(self, method_name)()
 
     # Function that implements software sided detection of HV sparking
     def check_software_trip(self):
@@ -174,6 +420,105 @@ class nhr_hv_module(gen_hv_module):
           return result_1.decode().split('\r')[0]        
 
 
+     def channel_list(self, channels=None):
+          # Build a SCPI channel list like (@0-3) or (@0,2) for the given channels
+          if channels is None:
+               channels = self.child_channels
+          numbers = sorted(set(this_channel.channel for this_channel in channels))
+          if not numbers:
+               return None
+          if numbers == list(range(numbers[0], numbers[-1]+1)) and len(numbers) > 1:
+               return "(@%d-%d)" % (numbers[0], numbers[-1])
+          return "(@" + ",".join(str(number) for number in numbers) + ")"
+
+     def send_batch_query(self, queries):
+          # Send several queries joined to one ';' separated SCPI frame.
+          # Returns the list of answers (one per query) or None on failure
+          answer = self.send_long_command(";".join(queries))
+          if answer is None:
+               return None
+          answers = answer.split(';')
+          if len(answers) != len(queries):
+               print("Batch query answer does not match the request!")
+               print(repr(queries) + " -> " + repr(answer))
+               return None
+          return answers
+
+     def read_channels(self, quantities=None, channels=None):
+          # Refresh the given quantities of several channels with a single frame.
+          # Every query is sent with a channel list, the module answers with a
+          # ',' separated list in ascending channel order
+          if quantities is None:
+               quantities = nhr_hv_channel.batch_quantities
+          if channels is None:
+               channels = self.child_channels
+          channels = sorted(channels, key=lambda this_channel: this_channel.channel)
+          ch_list = self.channel_list(channels)
+          if ch_list is None:
+               return False
+          queries = []
+          for quantity in quantities:
+               for this_query in nhr_hv_channel.batch_queries[quantity]:
+                    queries.append(this_query + " " + ch_list)
+          answers = self.send_batch_query(queries)
+          if answers is None:
+               return False
+          # All values of the frame were measured at the same time
+          acquired = (time.monotonic(), time.time())
+          answers = [this_answer.split(',') for this_answer in answers]
+          for this_answer in answers:
+               if len(this_answer) != len(channels):
+                    print("Batch query returned wrong number of channels!")
+                    return False
+          for idx, this_channel in enumerate(channels):
+               channel_answers = [this_answer[idx] for this_answer in answers]
+               this_channel.apply_batch_answers(quantities, channel_answers, acquired)
+          return True
+
+     def poll_tasks(self, tasks):
+          # All due quantities that can be batched are read with one frame for
+          # all concerned channels. The limits are module properties and only
+          # need to be read once.
+          if self.stop_thread:
+               return []
+          quantities = [quantity for quantity in nhr_hv_channel.batch_quantities
+                        if any(task.quantity == quantity for task in tasks)]
+          channels = []
+          for task in tasks:
+               if task.quantity in quantities and task.channel not in channels:
+                    channels.append(task.channel)
+          if quantities:
+               self.read_channels(quantities, channels)
+          for task in tasks:
+               if task.quantity == "limits":
+                    if self.stop_thread:
+                         break
+                    task.run()
+                    break
+          return tasks
+
+     def kill_channels(self):
+          # Set all channels to maximum ramp speed and zero voltage with a single
+          # frame and verify them with one batched status read. Falls back to
+          # killing channel by channel if the module rejects the frame
+          channels = sorted(self.child_channels, key=lambda this_channel: this_channel.channel)
+          ch_list = self.channel_list(channels)
+          if ch_list is None:
+               return []
+          for this_channel in channels:
+               this_channel.kill_active = True
+          command = (":CONF:RAMP:VOLT:UP %.3f,%s;:CONF:RAMP:VOLT:DOWN %.3f,%s;"
+                     ":VOLT %.3f,%s;*OPC?" % (255, ch_list, 255, ch_list, 0, ch_list))
+          answer = self.send_long_command(command)
+          if answer != '1':
+               print("Multi channel kill failed, killing channels one by one!")
+               if not self.is_connected:
+                    return [False for this_channel in self.child_channels]
+               return gen_hv_module.kill_channels(self)
+          self.read_channels(["device_status"], channels)
+          return [this_channel.status == "H2L" or this_channel.hv_switch_off
+                  for this_channel in self.child_channels]
+
      def sync_module(self):
          if self.read_module_info():
              self.is_connected = True
@@ -215,28 +560,42 @@ class nhr_hv_module(gen_hv_module):
 
 class nhr_hv_channel(gen_hv_channel):
 
+    # Queries (without channel list) used by nhr_hv_module.read_channels
+    batch_queries = {"voltage": (":MEAS:VOLT?",),
+                     "current": (":MEAS:CURR?",),
+                     "set_voltage": (":READ:VOLT?",),
+                     "ramp_speed": (":CONF:RAMP:VOLT:UP?",),
+                     "device_status": (":READ:CHAN:STAT?", ":READ:VOLT:ON?",
+                                       ":READ:CHAN:EV:STAT?", ":CONF:TRIP:ACT?")}
+    batch_quantities = ("voltage", "current", "set_voltage", "ramp_speed",
+                        "device_status")
+    # Quantities the reader thread polls and the methods reading them
+    poll_methods = {"voltage": ("read_voltage",),
+                    "current": ("read_current",),
+                    "set_voltage": ("read_set_voltage",),
+                    "ramp_speed": ("read_ramp_speed",),
+                    "limits": ("read_voltage_limit", "read_current_limit"),
+                    "device_status": ("read_device_status",)}
+
     def __init__(self, name, host_module, this_hv_channel, defaults):
         super().__init__(name, host_module, this_hv_channel, defaults)
         
     # Functions helping to split off units and convert answers to float
     def convert_answer_with_unit(self, answer, unit):
-        if answer is None:
-            return float('nan')
-        try: value = float(answer.split(unit)[0])
-        except (ValueError, TypeError):
-            return float('nan')
-        return value        
+        return _rep.parse_with_unit(answer, unit)
 
                
     # iSeg read commands        
     def read_voltage(self):
         command = (":MEAS:VOLT? (@%d)" % self.channel)
         answer = self.module.send_long_command(command)
+        self.stamp_acquisition("voltage")
         self.voltage = self.convert_answer_with_unit(answer, "V")
 
     def read_current(self):
         command = (":MEAS:CURR? (@%d)" % self.channel)
-        answer = self.module.send_long_command(command) 
+        answer = self.module.send_long_command(command)
+        self.stamp_acquisition("current")
         self.current = self.convert_answer_with_unit(answer, "A")
         
     def read_voltage_limit(self):
@@ -271,40 +630,63 @@ class nhr_hv_channel(gen_hv_channel):
     def read_device_status(self):
         command = (":READ:CHAN:STAT? (@%d)" % self.channel)
         answer = self.module.send_long_command(command)
-        try: value = int(answer)
-        except (ValueError, TypeError): return False
-        #Convert to binary and reverse to have same numbering as in manual
-        binary = '{0:32b}'.format(value)[::-1]
-        self.polarity_positive = (binary[0] == '1')
-        # self.hv_switch_off = (binary[3] == '0')
-        self.channel_in_error = (binary[5] == '1')        
-        self.channel_is_ramping = (binary[4] == '1') 
-        self.hardware_inhibit = (binary[12] == '1')                
-
+        if answer is None: return False
         # Read if HV is on (somehow the register gives wrong information sometimes...)
         command_hv_on = (":READ:VOLT:ON? (@%d)" % self.channel)
         answer_hv_on = self.module.send_long_command(command_hv_on)
+        if answer_hv_on is None: return False
+        # Ask if a HV trip occured
+        command_ev = (":READ:CHAN:EV:STAT? (@%d)" % self.channel)
+        answer_ev = self.module.send_long_command(command_ev)
+        if answer_ev is None: return False
+        # Not part of the register...
+        command_trip = (":CONF:TRIP:ACT? (@%d)" % self.channel)
+        answer_trip = self.module.send_long_command(command_trip)
+        return self.decode_device_status(answer, answer_hv_on, answer_ev, answer_trip)
+
+    def decode_device_status(self, answer, answer_hv_on, answer_ev, answer_trip):
+        value = _rep.parse_int(answer)
+        if value is None: return False
+        # Bit numbering as in the manual
+        self.polarity_positive = (value & _rep.NHR_STATUS_POLARITY_POSITIVE != 0)
+        # self.hv_switch_off = (bit 3 == 0)
+        self.channel_in_error = (value & _rep.NHR_STATUS_ERROR != 0)
+        self.channel_is_ramping = (value & _rep.NHR_STATUS_RAMPING != 0)
+        self.hardware_inhibit = (value & _rep.NHR_STATUS_INHIBIT != 0)
+
         self.hv_switch_off = (answer_hv_on == '0')
         if self.hv_switch_off:
             self.status = ""
         elif not self.channel_is_ramping:
             self.status = "ON"
         
-		# Ask if a HV trip occured
-        command = (":READ:CHAN:EV:STAT? (@%d)" % self.channel)
-        answer = self.module.send_long_command(command)
-        try: value = int(answer)
-        except (ValueError, TypeError): return False
-        #Convert to binary and reverse to have same numbering as in manual
-        ev_binary = '{0:32b}'.format(value)[::-1]
-        self.channel_is_tripped = (ev_binary[13] == '1')   
+        value = _rep.parse_int(answer_ev)
+        if value is None: return False
+        self.channel_is_tripped = (value & _rep.NHR_EVENT_TRIP != 0)
 		
-        # Not part of the register...
-        command = (":CONF:TRIP:ACT? (@%d)" % self.channel)
-        answer = self.module.send_long_command(command)
-        self.kill_enable_switch = answer == '2'
+        self.kill_enable_switch = answer_trip == '2'
         self.manual_control = False
         return True
+
+    def apply_batch_answers(self, quantities, answers, acquired=None):
+        # Store the answers of a batched read (see nhr_hv_module.read_channels)
+        idx = 0
+        for quantity in quantities:
+            n_answers = len(self.batch_queries[quantity])
+            these_answers = answers[idx:idx+n_answers]
+            idx += n_answers
+            if quantity == "voltage":
+                self.stamp_acquisition("voltage", acquired)
+                self.voltage = self.convert_answer_with_unit(these_answers[0], "V")
+            elif quantity == "current":
+                self.stamp_acquisition("current", acquired)
+                self.current = self.convert_answer_with_unit(these_answers[0], "A")
+            elif quantity == "set_voltage":
+                self.set_voltage = self.convert_answer_with_unit(these_answers[0], "V")
+            elif quantity == "ramp_speed":
+                self.ramp_speed = self.convert_answer_with_unit(these_answers[0], "V/s")
+            elif quantity == "device_status":
+                self.decode_device_status(*these_answers)
         
     def read_auto_start(self):
         # does not exist for the NHR module
@@ -392,16 +774,13 @@ class nhr_hv_channel(gen_hv_channel):
     # Subsequent High level methods
             
     def kill_hv(self):
-        # here needs to come an interrupt signal to give this command
-        # direct access to the board communication
+        # Executed with exclusive board access via gen_hv_module.kill_hv
         if self.module.is_connected:
-            self.module.board_occupied = True
             self.kill_active = True
             set_voltage_received = self.write_set_voltage(0)
             ramp_speed_received = self.write_ramp_speed(255)
             self.read_device_status()
             
-            self.module.board_occupied = False
             if self.status =="H2L" or self.hv_switch_off:
                 return True
         return False
@@ -447,6 +826,17 @@ class nhq_hv_module(gen_hv_module):
 
 class nhq_hv_channel(gen_hv_channel):
 
+    # Quantities the reader thread polls and the methods reading them
+    poll_methods = {"voltage": ("read_voltage",),
+                    "current": ("read_current",),
+                    "set_voltage": ("read_set_voltage",),
+                    "ramp_speed": ("read_ramp_speed",),
+                    "status": ("read_status",),
+                    "limits": ("read_voltage_limit", "read_current_limit"),
+                    "trip_current": ("read_trip_current",),
+                    "device_status": ("read_device_status",),
+                    "auto_start": ("read_auto_start",)}
+
     def __init__(self, name, host_module, this_hv_channel, defaults):
         super().__init__(name, host_module, this_hv_channel, defaults)
     
@@ -454,41 +844,20 @@ class nhq_hv_channel(gen_hv_channel):
     def read_voltage(self):
         command = ("U%d" % self.channel)
         answer = self.module.send_long_command(command)
+        self.stamp_acquisition("voltage")
         if not self.module.is_high_precission:
-            try: value = float(answer)
-            except (ValueError, TypeError): 
-                self.voltage = float('nan')
-                return float('nan')
+            value = _rep.parse_float(answer)
         else:
-            if answer is None:
-                self.voltage = float('nan')
-                return float('nan')      
-            parts = answer[1:].split('-')
-            if len(parts) != 2:
-                self.voltage = float('nan')
-                return float('nan')
-            parts[0] = answer[0]+parts[0]
-            try: value = float(parts[0])*10**(-int(parts[1]))
-            except (ValueError, TypeError): 
-                self.voltage = float('nan')
-                return float('nan')
+            # The voltage comes with a leading sign
+            value = _rep.parse_nhq_exponent(answer, signed=True)
         self.voltage = value
         return value
 
     def read_current(self):
         command = ("I%d" % self.channel)
         answer = self.module.send_long_command(command)
-        if answer is None:
-            self.current = float('nan')
-            return float('nan')        
-        parts = answer.split('-')
-        if len(parts) != 2:
-            self.current = float('nan')
-            return float('nan')
-        try: value = float(parts[0])*10**(-int(parts[1]))
-        except (ValueError, TypeError): 
-            self.current = float('nan')
-            return float('nan')
+        self.stamp_acquisition("current")
+        value = _rep.parse_nhq_exponent(answer)
         self.current = value
         return value    
             
@@ -516,22 +885,9 @@ class nhq_hv_channel(gen_hv_channel):
         command = ("D%d" % self.channel)
         answer = self.module.send_long_command(command)
         if not self.module.is_high_precission:
-            try: value = float(answer)
-            except (ValueError, TypeError): 
-                self.set_voltage = float('nan')
-                return float('nan')
+            value = _rep.parse_float(answer)
         else:
-            if answer is None:
-                self.set_voltage = float('nan')
-                return float('nan')                
-            parts = answer.split('-')
-            if len(parts) != 2:
-                self.set_voltage = float('nan')
-                return float('nan')
-            try: value = float(parts[0])*10**(-int(parts[1]))
-            except (ValueError, TypeError): 
-                self.set_voltage = float('nan')
-                return float('nan')
+            value = _rep.parse_nhq_exponent(answer)
         self.set_voltage = value
         return value        
         
@@ -548,17 +904,7 @@ class nhq_hv_channel(gen_hv_channel):
     def read_trip_current(self):
         command = ("L%d" % self.channel)
         answer = self.module.send_long_command(command)
-        if answer is None:
-            self.trip_current = float('nan')
-            return float('nan')                        
-        parts = answer.split('-')
-        if len(parts) != 2:
-            self.trip_current = float('nan')
-            return float('nan')
-        try: value = float(parts[0])*10**(-int(parts[1]))
-        except (ValueError, TypeError): 
-            self.trip_current = float('nan')
-            return float('nan')
+        value = _rep.parse_nhq_exponent(answer)
         self.trip_current = value        
         return value        
         
@@ -576,30 +922,27 @@ class nhq_hv_channel(gen_hv_channel):
     def read_device_status(self):
         command = ("T%d" % self.channel)
         answer = self.module.send_long_command(command)
-        try: value = int(answer)
-        except (ValueError, TypeError): return False
-        #Convert to binary and reverse to have same numbering as in manual
-        binary = '{0:08b}'.format(value)[::-1]
-        self.channel_in_error = (binary[7] == '1')
-        self.channel_is_tripped = (binary[6] == '1')   
-        self.hardware_inhibit = (binary[5] == '1')                
-        self.kill_enable_switch = (binary[4] == '1')
-        self.hv_switch_off = (binary[3] == '1')
-        self.polarity_positive = (binary[2] == '1')
-        self.manual_control = (binary[1] == '1')
+        value = _rep.parse_int(answer)
+        if value is None: return False
+        # Bit numbering as in the manual
+        self.channel_in_error = (value & _rep.NHQ_STATUS_ERROR != 0)
+        self.channel_is_tripped = (value & _rep.NHQ_STATUS_TRIPPED != 0)
+        self.hardware_inhibit = (value & _rep.NHQ_STATUS_INHIBIT != 0)
+        self.kill_enable_switch = (value & _rep.NHQ_STATUS_KILL_ENABLE != 0)
+        self.hv_switch_off = (value & _rep.NHQ_STATUS_HV_OFF != 0)
+        self.polarity_positive = (value & _rep.NHQ_STATUS_POLARITY_POSITIVE != 0)
+        self.manual_control = (value & _rep.NHQ_STATUS_MANUAL_CONTROL != 0)
         return True
         
     def read_auto_start(self):
         command = ("A%d" % self.channel)
         answer = self.module.send_long_command(command)
-        try: value = int(answer)
-        except (ValueError, TypeError): return False
-        #Convert to binary and reverse to have same numbering as in manual
-        binary = '{0:08b}'.format(value)[::-1]
-        self.autostart_on = (binary[3] == '1')
-        self.trip_current_in_memory = (binary[2] == '1')
-        self.set_voltage_in_memory = (binary[1] == '1')
-        self.ramp_speed_in_memory = (binary[0] == '1')        
+        value = _rep.parse_int(answer)
+        if value is None: return False
+        self.autostart_on = (value & _rep.NHQ_AUTO_START_ON != 0)
+        self.trip_current_in_memory = (value & _rep.NHQ_AUTO_TRIP_CURRENT_IN_MEMORY != 0)
+        self.set_voltage_in_memory = (value & _rep.NHQ_AUTO_SET_VOLTAGE_IN_MEMORY != 0)
+        self.ramp_speed_in_memory = (value & _rep.NHQ_AUTO_RAMP_SPEED_IN_MEMORY != 0)
         return True
         
     # iSeg Operation commands
@@ -638,15 +981,12 @@ class nhq_hv_channel(gen_hv_channel):
     # Subsequent High level methods
             
     def kill_hv(self):
-        # here needs to come an interrupt signal to give this command
-        # direct access to the board communication
+        # Executed with exclusive board access via gen_hv_module.kill_hv
         if self.module.is_connected:
-            self.module.board_occupied = True
             self.kill_active = True
             set_voltage_received = self.write_set_voltage(0)
             ramp_speed_received = self.write_ramp_speed(255)
             answer = self.start_voltage_change()
-            self.module.board_occupied = False            
             if "H2L" in answer:
                 return True
         return False
@@ -1,13 +1,29 @@
 from PyQt5 import QtCore as _qc
 import psycopg2 as _psy
-import psycopg2.extras as _psyext
+import sqlalchemy as _sql
 import time
-import numpy as _np
 from datetime import datetime, timedelta
+import select
+
+
+# Makes the database notify the interlock about new rows (see Interlock.set_notify_channel).
+# Installed by Interlock.install_notify_trigger or by hand, see the README
+NOTIFY_TRIGGER_SQL = """CREATE OR REPLACE FUNCTION {channel}_notify() RETURNS trigger AS $$
+BEGIN
+	PERFORM pg_notify('{channel}', '');
+	RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS {channel}_trigger ON {table};
+CREATE TRIGGER {channel}_trigger AFTER INSERT ON {table}
+	FOR EACH STATEMENT EXECUTE PROCEDURE {channel}_notify();"""
 
 
 class Interlock(_qc.QThread):
 
+	# Emitted with the result of the kill function after the interlock triggered
+	interlock_triggered = _qc.pyqtSignal('PyQt_PyObject')
+
 	def __init__(self):
 		_qc.QThread.__init__(self)
 		self.lock_state = False
@@ -19,17 +35,35 @@ class Interlock(_qc.QThread):
 		self.grace_counter = 0
 		self.max_read_attempts = 5		
 
+		self.kill_function = None
+		self.triggered = False
+
 		self.connection = None
+		self.db_conn = None
+		self.cursor = None
+		self.statement_name = "interlock_latest_value"
+
+		# Push mode: LISTEN on a notification channel, see set_notify_channel
+		self.poll_interval = 1
+		self.notify_channel = None
+		self.listen_conn = None
+		self.listen_retry_interval = 30
+		self.last_listen_attempt = None
+		self.notify_timeout = 10
+		self.last_notify_time = None
+		self.push_active = False
+		self.notify_count = 0
 
 	def set_sql_container(self, sql_container):
 
 		self.container = sql_container
 		
-	def set_psycopg_conn(self, host, db_name, user, pwd, tablename):
+	def set_engine(self, sql_engine, tablename):
 
-		con_str = "host='"+host+"' dbname='"+db_name+"' user='"+user+"' password='"+pwd+"'"
+		# The connection for the reads is taken from the pool of the shared engine
+		self.release_db_connection(broken=False)
 		self.table_name = tablename
-		self.connection = _psy.connect(con_str)
+		self.connection = sql_engine
 
 	def set_interlock_parameter(self, parameter, min_value):
 		
@@ -37,12 +71,124 @@ class Interlock(_qc.QThread):
 		self.time_stamp = "time"
 		self.lock_value = min_value
 		
+	def set_kill_function(self, kill_function):
+
+		# Called from the interlock thread once the interlock triggers. Must be
+		# thread safe and must not touch the GUI
+		self.kill_function = kill_function
+
+	def set_notify_channel(self, channel, notify_timeout=10):
+
+		# Check the interlock as soon as a notification arrives on channel.
+		# If none arrived for notify_timeout seconds, the thread keeps on
+		# polling every poll_interval seconds. None disables the push mode
+		self.notify_channel = channel
+		self.notify_timeout = notify_timeout
+
+	def notify_trigger_sql(self):
+
+		# SQL creating the trigger which sends the notifications. Needs to be
+		# executed once by a database user owning the interlock table
+		return NOTIFY_TRIGGER_SQL.format(channel=self.notify_channel,
+		                                 table=self.table_name)
+
+	def install_notify_trigger(self):
+
+		# Create the trigger with the pooled engine. Returns False if the
+		# database refused, e.g. since the user does not own the table
+		try:
+			conn = self.connection.raw_connection()
+		except _sql.exc.OperationalError as err:
+			print("Interlock could not connect to install the trigger: "+str(err))
+			return False
+		try:
+			cursor = conn.cursor()
+			cursor.execute(self.notify_trigger_sql())
+			cursor.close()
+			conn.commit()
+		except _psy.Error as err:
+			print("Interlock could not install the notification trigger: "+str(err))
+			conn.invalidate()
+			return False
+		conn.close()
+		return True
+
 	def run(self):
 		self.is_running = True
 		self.stop_looping = False
 		while not self.stop_looping:
 			self.check_interlock()
-			time.sleep(1)
+			self.handle_trigger()
+			if self.notify_channel is not None and self.listen_conn is None:
+				self.start_listening()
+			if self.listen_conn is not None:
+				self.wait_for_notification(self.poll_interval)
+			else:
+				time.sleep(self.poll_interval)
+		self.stop_listening()
+
+	def start_listening(self):
+
+		# Retry only every listen_retry_interval seconds after a failure
+		now = time.monotonic()
+		if (self.last_listen_attempt is not None and 
+		    now - self.last_listen_attempt < self.listen_retry_interval):
+			return False
+		self.last_listen_attempt = now
+		if self.connection is None:
+			return False
+		try:
+			self.listen_conn = self.connection.raw_connection()
+			self.listen_conn.connection.autocommit = True
+			cursor = self.listen_conn.cursor()
+			cursor.execute('LISTEN '+self.notify_channel)
+			cursor.close()
+		except (_sql.exc.OperationalError, _psy.Error) as err:
+			print("Interlock could not listen for notifications: "+str(err))
+			self.stop_listening()
+			return False
+		self.last_notify_time = time.monotonic()
+		self.push_active = True
+		return True
+
+	def stop_listening(self):
+
+		# The connection is not returned to the pool, as it is still listening
+		if self.listen_conn is not None:
+			try:
+				self.listen_conn.invalidate()
+			except _psy.Error:
+				pass
+		self.listen_conn = None
+		self.push_active = False
+
+	def wait_for_notification(self, timeout):
+
+		# Wait for a notification, returns False after timeout
+		dbapi_conn = self.listen_conn.connection
+		try:
+			readable = select.select([dbapi_conn], [], [], timeout)[0]
+			if readable:
+				dbapi_conn.poll()
+		except (_psy.Error, OSError, ValueError) as err:
+			print("Interlock lost the notification connection: "+str(err))
+			self.stop_listening()
+			return False
+		notifies = dbapi_conn.notifies
+		if notifies:
+			self.notify_count += len(notifies)
+			del notifies[:]
+			self.last_notify_time = time.monotonic()
+			if not self.push_active:
+				print("Interlock receives notifications again")
+			self.push_active = True
+			return True
+		# Fall back to polling if the notifications stopped
+		if self.push_active and time.monotonic() - self.last_notify_time > self.notify_timeout:
+			print("Interlock received no notifications for",
+			      self.notify_timeout, "s, polling instead")
+			self.push_active = False
+		return False
         	
 		
 	def check_interlock(self):
@@ -59,42 +205,34 @@ class Interlock(_qc.QThread):
 			return False
 		self.is_connected = True
 
-		time_now = datetime.now()
-		delta_time = timedelta(seconds=self.max_time_difference)
-		time_max_past = time_now - delta_time
-
-		cursor = self.connection.cursor('testName', cursor_factory=_psyext.DictCursor)
-		select = 'SELECT '+self.lock_param+' FROM '+self.table_name+' WHERE (time >= %s AND time <= %s)'
-		cursor.execute(select, (time_max_past, time_now))
-		result = cursor.fetchall()
-
+		try:
+			result = self.read_latest_value()
+		except _sql.exc.OperationalError:
+			print("Interlock could not connect to the DB!")
+			return self.read_failed()
+		except _psy.Error as err:
+			print("Interlock could not read from the DB: "+str(err))
+			self.release_db_connection()
+			return self.read_failed()
 
-		data = _np.array(result)
-		cursor.close()
 		self.is_running = True
-		if len(data) == 0:
+		if result is None:
 			print("Interlock received wrong data (too little data) from DB!")
-			if self.grace_counter < self.max_read_attempts:
-				self.grace_counter += 1
-				print("Interlock will be activated after", 
-        	                       self.grace_counter, "further attempts")
-				return True
+			return self.read_failed()
 
-			self.lock_state = False
-			return False
+		# The latest value must not be older than max_time_difference
+		latest_time = result[0]
+		if latest_time.tzinfo is not None:
+			latest_time = latest_time.astimezone().replace(tzinfo=None)
+		if latest_time < datetime.now() - timedelta(seconds=self.max_time_difference):
+			print("Interlock received outdated data from DB! ("+str(latest_time)+")")
+			return self.read_failed()
 
 		try:
-			self.parameter_value = (float(data[-1,0]))
+			self.parameter_value = (float(result[1]))
 		except TypeError:
 			print("Interlock received wrong data (wrong type)!")
-			if self.grace_counter < self.max_read_attempts:
-				self.grace_counter += 1
-				print("Interlock will be activated after", 
-        	                       self.grace_counter, "further attempts")
-				return True
-
-			self.lock_state = False			
-			return False
+			return self.read_failed()
 
 		# DB read-out worked fine. Grade counter can be reset to zero
 		self.grace_counter = 0
@@ -103,3 +241,62 @@ class Interlock(_qc.QThread):
 			return True
 		else:
 			return False
+
+	def read_latest_value(self):
+
+		# One pooled connection and cursor are kept for all reads. The query
+		# is prepared once per connection
+		if self.db_conn is None:
+			self.db_conn = self.connection.raw_connection()
+			# No transaction is kept open between the reads
+			self.db_conn.connection.autocommit = True
+			self.cursor = self.db_conn.cursor()
+			self.cursor.execute('PREPARE '+self.statement_name+' AS SELECT '+
+				self.time_stamp+', '+self.lock_param+' FROM '+self.table_name+
+				' ORDER BY '+self.time_stamp+' DESC LIMIT 1')
+		self.cursor.execute('EXECUTE '+self.statement_name)
+		return self.cursor.fetchone()
+
+	def release_db_connection(self, broken=True):
+
+		# A new connection is taken from the pool for the next read. Broken
+		# connections are discarded, healthy ones are cleaned up and returned
+		if self.db_conn is None:
+			return
+		try:
+			if broken:
+				self.db_conn.invalidate()
+			else:
+				self.cursor.execute('DEALLOCATE '+self.statement_name)
+				self.cursor.close()
+				self.db_conn.connection.autocommit = False
+				self.db_conn.close()
+		except _psy.Error:
+			self.db_conn.invalidate()
+		self.cursor = None
+		self.db_conn = None
+
+	def handle_trigger(self):
+
+		# Kill the HV right away, the GUI is only informed via signal
+		if self.lock_state or not self.is_connected or self.triggered:
+			return False
+		self.triggered = True
+		print("Interlock triggered: "+str(self.parameter_value))
+		response = None
+		if self.kill_function is not None:
+			response = self.kill_function()
+		self.interlock_triggered.emit(response)
+		return True
+
+	def read_failed(self):
+
+		# Failed reads are tolerated max_read_attempts times in a row
+		if self.grace_counter < self.max_read_attempts:
+			self.grace_counter += 1
+			print("Interlock will be activated after", 
+			      self.grace_counter, "further attempts")
+			return True
+
+		self.lock_state = False
+		return False
@@ -0,0 +1,148 @@
+"""Decoding of the answers of iSeg NHQ and NHR modules
+
+These functions are called for every answer of a module, so they avoid
+exceptions and string formatting where possible. Run this file to compare
+their speed with the previous implementation.
+"""
+NAN = float('nan')
+
+# NHQ numbers are sent as mantissa and negative exponent, e.g. 12345-10
+# for 1.2345E-6. Voltages carry a leading sign character, e.g. -01234-3.
+# 10**(-n) is precomputed for the exponents the modules use
+_NEG_POWERS = [10**(-n) for n in range(32)]
+
+# Bits of the NHQ device status register (T command)
+NHQ_STATUS_MANUAL_CONTROL = 1 << 1
+NHQ_STATUS_POLARITY_POSITIVE = 1 << 2
+NHQ_STATUS_HV_OFF = 1 << 3
+NHQ_STATUS_KILL_ENABLE = 1 << 4
+NHQ_STATUS_INHIBIT = 1 << 5
+NHQ_STATUS_TRIPPED = 1 << 6
+NHQ_STATUS_ERROR = 1 << 7
+
+# Bits of the NHQ auto start register (A command)
+NHQ_AUTO_RAMP_SPEED_IN_MEMORY = 1 << 0
+NHQ_AUTO_SET_VOLTAGE_IN_MEMORY = 1 << 1
+NHQ_AUTO_TRIP_CURRENT_IN_MEMORY = 1 << 2
+NHQ_AUTO_START_ON = 1 << 3
+
+# Bits of the NHR channel status register (:READ:CHAN:STAT?)
+NHR_STATUS_POLARITY_POSITIVE = 1 << 0
+NHR_STATUS_RAMPING = 1 << 4
+NHR_STATUS_ERROR = 1 << 5
+NHR_STATUS_INHIBIT = 1 << 12
+
+# Bits of the NHR channel event register (:READ:CHAN:EV:STAT?)
+NHR_EVENT_TRIP = 1 << 13
+
+
+def parse_int(answer):
+    # Integer answer or None
+    if answer is None:
+        return None
+    try:
+        return int(answer)
+    except ValueError:
+        return None
+
+
+def parse_nhq_exponent(answer, signed=False):
+    # NHQ mantissa-exponent format, nan if the answer is invalid
+    if not answer:
+        return NAN
+    if signed:
+        sign = answer[0]
+        mantissa, separator, exponent = answer[1:].rpartition('-')
+    else:
+        sign = ""
+        mantissa, separator, exponent = answer.rpartition('-')
+    # isdigit alone also accepts e.g. superscript digits, which int refuses
+    if not (mantissa.isascii() and mantissa.isdigit() and
+            exponent.isascii() and exponent.isdigit()):
+        return NAN
+    exponent = int(exponent)
+    try:
+        value = float(sign + mantissa)
+    except ValueError:
+        return NAN
+    if exponent < len(_NEG_POWERS):
+        return value*_NEG_POWERS[exponent]
+    return value*10**(-exponent)
+
+
+def parse_float(answer):
+    # Plain decimal answer (NHQ in low precision mode), nan if invalid
+    if answer is None:
+        return NAN
+    try:
+        return float(answer)
+    except ValueError:
+        return NAN
+
+
+def parse_with_unit(answer, unit):
+    # NHR numbers with unit suffix, e.g. 1.234560E3V or 0.01E3V/s
+    if answer is None:
+        return NAN
+    try:
+        return float(answer.partition(unit)[0])
+    except ValueError:
+        return NAN
+
+
+if __name__ == "__main__":
+    # Micro benchmark against the string based decoding used before
+    import timeit
+
+    def legacy_nhq_exponent(answer):
+        parts = answer.split('-')
+        if len(parts) != 2:
+            return NAN
+        try: value = float(parts[0])*10**(-int(parts[1]))
+        except (ValueError, TypeError):
+            return NAN
+        return value
+
+    def legacy_with_unit(answer, unit):
+        try: value = float(answer.split(unit)[0])
+        except (ValueError, TypeError):
+            return NAN
+        return value
+
+    def legacy_nhr_status(answer):
+        value = int(answer)
+        binary = '{0:32b}'.format(value)[::-1]
+        return (binary[0] == '1', binary[4] == '1', binary[5] == '1', binary[12] == '1')
+
+    def new_nhr_status(answer):
+        value = parse_int(answer)
+        return (value & NHR_STATUS_POLARITY_POSITIVE != 0, value & NHR_STATUS_RAMPING != 0,
+                value & NHR_STATUS_ERROR != 0, value & NHR_STATUS_INHIBIT != 0)
+
+    def legacy_nhq_status(answer):
+        value = int(answer)
+        binary = '{0:08b}'.format(value)[::-1]
+        return (binary[7] == '1', binary[6] == '1', binary[5] == '1', binary[4] == '1',
+                binary[3] == '1', binary[2] == '1', binary[1] == '1')
+
+    def new_nhq_status(answer):
+        value = parse_int(answer)
+        return (value & NHQ_STATUS_ERROR != 0, value & NHQ_STATUS_TRIPPED != 0,
+                value & NHQ_STATUS_INHIBIT != 0, value & NHQ_STATUS_KILL_ENABLE != 0,
+                value & NHQ_STATUS_HV_OFF != 0, value & NHQ_STATUS_POLARITY_POSITIVE != 0,
+                value & NHQ_STATUS_MANUAL_CONTROL != 0)
+
+    cases = [("NHQ current", lambda: legacy_nhq_exponent("12345-10"),
+              lambda: parse_nhq_exponent("12345-10")),
+             ("NHR voltage", lambda: legacy_with_unit("1.234560E3V", "V"),
+              lambda: parse_with_unit("1.234560E3V", "V")),
+             ("NHQ status", lambda: legacy_nhq_status("172"),
+              lambda: new_nhq_status("172")),
+             ("NHR status", lambda: legacy_nhr_status("4113"),
+              lambda: new_nhr_status("4113"))]
+    for name, legacy, new in cases:
+        assert legacy() == new()
+        n_calls = 200000
+        t_legacy = min(timeit.repeat(legacy, number=n_calls, repeat=5))/n_calls*1e9
+        t_new = min(timeit.repeat(new, number=n_calls, repeat=5))/n_calls*1e9
+        print("{:12s} legacy {:6.0f} ns   new {:6.0f} ns".format(name, t_legacy, t_new))
@@ -1,6 +1,9 @@
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from email.mime.application import MIMEApplication
+import os
 import smtplib as sm
+import threading
 from hexesvm import iSeg_tools as _iseg
 
 class MailNotifier():
@@ -28,9 +31,23 @@ class MailNotifier():
         self.recipients_alarm = recipient
 
     def set_sms_recipient(self, recipient):
-    
+
         self.sms_numbers = recipient
 
+    def send_in_background(self, description, *sends):
+        # Run the send functions, given as (function, args...), in a worker
+        # thread, so a slow mail server blocks neither the GUI nor the
+        # interlock. Errors are only printed
+        def send_all():
+            for send_function, *args in sends:
+                try:
+                    send_function(*args)
+                except (sm.SMTPException, OSError) as err:
+                    print("Could not send "+description+": "+str(err))
+        worker = threading.Thread(target=send_all, name="mail", daemon=True)
+        worker.start()
+        return worker
+
     
     def send_alarm(self, hv_channel, alarm_priority, alarm_kind):
 
@@ -66,6 +83,40 @@ class MailNotifier():
         mail_conn.sendmail(self.from_address, recipients_array, msg.as_string())
         return
         
+    def send_trip_capture(self, hv_channel, alarm_priority, filename, metadata):
+
+        msg = MIMEMultipart()
+        msg['From'] = self.from_address
+        if alarm_priority == 1:
+            msg['To'] = self.recipients_info
+            recipients_clean = self.recipients_info.replace(" ", "")
+        elif alarm_priority == 2:
+            msg['To'] = self.recipients_alarm
+            recipients_clean = self.recipients_alarm.replace(" ", "")
+        else:
+            del msg
+            return
+        msg['Subject'] = "HeXe SVM trip capture: "+hv_channel.name
+        message_string = "Read-outs of all channels around the trip.\n"
+        message_string += "Name: "+hv_channel.name+"\n"
+        message_string += "Trip time: "+metadata["trip_time_string"]+"\n"
+        message_string += "Detected by: "+metadata["reason"]+"\n"
+        message_string += "Voltage: "+str(metadata["voltage"])+"\n"
+        message_string += "Current: "+str(metadata["current"])+"\n"
+        message_string += "Status: "+", ".join(name for name, flag
+                                               in metadata["status_flags"].items() if flag)+"\n"
+        message_string += ("Captured from "+str(metadata["pre_seconds"])+" s before to "+
+                           str(metadata["post_seconds"])+" s after the trip.\n")
+        msg.attach(MIMEText(message_string,'plain'))
+        with open(filename, "rb") as capture_file:
+            attachment = MIMEApplication(capture_file.read(), Name=os.path.basename(filename))
+        attachment['Content-Disposition'] = 'attachment; filename="'+os.path.basename(filename)+'"'
+        msg.attach(attachment)
+        mail_conn = sm.SMTP(self.smtp_server)
+        recipients_array = recipients_clean.split(",")
+        mail_conn.sendmail(self.from_address, recipients_array, msg.as_string())
+        return
+
     def send_sms(self, hv_channel, alarm_priority, alarm_kind):
 
         msg = MIMEMultipart()
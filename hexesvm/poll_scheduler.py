@@ -0,0 +1,109 @@
+"""Deadline based scheduling of the periodic HV channel read-out"""
+import heapq
+import itertools
+
+
+# Poll intervals (seconds) used if neither the global nor the channel
+# settings define one for a quantity
+DEFAULT_POLL_INTERVALS = {"voltage": 0.5,
+                          "current": 0.5,
+                          "set_voltage": 5,
+                          "ramp_speed": 30,
+                          "status": 2,
+                          "device_status": 2,
+                          "limits": 300,
+                          "trip_current": 300,
+                          "auto_start": 300}
+
+
+# Poll intervals (seconds) while a channel is ramping or a spark is suspected
+DEFAULT_FAST_POLL_INTERVALS = {"voltage": 0.1,
+                               "current": 0.1,
+                               "device_status": 0.5}
+
+# Time (seconds) a channel stays in fast poll mode after it became stable
+DEFAULT_FAST_POLL_HOLD = 10
+
+
+class PollTask():
+    """Periodic read of one quantity of one HV channel"""
+
+    def __init__(self, channel, quantity, interval):
+        self.channel = channel
+        self.quantity = quantity
+        self.interval = interval
+        self.deadline = 0.
+        self.last_run = None
+
+    def run(self):
+        return self.channel.poll(self.quantity)
+
+
+class PollScheduler():
+    """Earliest-deadline-first scheduler for PollTasks
+
+    Every task is due again one interval after its previous deadline. Tasks
+    that fall behind are not executed in bursts to catch up, but are due
+    right away and compete with the others by their deadline. The lag
+    attributes tell how late (seconds) the tasks are executed.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.queue = []
+        self.counter = itertools.count()
+        self.lag = 0.
+        self.mean_lag = 0.
+        self.max_lag = 0.
+
+    def add_task(self, task, now):
+        self.tasks[(task.channel, task.quantity)] = task
+        task.deadline = now
+        self._push(task)
+
+    def _push(self, task):
+        heapq.heappush(self.queue, (task.deadline, next(self.counter), task))
+
+    def get_task(self, channel, quantity):
+        return self.tasks.get((channel, quantity))
+
+    def set_interval(self, channel, quantity, interval):
+        # Change the interval of a task. If the task becomes due earlier by
+        # this, its deadline is moved forward accordingly
+        task = self.get_task(channel, quantity)
+        if task is None or task.interval == interval:
+            return False
+        task.interval = interval
+        if task.last_run is not None and task.last_run + interval < task.deadline:
+            task.deadline = task.last_run + interval
+            queued = [entry[2] for entry in self.queue]
+            if task in queued:
+                self.queue = []
+                for this_task in queued:
+                    self._push(this_task)
+        return True
+
+    def pop_due(self, now):
+        # Remove and return all tasks which are due, ordered by deadline
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue)[2])
+        if due:
+            self.lag = now - due[0].deadline
+            self.mean_lag = 0.9*self.mean_lag + 0.1*self.lag
+            self.max_lag = max(self.max_lag, self.lag)
+        return due
+
+    def reschedule(self, tasks, now):
+        # Put executed tasks back into the queue with their next deadline
+        for task in tasks:
+            task.last_run = now
+            task.deadline += task.interval
+            if task.deadline < now:
+                task.deadline = now
+            self._push(task)
+
+    def time_to_next(self, now):
+        if not self.queue:
+            return None
+        return max(self.queue[0][0] - now, 0.)
@@ -0,0 +1,58 @@
+"""Growable ring buffer for numpy data"""
+import numpy as _np
+
+
+class RingBuffer():
+    """FIFO buffer of scalars with O(1) contiguous views
+
+    Every value is written twice, at its position and one capacity further,
+    so the buffered values are always available as one contiguous slice
+    without copying. Appending more values than fit grows the buffer.
+    """
+
+    def __init__(self, capacity, dtype=_np.float64):
+        self.capacity = max(int(capacity), 1)
+        self.dtype = dtype
+        self.data = _np.zeros(2*self.capacity, dtype=dtype)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        values = _np.asarray(values, dtype=self.dtype).ravel()
+        if self.size + len(values) > self.capacity:
+            self._grow(max(2*self.capacity, self.size + len(values)))
+        index = (self.start + self.size + _np.arange(len(values))) % self.capacity
+        self.data[index] = values
+        self.data[index + self.capacity] = values
+        self.size += len(values)
+
+    def drop(self, n_values):
+        # Remove the n_values oldest values
+        n_values = min(int(n_values), self.size)
+        self.start = (self.start + n_values) % self.capacity
+        self.size -= n_values
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+    def view(self):
+        # The values in order of insertion. Only valid until the next append
+        return self.data[self.start:self.start + self.size]
+
+    def first(self):
+        return self.data[self.start] if self.size else None
+
+    def last(self):
+        return self.data[self.start + self.size - 1] if self.size else None
+
+    def _grow(self, capacity):
+        values = self.view().copy()
+        self.capacity = capacity
+        self.data = _np.zeros(2*self.capacity, dtype=self.dtype)
+        self.start = 0
+        self.size = 0
+        self.append(values)
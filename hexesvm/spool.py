@@ -0,0 +1,212 @@
+"""Write-ahead spool for database rows which could not be written"""
+from datetime import datetime as _dt
+import glob
+import json
+import os
+import threading
+import time
+import sqlalchemy as _sql
+
+
+# Names of the DBAPI (PEP 249) errors raised if the database can not be reached
+CONNECTION_ERROR_NAMES = ("OperationalError", "InterfaceError")
+
+
+def is_connection_error(err):
+    # True for errors which go away once the database is reachable again.
+    # Other errors, e.g. a violated constraint, a value of the wrong type or
+    # a dropped column, are caused by the rows and repeat on every attempt
+    if isinstance(err, (_sql.exc.OperationalError, _sql.exc.InterfaceError)):
+        return True
+    if isinstance(err, _sql.exc.DBAPIError):
+        if err.connection_invalidated:
+            return True
+        err = err.orig
+    if isinstance(err, (_sql.exc.DisconnectionError, _sql.exc.TimeoutError, OSError)):
+        return True
+    # COPY bypasses SQLAlchemy, so the errors of the DBAPI module arrive as is
+    return any(cls.__name__ in CONNECTION_ERROR_NAMES for cls in type(err).__mro__)
+
+
+class SqlSpool():
+    """Append-only JSON-lines segment files holding database rows
+
+    Rows are appended to the current segment and fsynced in batches of
+    fsync_rows rows or after fsync_interval seconds. A segment is closed
+    once it holds segment_rows rows. replay() loads all segments into the
+    database and deletes them afterwards. Rows whose time is already in the
+    table are skipped, so a segment can safely be replayed twice. A segment
+    the database refuses for other reasons than a lost connection is renamed
+    to .bad and kept for inspection, so it does not block the others.
+    """
+
+    def __init__(self, directory, time_column="time", segment_rows=5000,
+                 fsync_rows=20, fsync_interval=5, time_columns=()):
+        self.directory = directory
+        self.time_column = time_column
+        # Further columns holding time stamps, e.g. the acquisition times
+        self.time_columns = tuple(time_columns)
+        self.segment_rows = segment_rows
+        self.fsync_rows = fsync_rows
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.segment_file = None
+        self.segment_name = None
+        self.segment_count = 0
+        self.unsynced_rows = 0
+        self.last_sync = time.monotonic()
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_skipped = 0
+        self.segments_quarantined = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segments(self):
+        # All segment files in chronological order
+        return sorted(glob.glob(os.path.join(self.directory, "spool_*.jsonl")))
+
+    def has_backlog(self):
+        return len(self.segments()) > 0
+
+    def append(self, rows):
+        with self.lock:
+            if self.segment_file is None:
+                self._open_segment()
+            for row in rows:
+                self.segment_file.write(self._encode_row(row)+"\n")
+            self.segment_count += len(rows)
+            self.unsynced_rows += len(rows)
+            self.rows_spooled += len(rows)
+            if (self.unsynced_rows >= self.fsync_rows or
+                    time.monotonic() - self.last_sync >= self.fsync_interval):
+                self._sync()
+            if self.segment_count >= self.segment_rows:
+                self._close_segment()
+
+    def sync(self):
+        with self.lock:
+            if self.segment_file is not None:
+                self._sync()
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+
+    def _open_segment(self):
+        self.segment_name = os.path.join(self.directory,
+            "spool_"+_dt.now().strftime("%Y%m%d_%H%M%S_%f")+".jsonl")
+        self.segment_file = open(self.segment_name, "a")
+        self.segment_count = 0
+
+    def _sync(self):
+        self.segment_file.flush()
+        os.fsync(self.segment_file.fileno())
+        self.unsynced_rows = 0
+        self.last_sync = time.monotonic()
+
+    def _close_segment(self):
+        if self.segment_file is None:
+            return
+        self._sync()
+        self.segment_file.close()
+        self.segment_file = None
+        self.segment_name = None
+
+    def _encode_row(self, row):
+        encoded = {}
+        for key, value in row.items():
+            if isinstance(value, _dt):
+                value = value.isoformat()
+            elif hasattr(value, "item"):
+                # numpy scalars
+                value = value.item()
+            encoded[key] = value
+        return json.dumps(encoded)
+
+    def _decode_row(self, line):
+        row = json.loads(line)
+        row[self.time_column] = _dt.fromisoformat(row[self.time_column])
+        # Only the configured columns, other strings stay strings even if
+        # they look like a time stamp
+        for key in self.time_columns:
+            if row.get(key) is not None:
+                row[key] = _dt.fromisoformat(row[key])
+        return row
+
+    def read_segment(self, segment_name):
+        rows = []
+        with open(segment_name) as segment_file:
+            for line in segment_file:
+                try:
+                    rows.append(self._decode_row(line))
+                except (ValueError, KeyError, TypeError):
+                    # e.g. the last line of a segment cut by a crash
+                    print("Skipping invalid line in "+segment_name)
+        return rows
+
+    def replay(self, sql_writer):
+        # Bulk load all segments into the database. Returns the number of
+        # inserted rows. Segments are only deleted after a successful load.
+        # Connection errors are raised and stop the replay
+        with self.lock:
+            self._close_segment()
+            segment_names = self.segments()
+        inserted = 0
+        for segment_name in segment_names:
+            rows = self.read_segment(segment_name)
+            try:
+                new_rows = self.remove_duplicates(sql_writer, rows)
+                # Rows with different columns (e.g. after a settings change) are
+                # inserted separately, as write_rows needs identical keys
+                by_columns = {}
+                for row in new_rows:
+                    by_columns.setdefault(tuple(row.keys()), []).append(row)
+                for column_rows in by_columns.values():
+                    sql_writer.write_rows(column_rows)
+            except Exception as err:
+                if is_connection_error(err):
+                    raise
+                self.quarantine(segment_name, err)
+                continue
+            os.remove(segment_name)
+            inserted += len(new_rows)
+            self.rows_replayed += len(new_rows)
+            self.rows_skipped += len(rows) - len(new_rows)
+            print("Replayed "+str(len(new_rows))+" of "+str(len(rows))+
+                  " spooled rows from "+segment_name)
+        return inserted
+
+    def quarantine(self, segment_name, err):
+        # Move a segment the database refuses out of the way of the replay
+        bad_name = segment_name[:-len(".jsonl")]+".bad"
+        os.replace(segment_name, bad_name)
+        self.segments_quarantined += 1
+        print("Spooled rows of "+segment_name+" refused by the database, moved to "+
+              bad_name+": "+str(err))
+        return bad_name
+
+    def remove_duplicates(self, sql_writer, rows):
+        # Drop rows whose time is already in the table or appears twice
+        if not rows:
+            return []
+        times = [row[self.time_column] for row in rows]
+        time_col = sql_writer.table.c[self.time_column]
+        query = _sql.select([time_col]).where(
+            _sql.and_(time_col >= min(times), time_col <= max(times)))
+        existing = set(self._naive(this_time) for (this_time,)
+                       in sql_writer.select(query))
+        new_rows = []
+        for row in rows:
+            if row[self.time_column] in existing:
+                continue
+            existing.add(row[self.time_column])
+            new_rows.append(row)
+        return new_rows
+
+    @staticmethod
+    def _naive(time_stamp):
+        # Time stamps with time zone are compared in local time, like the
+        # time stamps taken by the GUI
+        if isinstance(time_stamp, _dt) and time_stamp.tzinfo is not None:
+            return time_stamp.astimezone().replace(tzinfo=None)
+        return time_stamp
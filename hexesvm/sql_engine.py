@@ -0,0 +1,242 @@
+"""Shared, pooled database engines with reconnect and health monitoring"""
+import json
+import logging as _lg
+import os
+import threading
+import time
+import sqlalchemy as _sql
+
+
+# create module logger
+_engine_log = _lg.getLogger("hexesvm.sql_engine")
+_engine_log.setLevel(_lg.DEBUG)
+
+# One SqlEngine per database url, shared by all readers and writers
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Reflected table structures kept on disk, see set_schema_cache_file
+_schema_cache = None
+
+# Checksum over the column definitions of a table (PostgreSQL). Lengths,
+# precisions and scales are part of it, so e.g. VARCHAR(20) -> VARCHAR(40)
+# invalidates the cached structure
+SCHEMA_CHECKSUM_QUERY = _sql.text(
+    "SELECT md5(string_agg(column_name || ':' || data_type || ':' || is_nullable || ':' || "
+    "coalesce(character_maximum_length::text, '') || ':' || "
+    "coalesce(numeric_precision::text, '') || ':' || "
+    "coalesce(numeric_scale::text, ''), "
+    "',' ORDER BY ordinal_position)) FROM information_schema.columns "
+    "WHERE table_schema = current_schema() AND table_name = :tablename")
+
+# Type parameters stored with the cached columns
+TYPE_PARAMETERS = ("length", "precision", "scale")
+
+
+def make_url(dialect, address, dbname, username, password):
+    return "{:s}://{:s}:{:s}@{:s}/{:s}".format(dialect, username, password,
+                                               address, dbname)
+
+
+def set_schema_cache_file(filename):
+    """Keep reflected table structures in filename, None disables the cache"""
+    global _schema_cache
+    if filename is None:
+        _schema_cache = None
+    else:
+        _schema_cache = SchemaCache(filename)
+
+
+def get_engine(dialect, address, dbname, username, password):
+    """Return the shared SqlEngine of the database, create it if needed"""
+    url = make_url(dialect, address, dbname, username, password)
+    with _engines_lock:
+        if url not in _engines:
+            _engines[url] = SqlEngine(url)
+        return _engines[url]
+
+
+class SqlEngine():
+    """Pooled SQLAlchemy engine which recovers from a lost database
+
+    Connections are checked out of the pool for each access and tested
+    (pre-ping) before use, so connections broken by a server restart are
+    replaced transparently. Failed connection attempts are retried
+    max_retries times with exponential backoff. Reflected tables are kept,
+    so a reconnect does not reflect them again.
+    """
+
+    def __init__(self, url, max_retries=3, retry_delay=0.5, pool_size=5):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.engine = _sql.create_engine(url, server_side_cursors=True,
+                                         pool_pre_ping=True,
+                                         pool_size=pool_size,
+                                         max_overflow=pool_size,
+                                         pool_recycle=3600)
+        self.table_meta = _sql.MetaData()
+        self.tables = {}
+        self.tables_lock = threading.Lock()
+
+        # connection health
+        self.healthy = False
+        self.last_error = None
+        self.last_success = None
+        self.failed_attempts = 0
+        self.outages = 0
+
+        # Fail early, if the database can not be reached at all
+        self.connect().close()
+
+    def connect(self):
+        # Check out a connection from the pool
+        return self._checkout(self.engine.connect)
+
+    def raw_connection(self):
+        # DBAPI connection from the pool, close() returns it to the pool
+        return self._checkout(self.engine.raw_connection)
+
+    def _checkout(self, connect_function):
+        # Retry failed connection attempts with exponential backoff
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                conn = connect_function()
+            except _sql.exc.OperationalError as err:
+                self._connection_failed(err)
+                if attempt == self.max_retries:
+                    raise
+                _engine_log.warning("Database connection failed, retrying in "
+                                    "{:.1f} s".format(delay))
+                time.sleep(delay)
+                delay *= 2
+                continue
+            self._connection_succeeded()
+            return conn
+
+    def get_table(self, tablename):
+        # Reflect the table structure only once per engine
+        with self.tables_lock:
+            if tablename not in self.tables:
+                self.tables[tablename] = self._load_table(tablename)
+            return self.tables[tablename]
+
+    def _load_table(self, tablename):
+        # Use the cached structure if the columns of the table did not change
+        if _schema_cache is None:
+            return self.reflect_table(tablename)
+        checksum = self.schema_checksum(tablename)
+        if checksum is None:
+            return self.reflect_table(tablename)
+        key = _schema_cache.make_key(self.engine.url, tablename)
+        columns = _schema_cache.get(key, checksum)
+        if columns is not None:
+            _engine_log.debug("Using cached structure of table "+tablename)
+            return _sql.Table(tablename, self.table_meta,
+                              *[self._make_column(col) for col in columns])
+        table = self.reflect_table(tablename)
+        _schema_cache.put(key, checksum, [self._describe_column(col)
+                                          for col in table.columns])
+        return table
+
+    def reflect_table(self, tablename):
+        return _sql.Table(tablename, self.table_meta, autoload=True,
+                          autoload_with=self.engine)
+
+    def schema_checksum(self, tablename):
+        # Only available for PostgreSQL. None if the checksum can't be read
+        if self.engine.dialect.name != "postgresql":
+            return None
+        with self.connect() as conn:
+            return conn.execute(SCHEMA_CHECKSUM_QUERY, tablename=tablename).scalar()
+
+    def _describe_column(self, column):
+        try:
+            type_name = column.type.compile(dialect=self.engine.dialect)
+        except _sql.exc.CompileError:
+            type_name = ""
+        description = {"name": column.name, "type": type_name,
+                       "nullable": column.nullable, "primary_key": column.primary_key}
+        for parameter in TYPE_PARAMETERS:
+            description[parameter] = getattr(column.type, parameter, None)
+        return description
+
+    def _make_column(self, description):
+        # Rebuild the column type from its name and parameters, unknown types
+        # become NullType
+        type_name = description["type"].lower()
+        base_name = type_name.split("(")[0].strip()
+        type_class = self.engine.dialect.ischema_names.get(base_name)
+        if type_class is None:
+            # Compiled names like VARCHAR(20) are not catalog names
+            type_class = getattr(_sql.types, base_name.upper(), None)
+        arguments = {parameter: description[parameter] for parameter in TYPE_PARAMETERS
+                     if description.get(parameter) is not None}
+        if "with time zone" in type_name and "without" not in type_name:
+            arguments["timezone"] = True
+        if type_class is None:
+            column_type = _sql.types.NullType()
+        else:
+            try:
+                column_type = type_class(**arguments)
+            except TypeError:
+                # Parameters the type does not take
+                column_type = type_class()
+        return _sql.Column(description["name"], column_type,
+                           nullable=description["nullable"],
+                           primary_key=description["primary_key"])
+
+    def pool_status(self):
+        return self.engine.pool.status()
+
+    def _connection_failed(self, err):
+        if self.healthy:
+            self.outages += 1
+        self.healthy = False
+        self.last_error = str(err)
+        self.failed_attempts += 1
+
+    def _connection_succeeded(self):
+        self.healthy = True
+        self.last_error = None
+        self.last_success = time.time()
+
+
+class SchemaCache():
+    """Column definitions of reflected tables, stored in a json file
+
+    Every entry holds the catalog checksum of the table at the time of the
+    reflection and is only used as long as the checksum is unchanged.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(self.filename) as cache_file:
+                self.entries = json.load(cache_file)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print("Ignoring invalid schema cache file "+self.filename)
+
+    @staticmethod
+    def make_key(url, tablename):
+        return "|".join([url.drivername, str(url.host), str(url.port),
+                         str(url.database), tablename])
+
+    def get(self, key, checksum):
+        entry = self.entries.get(key)
+        if entry is None or entry["checksum"] != checksum:
+            return None
+        return entry["columns"]
+
+    def put(self, key, checksum, columns):
+        with self.lock:
+            self.entries[key] = {"checksum": checksum, "columns": columns}
+            # Replace the file at once, so it is never left half written
+            temp_filename = self.filename+".tmp"
+            with open(temp_filename, "w") as cache_file:
+                json.dump(self.entries, cache_file, indent=1)
+            os.replace(temp_filename, self.filename)
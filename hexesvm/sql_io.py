@@ -1,8 +1,12 @@
 """Defines functions/classes for SQL i/o"""
 from collections import OrderedDict as _OrderedDict
+from datetime import datetime as _dt
+from datetime import timedelta as _td
 import logging as _lg
 import numpy as _np
 import sqlalchemy as _sql
+from hexesvm import sql_engine as _eng
+from hexesvm import ring_buffer as _ring
 
 
 # create module logger
@@ -17,26 +21,20 @@ class SqlContainer():
     def __init__(self, dialect, address, dbname, tablename, username, password):
         SqlContainer.log.debug("Created SqlContainer instance")
         self.params = _OrderedDict()
-        self.prev_query_time = 0
+        # Raw time stamp of the newest row read by update_incremental
+        self.prev_query_time = None
 
-        # set up database access
-        sqlalch_url = "{:s}://{:s}:{:s}@{:s}/{:s}".format(dialect, username,
-                                                          password, address,
-                                                          dbname)
+        # set up database access, the engine is shared with other containers
         SqlContainer.log.info("Connecting to {:s} at {:s} as {:s}".format(dbname, address,
                                                              username))
-        self.engine = _sql.create_engine(sqlalch_url, server_side_cursors=True)
+        self.db = _eng.get_engine(dialect, address, dbname, username, password)
+        self.engine = self.db.engine
         SqlContainer.log.info("Connection established")
 
         # infer table structure
-        self.table_meta = _sql.MetaData()
-        self.table = _sql.Table(tablename, self.table_meta, autoload=True,
-                                autoload_with=self.engine)
+        self.table = self.db.get_table(tablename)
         self.cols = [col.name for col in self.table.columns]
 
-        # start connection
-        self.conn = self.engine.connect()
-
     def add_param(self, param_name):
         SqlContainer.log.debug("Called SqlContainer.add_param")
         self.params[param_name] = _np.zeros(1)
@@ -45,28 +43,171 @@ class SqlContainer():
         SqlContainer.log.debug("Called SqlContainer.remove_param")
         del self.params[param_name]
 
-    def update(self, time_param_name, time_start, time_end):
+    def update(self, time_param_name, time_start, time_end, bucket_seconds=None,
+               chunk_size=10000):
+        """Read the params between time_start and time_end
+
+        The rows are streamed in chunks of chunk_size rows into typed arrays:
+        times as float64 UNIX time stamps and the params as float32. Every
+        chunk is converted on arrival and the chunks are joined once at the
+        end, so the number of rows does not have to be known in advance.
+        If bucket_seconds is given, the rows are averaged in time buckets on
+        the server (PostgreSQL only). The minimum and maximum of each bucket
+        are stored in params_min and params_max then.
+        """
         SqlContainer.log.debug("Called SqlContainer.update")
-        params = [self.table.columns[time_param_name]]
-        params.extend([self.table.columns[param] for param in
-                       self.params.keys()])
-        sel = _sql.sql.select(params).where((self.table.columns[time_param_name] >=
-                                            time_start) &
-                                            (self.table.columns[time_param_name] <=
-                                            time_end))
-        result = self.conn.execute(sel)
-        data = _np.array(result.fetchall())
+        self.params_min = _OrderedDict()
+        self.params_max = _OrderedDict()
+        time_col = self.table.columns[time_param_name]
+        param_cols = [self.table.columns[param] for param in self.params.keys()]
+        in_range = (time_col >= time_start) & (time_col <= time_end)
+        server_epoch = self.engine.dialect.name == "postgresql"
+        if bucket_seconds and not server_epoch:
+            SqlContainer.log.warning("Downsampling is only supported for PostgreSQL")
+            bucket_seconds = None
+
+        with self.db.connect() as conn:
+            if bucket_seconds:
+                n_rows = self._read_buckets(conn, time_col, param_cols, in_range,
+                                            time_start, time_end, bucket_seconds,
+                                            chunk_size)
+            else:
+                n_rows = self._read_rows(conn, time_col, param_cols, in_range,
+                                         server_epoch, chunk_size)
 
-        SqlContainer.log.debug("Fetched {:d} rows".format(len(data)))
+        SqlContainer.log.debug("Fetched {:d} rows".format(n_rows))
 
-        if not len(data) > 0:
-            data = _np.zeros((1, len(params)))
+    def _read_rows(self, conn, time_col, param_cols, in_range, server_epoch,
+                   chunk_size):
+        if server_epoch:
+            time_expr = _sql.func.extract("epoch", time_col)
+        else:
+            time_expr = time_col
+        sel = _sql.sql.select([time_expr] + param_cols).where(in_range)\
+            .order_by(time_col)
+        times, value_blocks, n_read = self._fetch_chunks(
+            conn.execution_options(stream_results=True).execute(sel),
+            chunk_size, len(param_cols), 1, server_epoch)
+        self._store(times, value_blocks)
+        return n_read
 
-        self.times = data[:, 0].astype(_np.datetime64(1, "ms"))
+    def _read_buckets(self, conn, time_col, param_cols, in_range, time_start,
+                      time_end, bucket_seconds, chunk_size):
+        bucket = _sql.func.floor(_sql.func.extract("epoch", time_col) / bucket_seconds)
+        columns = [(bucket * bucket_seconds).label("bucket_time")]
+        for aggregate in (_sql.func.avg, _sql.func.min, _sql.func.max):
+            columns.extend([aggregate(col) for col in param_cols])
+        sel = _sql.sql.select(columns).where(in_range).group_by(bucket).order_by(bucket)
+        times, value_blocks, n_read = self._fetch_chunks(
+            conn.execution_options(stream_results=True).execute(sel),
+            chunk_size, len(param_cols), 3, True)
+        self._store(times, value_blocks)
+        return n_read
 
+    @staticmethod
+    def _convert_chunk(chunk, server_epoch):
+        # Split rows of (time, param, ...) into float64 UNIX times and values
+        if server_epoch:
+            data = _np.array(chunk, dtype=_np.float64).reshape(len(chunk), -1)
+            return data[:, 0], data[:, 1:]
         # convert to UNIX timestamp
-        self.times = ((self.times - _np.datetime64('1970-01-01T00:00:00Z')) /
-                      _np.timedelta64(1, "s"))
+        chunk_times = _np.array([row[0] for row in chunk], dtype="datetime64[ms]")
+        times = ((chunk_times - _np.datetime64('1970-01-01T00:00:00')) /
+                 _np.timedelta64(1, "s"))
+        data = _np.array([row[1:] for row in chunk], dtype=_np.float64).reshape(len(chunk), -1)
+        return times, data
+
+    def _fetch_chunks(self, result, chunk_size, n_params, n_blocks, server_epoch):
+        # Convert the result chunk by chunk and join the chunks once. Returns
+        # the times, n_blocks arrays of n_params columns each and the number
+        # of rows read
+        time_chunks = []
+        data_chunks = []
+        chunk = result.fetchmany(chunk_size)
+        while chunk:
+            chunk_times, data = self._convert_chunk(chunk, server_epoch)
+            time_chunks.append(chunk_times)
+            data_chunks.append(data.astype(_np.float32))
+            chunk = result.fetchmany(chunk_size)
+        result.close()
+        n_read = sum(len(chunk_times) for chunk_times in time_chunks)
+        if not time_chunks:
+            # One row of zeros, like an empty result always gave
+            time_chunks = [_np.zeros(1)]
+            data_chunks = [_np.zeros((1, n_params*n_blocks), dtype=_np.float32)]
+        times = _np.concatenate(time_chunks).astype(_np.float64)
+        # Column major, so the array of every param is contiguous
+        data = _np.asfortranarray(_np.concatenate(data_chunks))
+        return times, [data[:, n*n_params:(n+1)*n_params] for n in range(n_blocks)], n_read
+
+    def update_incremental(self, time_param_name, window_seconds, chunk_size=10000,
+                           now=None):
+        """Keep the last window_seconds of the params in ring buffers
+
+        The first call reads the whole window, every further call only the
+        rows newer than the last time stamp seen before. Rows older than
+        window_seconds before the time of the query (now, default the current
+        time) are evicted, so the window moves on even if no new rows arrive.
+        times and params are views of the ring buffers afterwards.
+        """
+        SqlContainer.log.debug("Called SqlContainer.update_incremental")
+        time_col = self.table.columns[time_param_name]
+        param_cols = [self.table.columns[param] for param in self.params.keys()]
+        server_epoch = self.engine.dialect.name == "postgresql"
+        # Start from scratch if the params changed
+        ring_key = (time_param_name, tuple(self.params.keys()))
+        if getattr(self, "ring_key", None) != ring_key:
+            self.ring_key = ring_key
+            self.ring_times = _ring.RingBuffer(chunk_size, _np.float64)
+            self.ring_params = _OrderedDict((param, _ring.RingBuffer(chunk_size, _np.float32))
+                                            for param in self.params.keys())
+            self.prev_query_time = None
+
+        if now is None:
+            now = _dt.now()
+        if self.prev_query_time is None:
+            time_start = now - _td(seconds=window_seconds)
+            in_range = time_col >= time_start
+        else:
+            in_range = time_col > self.prev_query_time
+        time_expr = _sql.func.extract("epoch", time_col) if server_epoch else time_col
+        # The raw time of the last row is kept for the next query
+        sel = _sql.sql.select([time_expr] + param_cols + [time_col.label("raw_time")])\
+            .where(in_range).order_by(time_col)
+
+        n_new = 0
+        with self.db.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(sel)
+            chunk = result.fetchmany(chunk_size)
+            while chunk:
+                times, data = self._convert_chunk([row[:-1] for row in chunk], server_epoch)
+                self.ring_times.append(times)
+                for n, ring in enumerate(self.ring_params.values()):
+                    ring.append(data[:, n])
+                self.prev_query_time = chunk[-1][-1]
+                n_new += len(chunk)
+                chunk = result.fetchmany(chunk_size)
+            result.close()
+
+        # Evict the rows which left the window. The times are UNIX time
+        # stamps of the naive time column, like in _convert_chunk
+        if len(self.ring_times):
+            times = self.ring_times.view()
+            query_time = (now - _dt(1970, 1, 1)).total_seconds()
+            n_old = _np.searchsorted(times, query_time - window_seconds)
+            self.ring_times.drop(n_old)
+            for ring in self.ring_params.values():
+                ring.drop(n_old)
+
+        self.times = self.ring_times.view()
+        for param_name, ring in self.ring_params.items():
+            self.params[param_name] = ring.view()
+        SqlContainer.log.debug("Fetched {:d} new rows".format(n_new))
+        return n_new
 
-        for n, param_name in enumerate(self.params.keys()):
-            self.params[param_name] = data[:, n+1].astype(_np.float32)
+    def _store(self, times, value_blocks):
+        self.times = times
+        targets = [self.params, self.params_min, self.params_max]
+        for target, block in zip(targets, value_blocks):
+            for n, param_name in enumerate(self.params.keys()):
+                target[param_name] = block[:, n]
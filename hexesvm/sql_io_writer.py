@@ -1,8 +1,15 @@
 """Defines functions/classes for SQL i/o"""
 from collections import OrderedDict as _OrderedDict
+import csv
+import io
 import logging as _lg
+import queue
+import threading
+import time
 import numpy as _np
 import sqlalchemy as _sql
+from PyQt5 import QtCore as _qc
+from hexesvm import sql_engine as _eng
 
 
 class SqlWriter():
@@ -11,25 +18,180 @@ class SqlWriter():
     def __init__(self, dialect, address, dbname, tablename, username, password):
         self.params = _OrderedDict()
         self.prev_query_time = 0
+        self.dialect = dialect
+        self.tablename = tablename
 
-        # set up database access
-        sqlalch_url = "{:s}://{:s}:{:s}@{:s}/{:s}".format(dialect, username,
-                                                          password, address,
-                                                          dbname)
-        self.engine = _sql.create_engine(sqlalch_url, server_side_cursors=True)
+        # set up database access, the engine is shared with other containers
+        self.db = _eng.get_engine(dialect, address, dbname, username, password)
+        self.engine = self.db.engine
 
         # infer table structure
-        self.table_meta = _sql.MetaData()
-        self.table = _sql.Table(tablename, self.table_meta, autoload=True,
-                                autoload_with=self.engine)
+        self.table = self.db.get_table(tablename)
         self.cols = [col.name for col in self.table.columns]
 
-        # start connection
-        self.conn = self.engine.connect()
 
-            
     def write_values(self, ordered_value):
         values = ordered_value
         insert = _sql.sql.insert(self.table, values)
-        result = self.conn.execute(insert)
-            
+        with self.db.connect() as conn:
+            result = conn.execute(insert)
+
+    def select(self, query):
+        with self.db.connect() as conn:
+            return conn.execute(query).fetchall()
+
+    def write_rows(self, rows):
+        # Insert several rows at once. All rows need to have the same keys
+        if not rows:
+            return 0
+        if self.dialect.startswith("postgresql"):
+            self.copy_rows(rows)
+        else:
+            with self.db.connect() as conn:
+                conn.execute(self.table.insert(), rows)
+        return len(rows)
+
+    def copy_rows(self, rows):
+        # Bulk load the rows with COPY ... FROM STDIN (PostgreSQL only)
+        columns = list(rows[0].keys())
+        buffer = io.StringIO()
+        csv_writer = csv.writer(buffer)
+        for row in rows:
+            csv_writer.writerow([self._copy_value(row[col]) for col in columns])
+        buffer.seek(0)
+        copy_command = "COPY {:s} ({:s}) FROM STDIN WITH CSV".format(
+            self.tablename, ", ".join('"'+col+'"' for col in columns))
+        with self.db.connect() as conn:
+            with conn.begin():
+                cursor = conn.connection.cursor()
+                try:
+                    cursor.copy_expert(copy_command, buffer)
+                finally:
+                    cursor.close()
+
+    @staticmethod
+    def _copy_value(value):
+        # An empty unquoted field is read as NULL by COPY
+        if value is None:
+            return None
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return value
+
+
+class BufferedSqlWriter(_qc.QThread):
+    """Writes rows to the database in a background thread
+
+    Rows are collected in a bounded queue and inserted in batches once
+    batch_size rows are waiting or flush_interval seconds have passed. If the
+    queue is full, new rows are refused and counted as dropped, so a slow
+    database never blocks the caller. Rows which could not be written are
+    appended to the spool, if one is set, and replayed after the next
+    successful flush.
+    """
+
+    def __init__(self, sql_writer, batch_size=50, flush_interval=5,
+                 max_queue_size=10000, spool=None):
+        _qc.QThread.__init__(self)
+        self.sql_writer = sql_writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.row_queue = queue.Queue(maxsize=max_queue_size)
+        self.stop_event = threading.Event()
+        # COPY bypasses SQLAlchemy, so also the errors of the DBAPI are caught
+        self.write_errors = (_sql.exc.SQLAlchemyError, OSError)
+        dbapi = sql_writer.engine.dialect.dbapi
+        if dbapi is not None and hasattr(dbapi, "Error"):
+            self.write_errors += (dbapi.Error,)
+
+        # Back pressure and health monitoring
+        self.healthy = True
+        self.last_error = None
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.flushes = 0
+        self.last_flush_duration = 0.
+        self.max_flush_duration = 0.
+        self.last_flush_time = None
+
+    def put(self, row):
+        # Queue a row for insertion. Returns False if the queue is full
+        try:
+            self.row_queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.max_depth = max(self.max_depth, self.row_queue.qsize())
+        return True
+
+    def depth(self):
+        return self.row_queue.qsize()
+
+    def run(self):
+        self.stop_event.clear()
+        batch = []
+        flush_deadline = time.monotonic() + self.flush_interval
+        while not self.stop_event.is_set():
+            try:
+                # Wake up at least once a second to react on stop requests
+                batch.append(self.row_queue.get(
+                    timeout=min(max(flush_deadline - time.monotonic(), 0.), 1.)))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.batch_size or time.monotonic() >= flush_deadline:
+                self.flush(batch)
+                batch = []
+                flush_deadline = time.monotonic() + self.flush_interval
+        # Write what is left before the thread ends
+        while True:
+            try:
+                batch.append(self.row_queue.get_nowait())
+            except queue.Empty:
+                break
+        self.flush(batch)
+        if self.spool is not None:
+            self.spool.close()
+
+    def flush(self, rows):
+        if not rows:
+            return True
+        t_start = time.monotonic()
+        try:
+            self.sql_writer.write_rows(rows)
+        except self.write_errors as err:
+            print("Could not write "+str(len(rows))+" rows to the database: "+str(err))
+            self.healthy = False
+            self.last_error = str(err)
+            self.rows_failed += len(rows)
+            if self.spool is not None:
+                self.spool.append(rows)
+            return False
+        self.last_flush_duration = time.monotonic() - t_start
+        self.max_flush_duration = max(self.max_flush_duration, self.last_flush_duration)
+        self.last_flush_time = time.time()
+        self.rows_written += len(rows)
+        self.flushes += 1
+        self.healthy = True
+        self.last_error = None
+        if self.spool is not None and self.spool.has_backlog():
+            self.replay_spool()
+        return True
+
+    def replay_spool(self):
+        # Load the rows spooled during a database outage. Segments with
+        # invalid rows are quarantined by the spool, only connection errors
+        # get here and leave the rest of the spool for the next attempt
+        try:
+            self.spool.replay(self.sql_writer)
+        except self.write_errors as err:
+            print("Could not replay spooled rows: "+str(err))
+            self.healthy = False
+            self.last_error = str(err)
+            return False
+        return True
+
+    def stop(self):
+        self.stop_event.set()
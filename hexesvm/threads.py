@@ -1,6 +1,8 @@
 from PyQt5 import QtCore as _qc
 from PyQt5 import QtGui as _qg
 #from hexesvm import iSeg_tools as _iseg
+from hexesvm import poll_scheduler as _sched
+import threading
 import time
 import pandas as _pd
 import numpy as _np
@@ -12,95 +14,117 @@ class MonitorIsegModule(_qc.QThread):
         _qc.QThread.__init__(self)
         self.module = hv_module
         self.stop_looping = False
-        self.module.stop_thread = False
-
+        self.module.reset_stop_request()
+        self.scheduler = None
+        # Time at which a channel last required fast polling
+        self.fast_poll_since = {}
+        # Longest idle time between two checks of the connection state
+        self.max_idle_time = 1
         
     def run(self):
         # This functino is meant to be run in a thread
-        n_read_all = 5
-        i = n_read_all
-        
-        while self.module.board_occupied:
+        # Wait for the board to be free, unless we are asked to stop meanwhile
+        while not self.module.acquire_board(self.max_idle_time):
             if self.module.stop_thread:
-                self.stop()
-                break
-            time.sleep(0.2)
+                self.stop_looping = True
+                self.module.reader_thread = None
+                return
           
-        self.module.board_occupied = True
+        # From now on, this thread executes all commands sent to the module
+        self.module.command_queue.set_owner(threading.get_ident())
         self.stop_looping = False
+        try:
+            self.scheduler = self.build_scheduler()
+            self.monitor_loop()
+        finally:
+            if not self.stop_looping:
+                self.stop()
+        return
+
+    def monitor_loop(self):
         while not self.stop_looping:
-            #print(self.module.board_occupied, self.stop_looping, self.module.stop_thread)
+            if self.module.stop_thread:
+                self.stop()
+                break
+            self.module.command_queue.execute_pending()
             if not self.module.is_connected:
-                time.sleep(1)
+                self.module.command_queue.wait(1, self.module.stop_event)
                 continue
-            for channel in self.module.child_channels:
-                # make the channel to update its voltage and current information
-                if self.module.stop_thread:
-                    self.stop()
-                    break
-                channel.read_voltage()
-                if self.module.stop_thread:
-                    self.stop()              
-                    break
-                channel.read_current()
-                # Check if current and voltage still fit the expectation
-                channel.check_software_trip()
-                
-                # if this was the n_read_all th iteration read all other info
-                if i >= n_read_all:
-                    if self.module.stop_thread:
-                        self.stop()         
-                        break                
-                    channel.read_set_voltage()
-                    if self.module.stop_thread:
-                        self.stop()         
-                        break                
-                    channel.read_ramp_speed()
-                    if self.module.stop_thread:
-                        self.stop()   
-                        break
-
-                    if channel.module.type == "NHQ":
-                        channel.read_status()                                 
-                        
-                    if self.module.stop_thread:
-                        self.stop()         
-                        break  
-                    channel.read_voltage_limit()
-                    if self.module.stop_thread:
-                        self.stop()         
-                        break                
-                    channel.read_current_limit()
-                    if self.module.stop_thread:
-                        self.stop()         
-                        break                
-
-                    if channel.module.type == "NHQ":    
-                        channel.read_trip_current()
-                        
-                    if self.module.stop_thread:
-                        self.stop()      
-                        break
-                    channel.read_device_status()
-                    if self.module.stop_thread:
-                        self.stop()
-                        break
-                        
-                    if channel.module.type == "NHQ":
-                        channel.read_auto_start()
-                        
-            if i >= n_read_all:
-                i = 0
-            i+=1    
-        return
+            now = time.monotonic()
+            due = self.scheduler.pop_due(now)
+            if not due:
+                wait_time = self.scheduler.time_to_next(now)
+                if wait_time is None or wait_time > self.max_idle_time:
+                    wait_time = self.max_idle_time
+                # Returns early if a command is queued or a stop is requested
+                self.module.command_queue.wait(wait_time, self.module.stop_event)
+                continue
+            done = self.module.poll_tasks(due)
+            now = time.monotonic()
+            self.scheduler.reschedule(due, now)
+            for task in done:
+                if task.quantity == "current":
+                    # Check if current and voltage still fit the expectation
+                    task.channel.check_software_trip()
+            for channel in set(task.channel for task in done):
+                channel.record_history(channel.publish_snapshot())
+                self.update_fast_polling(channel, now)
+
+    def update_fast_polling(self, channel, now):
+        # Poll a channel faster while it is ramping or a spark is suspected,
+        # and fall back to the normal rates once it was stable for a while
+        if channel.needs_fast_polling():
+            self.fast_poll_since[channel] = now
+            if not channel.fast_polling:
+                channel.fast_polling = True
+                for quantity, interval in channel.fast_poll_intervals.items():
+                    if interval and interval < channel.poll_intervals.get(quantity, 0):
+                        self.scheduler.set_interval(channel, quantity, interval)
+        elif channel.fast_polling:
+            if now - self.fast_poll_since.get(channel, 0) > channel.fast_poll_hold:
+                channel.fast_polling = False
+                for quantity in channel.fast_poll_intervals.keys():
+                    interval = channel.poll_intervals.get(quantity)
+                    if interval:
+                        self.scheduler.set_interval(channel, quantity, interval)
+
+    def build_scheduler(self):
+        # One read-out task per channel and quantity with the configured interval
+        scheduler = _sched.PollScheduler()
+        now = time.monotonic()
+        for channel in self.module.child_channels:
+            for quantity in channel.poll_methods.keys():
+                interval = channel.poll_intervals.get(quantity)
+                if not interval:
+                    continue
+                scheduler.add_task(_sched.PollTask(channel, quantity, interval), now)
+        return scheduler
             
     def stop(self):
-        self.module.board_occupied = False
         self.stop_looping = True
         self.module.reader_thread = None
+        # Commands queued before the owner is cleared are still executed here,
+        # later ones are executed by their caller after the board is released
+        self.module.command_queue.clear_owner()
+        self.module.command_queue.execute_pending()
+        self.module.release_board()
         #self.terminate()
         return
 
+class LoadTrendHistory(_qc.QThread):
+
+    # Emitted with the result of read_function
+    history_loaded = _qc.pyqtSignal('PyQt_PyObject')
+
+    def __init__(self, read_function):
+        _qc.QThread.__init__(self)
+        self.read_function = read_function
+
+    def run(self):
+        # The database query runs here, so the GUI keeps responding
+        self.history_loaded.emit(self.read_function())
+
+
 class ScheduleRampIsegModule(_qc.QThread):
 
     ramp_hv = _qc.pyqtSignal('PyQt_PyObject', 'PyQt_PyObject')
@@ -114,6 +138,11 @@ class ScheduleRampIsegModule(_qc.QThread):
         self.is_running = False
         self.performing_step = False
         self.stop_signal = False
+        # Wakes the thread from its waits when stopping
+        self.stop_event = threading.Event()
+        # Set whenever no ramp step is being performed
+        self.step_idle = threading.Event()
+        self.step_idle.set()
         
         
     def run(self):
@@ -124,7 +153,8 @@ class ScheduleRampIsegModule(_qc.QThread):
             self.rampTableCurrentIndex = 0
 
             for i in range(self.gui.rampTable.rowCount()):
-                time.sleep((float(self.gui.rampTable.item(self.rampTableCurrentIndex,0).text())*60.))
+                if self.stop_event.wait((float(self.gui.rampTable.item(self.rampTableCurrentIndex,0).text())*60.)):
+                    break
                 self.ramp_schedule_step()
             #self.gui.stop_ramp_schedule()
             
@@ -138,7 +168,7 @@ class ScheduleRampIsegModule(_qc.QThread):
             return
         if self.stop_signal:
             return
-        self.performing_step = True
+        self.set_performing_step(True)
         # we now need to proceed changing/ramping a new row from the table!
         voltages = []
         speeds = []
@@ -156,7 +186,7 @@ class ScheduleRampIsegModule(_qc.QThread):
             
         for i in range(len(self.gui.channel_order_dict)):
             if self.stop_signal:
-                self.performing_step = False
+                self.set_performing_step(False)
                 return
             module_key = self.gui.channel_order_dict[i][0]
             channel_key = self.gui.channel_order_dict[i][1]
@@ -166,7 +196,7 @@ class ScheduleRampIsegModule(_qc.QThread):
             this_channel = self.gui.channels[module_key][channel_key]        
 
             if self.new_values_taken(this_channel, voltages[i], speeds[i]):
-                if not this_channel.hv_switch_off:
+                if not this_channel.snapshot.hv_switch_off:
                     continue
 
             channels_needing_change.append(i)
@@ -178,7 +208,7 @@ class ScheduleRampIsegModule(_qc.QThread):
             idx = 0
             while not self.new_values_taken(this_channel, voltages[i], speeds[i]):
                 if self.stop_signal:
-                    self.performing_step = False
+                    self.set_performing_step(False)
                     return
                 if idx == 35:
                     # Try to re-eimit the signal once
@@ -187,20 +217,20 @@ class ScheduleRampIsegModule(_qc.QThread):
 
                 if idx > 50:
                     # Channel was not able to accept the set values within 20 sec. Abort!
-                    self.performing_step = False
+                    self.set_performing_step(False)
                     self.gui.stop_ramp_schedule()
                     return 
-                print(self.gui.channels[module_key][channel_key].set_voltage, float(voltages[i]))
-                print(self.gui.channels[module_key][channel_key].ramp_speed, float(speeds[i]))
+                print(this_channel.snapshot.set_voltage, float(voltages[i]))
+                print(this_channel.snapshot.ramp_speed, float(speeds[i]))
                 print("Waiting for channel to change")
-                time.sleep(0.75757575757575)
+                self.stop_event.wait(0.75757575757575)
                 idx += 1 
             print("settings applied")              
             #time.sleep(2)
 
         for i in channels_needing_change:
             if self.stop_signal:
-                self.performing_step = False
+                self.set_performing_step(False)
                 return
                 
             module_key = self.gui.channel_order_dict[i][0]
@@ -215,7 +245,7 @@ class ScheduleRampIsegModule(_qc.QThread):
 
         # post ramp actions
         self.rampTableCurrentIndex += 1
-        self.performing_step = False
+        self.set_performing_step(False)
         return
 
     
@@ -223,23 +253,32 @@ class ScheduleRampIsegModule(_qc.QThread):
     
         #self.rampTableTimer.stop()
         self.stop_signal = True
-        #check if the thing is currently performing a step
-        while self.performing_step:
-            time.sleep(0.2)
+        self.stop_event.set()
+        #wait if the thing is currently performing a step
+        self.step_idle.wait()
         self.is_running = False
         return
+
+    def set_performing_step(self, performing):
+        self.performing_step = performing
+        if performing:
+            self.step_idle.clear()
+        else:
+            self.step_idle.set()
             
     def new_values_taken(self, channel, voltage, speed):
+        # Compare with one consistent read-out of the channel
+        state = channel.snapshot
         channel_polarity_switchable = channel.module.polarity_switchable
         if channel_polarity_switchable:
-            voltage_taken = _np.round(channel.set_voltage,2) == _np.round(float(voltage),2)
+            voltage_taken = _np.round(state.set_voltage,2) == _np.round(float(voltage),2)
         else:
-            voltage_taken = _np.round(channel.set_voltage,2) == _np.round(abs(float(voltage)),2)
-        speed_taken = channel.ramp_speed == float(speed)
+            voltage_taken = _np.round(state.set_voltage,2) == _np.round(abs(float(voltage)),2)
+        speed_taken = state.ramp_speed == float(speed)
 
         if voltage == 0:
             polarity_taken = True
         else:
-            polarity_taken = not _np.logical_xor(channel.polarity_positive, voltage > 0)
+            polarity_taken = not _np.logical_xor(state.polarity_positive, voltage > 0)
         return voltage_taken and speed_taken and polarity_taken
             
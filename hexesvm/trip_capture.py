@@ -0,0 +1,131 @@
+"""Capture of the read-outs of all channels around an HV trip"""
+import json
+import os
+import threading
+import time
+import numpy as _np
+from hexesvm import history as _hist
+
+
+class TripCapture():
+    # A trip waiting for its post-trigger samples
+
+    def __init__(self, channel, reason, snapshot, pre_seconds, post_seconds):
+        self.channel = channel
+        self.reason = reason
+        self.snapshot = snapshot
+        self.t_start = snapshot.t_mono - pre_seconds
+        self.t_end = snapshot.t_mono + post_seconds
+        self.filename = None
+        self.metadata = {"channel": channel.name,
+                         "module": channel.module.name,
+                         "reason": reason,
+                         "trip_time": snapshot.t_wall,
+                         "trip_time_string": time.strftime("%Y-%m-%d %H:%M:%S",
+                                                           time.localtime(snapshot.t_wall)),
+                         "pre_seconds": pre_seconds,
+                         "post_seconds": post_seconds,
+                         "voltage": snapshot.voltage,
+                         "current": snapshot.current,
+                         "set_voltage": snapshot.set_voltage,
+                         "status": _hist.encode_status(snapshot),
+                         "status_flags": {name: bool(getattr(snapshot, name))
+                                          for name in _hist.STATUS_BITS}}
+
+
+class TripRecorder():
+    """Saves the history of all channels from pre_seconds before to
+    post_seconds after a trip
+
+    The samples are taken from the channel histories, which the reader
+    threads keep filling, so nothing has to be recorded in advance. The time
+    resolution of a capture is thus the poll rate of the channels: a trip
+    channel is switched to its fast poll intervals while its capture is
+    recording, the samples before the trip have the rate polled then. A trip is
+    reported with trigger() by the software trip detection, hardware trips
+    are found by check_hardware_trip() from the reader threads. poll() saves
+    the captures whose post-trigger time has passed, each as one compressed
+    .npz file holding the columns of all channels and the trip metadata.
+    """
+
+    def __init__(self, directory, channels, pre_seconds=30, post_seconds=10):
+        self.directory = directory
+        self.channels = channels
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.lock = threading.Lock()
+        self.pending = []
+        self.hardware_tripped = {}
+        self.captures_saved = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def trigger(self, channel, reason, snapshot=None):
+        # Start a capture, unless one for this channel is still recording
+        with self.lock:
+            for capture in self.pending:
+                if capture.channel is channel:
+                    return False
+            if snapshot is None:
+                snapshot = channel.snapshot
+            self.pending.append(TripCapture(channel, reason, snapshot,
+                                            self.pre_seconds, self.post_seconds))
+        return True
+
+    def is_recording(self, channel):
+        # A capture triggered by channel waits for its post-trigger samples
+        with self.lock:
+            return any(capture.channel is channel for capture in self.pending)
+
+    def check_hardware_trip(self, channel, snapshot):
+        # Trigger on the rising edge of the trip bit of the module. The first
+        # status read-out only sets the state, an earlier trip is no new one
+        if snapshot.channel_is_tripped is None:
+            return
+        tripped = bool(snapshot.channel_is_tripped)
+        if tripped and self.hardware_tripped.get(channel) is False:
+            self.trigger(channel, "hardware", snapshot)
+        self.hardware_tripped[channel] = tripped
+
+    def poll(self, now=None):
+        # Save the finished captures and return them
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            done = [capture for capture in self.pending if capture.t_end <= now]
+            self.pending = [capture for capture in self.pending if capture.t_end > now]
+        for capture in done:
+            try:
+                self.save(capture)
+            except OSError as err:
+                print("Could not save trip capture of "+capture.channel.name+": "+str(err))
+        return [capture for capture in done if capture.filename is not None]
+
+    def save(self, capture):
+        arrays = {}
+        for channel in self.channels:
+            samples = channel.history.between(capture.t_start, capture.t_end, clock="t_mono")
+            for column, values in samples.items():
+                arrays[channel.archive_key+"/"+column] = values
+        capture.metadata["channels"] = [channel.archive_key for channel in self.channels]
+        capture.metadata["trigger_channel"] = capture.channel.archive_key
+        arrays["metadata"] = _np.array(json.dumps(capture.metadata))
+        filename = os.path.join(self.directory, "trip_"+time.strftime(
+            "%Y%m%d_%H%M%S", time.localtime(capture.snapshot.t_wall))+
+            "_"+capture.channel.archive_key+".npz")
+        _np.savez_compressed(filename, **arrays)
+        capture.filename = filename
+        self.captures_saved += 1
+        return filename
+
+
+def load_capture(filename):
+    # (metadata, {channel key: {column: array}}) of a saved capture
+    with _np.load(filename) as capture_file:
+        metadata = json.loads(str(capture_file["metadata"]))
+        channels = {}
+        for name in capture_file.files:
+            if name == "metadata":
+                continue
+            key, column = name.split("/")
+            channels.setdefault(key, {})[column] = capture_file[name]
+    return metadata, channels
@@ -0,0 +1,98 @@
+"""Persistent record of the trip times of a channel"""
+import bisect
+import json
+import os
+import threading
+import time
+
+
+class TripEventStore():
+    """Sorted trip times with counting by bisection
+
+    Counting the trips since a time costs O(log n). Trips older than max_age
+    seconds are dropped. If a filename is given, every trip is appended to it
+    as a JSON line and the trips are loaded again on start, so trip rates and
+    the frequent trip detection continue after a restart.
+    """
+
+    def __init__(self, filename=None, max_age=7*24*3600):
+        self.filename = filename
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.times = []
+        if self.filename is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self.times)
+
+    def add(self, trip_time=None):
+        if trip_time is None:
+            trip_time = time.time()
+        with self.lock:
+            if not self.times or trip_time >= self.times[-1]:
+                self.times.append(trip_time)
+            else:
+                bisect.insort(self.times, trip_time)
+            if self.filename is not None:
+                try:
+                    with open(self.filename, "a") as log_file:
+                        log_file.write(json.dumps({"time": trip_time})+"\n")
+                except OSError as err:
+                    print("Could not write trip log "+self.filename+": "+str(err))
+            self._expire(trip_time)
+
+    def count_since(self, start_time):
+        with self.lock:
+            return len(self.times) - bisect.bisect_left(self.times, start_time)
+
+    def count_last(self, seconds, now=None):
+        # Trips within the last seconds
+        if now is None:
+            now = time.time()
+        return self.count_since(now - seconds)
+
+    def last(self, n_back=1):
+        # Time of the latest trip (n_back=1), the one before (2), ... or None
+        with self.lock:
+            if len(self.times) < n_back:
+                return None
+            return self.times[-n_back]
+
+    def _expire(self, now):
+        n_old = bisect.bisect_left(self.times, now - self.max_age)
+        if n_old:
+            del self.times[:n_old]
+            # Keep the file about as short as the list
+            if self.filename is not None and n_old > len(self.times):
+                self._rewrite()
+
+    def _load(self):
+        try:
+            with open(self.filename) as log_file:
+                for line in log_file:
+                    try:
+                        self.times.append(float(json.loads(line)["time"]))
+                    except (ValueError, KeyError, TypeError):
+                        print("Skipping invalid line in "+self.filename)
+        except FileNotFoundError:
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return
+        self.times.sort()
+        n_loaded = len(self.times)
+        self._expire(time.time())
+        if len(self.times) != n_loaded:
+            self._rewrite()
+
+    def _rewrite(self):
+        # Replace the file at once, so it is never left half written
+        temp_filename = self.filename+".tmp"
+        try:
+            with open(temp_filename, "w") as log_file:
+                for trip_time in self.times:
+                    log_file.write(json.dumps({"time": trip_time})+"\n")
+            os.replace(temp_filename, self.filename)
+        except OSError as err:
+            print("Could not write trip log "+self.filename+": "+str(err))
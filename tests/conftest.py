@@ -0,0 +1,80 @@
+import pytest
+from hexesvm import channel_state as state
+
+
+@pytest.fixture
+def iseg(monkeypatch):
+    # The iSeg tools with the default settings
+    from hexesvm import iSeg_tools as iseg
+    # No trip log files from the tests
+    monkeypatch.setitem(iseg.defs, "trip_log_directory", None)
+    return iseg
+
+
+@pytest.fixture
+def nhq_channel(iseg):
+    # Factory of channel A of the first NHQ module of the default settings,
+    # channel_settings override the settings of the channel
+    def make(high_precision=True, **channel_settings):
+        module_settings = dict(iseg.defs["modules"][0], is_high_precission=high_precision)
+        module = iseg.nhq_hv_module("NHQ", "COM1", module_settings)
+        return module.add_channel(1, "A", dict(module_settings["channels"][0], **channel_settings))
+    return make
+
+
+@pytest.fixture
+def nhr_channels(iseg):
+    # Factory of all channels of the NHR module of the default settings
+    def make():
+        module_settings = [module for module in iseg.defs["modules"] if module["type"] == "NHR"][0]
+        module = iseg.nhr_hv_module("NHR", "COM3", module_settings)
+        return [module.add_channel(number, this_channel["name"], this_channel)
+                for number, this_channel in enumerate(module_settings["channels"])]
+    return make
+
+
+@pytest.fixture
+def script_module():
+    # Replace send_long_command of a module by the answers of a dict, None
+    # for commands not listed. Returns the list of the sent commands
+    def script(module, answers):
+        sent = []
+
+        def send_long_command(command):
+            sent.append(command)
+            return answers.get(command)
+        module.send_long_command = send_long_command
+        module.is_connected = True
+        return sent
+    return script
+
+
+@pytest.fixture
+def snapshot():
+    # Factory of channel snapshots, the state fields are 0 or False unless given
+    def make(t_mono=0., t_wall=None, seq=0, **values):
+        fields = dict.fromkeys(state.STATE_FIELDS, False)
+        fields.update(voltage=1., current=0., set_voltage=0., ramp_speed=0.)
+        fields.update(values)
+        if t_wall is None:
+            t_wall = 1000. + t_mono
+        return state.ChannelSnapshot(seq, t_mono, t_wall, **fields)
+    return make
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    # Shared engines on the SQLite file tmp_path/sc instead of a PostgreSQL
+    # server, for any address, user and password. Returns a plain engine
+    import sqlalchemy
+    from hexesvm import sql_engine
+    create_sqlite_engine = sqlalchemy.create_engine
+
+    def create_engine(url, **kwargs):
+        # SQLite takes neither credentials nor the pool arguments of SqlEngine
+        database = sqlalchemy.engine.url.make_url(url).database
+        return create_sqlite_engine("sqlite:///"+str(tmp_path / database))
+    monkeypatch.setattr(sql_engine._sql, "create_engine", create_engine)
+    monkeypatch.setattr(sql_engine, "_engines", {})
+    monkeypatch.setattr(sql_engine, "_schema_cache", None)
+    return create_engine("sqlite://u:p@/sc")
@@ -0,0 +1,73 @@
+from datetime import datetime
+import numpy as np
+from hexesvm import archive
+from hexesvm import history as hist
+
+T_DAY = datetime(2026, 3, 4, 12).timestamp()
+
+
+def test_channel_key():
+    assert archive.channel_key("PMT module", "Top/PMT") == "PMT_module__Top_PMT"
+
+
+def test_append_and_read(tmp_path, snapshot):
+    writer = archive.ArchiveWriter(str(tmp_path), block_records=4)
+    for n in range(10):
+        writer.append("a", snapshot(n, T_DAY + n, voltage=n, channel_is_tripped=n == 3))
+    # Snapshots without a read-out yet are not archived
+    writer.append("a", snapshot(10, float("nan")))
+    writer.flush()
+    assert writer.records_written == 10
+    reader = archive.ArchiveReader(str(tmp_path))
+    day = archive.day_of(T_DAY)
+    assert reader.days() == [day]
+    assert reader.channels(day) == ["a"]
+    values = reader.read_day("a", day)
+    np.testing.assert_array_equal(values["voltage"], np.arange(10.))
+    np.testing.assert_array_equal(hist.status_flag(values["status"], "channel_is_tripped"),
+                                  np.arange(10) == 3)
+    # Time ranges are inclusive
+    segments = reader.read("a", T_DAY + 2, T_DAY + 4)
+    assert len(segments) == 1
+    np.testing.assert_array_equal(segments[0]["t_wall"], T_DAY + np.arange(2., 5.))
+    assert reader.read_day("b", day) is None
+
+
+def test_reopen_and_append(tmp_path, snapshot):
+    writer = archive.ArchiveWriter(str(tmp_path), block_records=4)
+    for n in range(6):
+        writer.append("a", snapshot(n, T_DAY + n, voltage=n))
+    writer.close()
+    # A new writer, e.g. after a restart, continues after the valid records
+    writer = archive.ArchiveWriter(str(tmp_path), block_records=4)
+    for n in range(6, 11):
+        writer.append("a", snapshot(n, T_DAY + n, voltage=n))
+    writer.close()
+    values = archive.ArchiveReader(str(tmp_path)).read_day("a", archive.day_of(T_DAY))
+    np.testing.assert_array_equal(values["voltage"], np.arange(11.))
+    np.testing.assert_array_equal(values["t_wall"], T_DAY + np.arange(11.))
+
+
+def test_read_while_writing(tmp_path, snapshot):
+    writer = archive.ArchiveWriter(str(tmp_path), block_records=4)
+    reader = archive.ArchiveReader(str(tmp_path))
+    day = archive.day_of(T_DAY)
+    writer.append("a", snapshot(0, T_DAY))
+    writer.flush()
+    assert len(reader.read_day("a", day)["t_wall"]) == 1
+    # The preallocated, not yet written records are not visible
+    for n in range(1, 6):
+        writer.append("a", snapshot(n, T_DAY + n))
+    writer.flush()
+    assert len(reader.read_day("a", day)["t_wall"]) == 6
+
+
+def test_new_day(tmp_path, snapshot):
+    writer = archive.ArchiveWriter(str(tmp_path))
+    writer.append("a", snapshot(0, T_DAY))
+    writer.append("a", snapshot(1, T_DAY + 24*3600))
+    writer.close()
+    reader = archive.ArchiveReader(str(tmp_path))
+    assert len(reader.days()) == 2
+    segments = reader.read("a", T_DAY - 1, T_DAY + 24*3600 + 1)
+    assert [len(segment["t_wall"]) for segment in segments] == [1, 1]
@@ -0,0 +1,70 @@
+import math
+from hexesvm import archive
+from hexesvm import channel_state as state
+
+
+class Channel():
+    pass
+
+
+def test_take_snapshot_copies_the_state():
+    channel = Channel()
+    for field in state.STATE_FIELDS:
+        setattr(channel, field, float("nan"))
+    channel.voltage = 100.
+    channel.status = "ON"
+    snapshot = state.take_snapshot(channel, 3)
+    channel.voltage = 200.
+    assert snapshot.seq == 3
+    assert snapshot.voltage == 100. and snapshot.status == "ON"
+    assert math.isnan(snapshot.current)
+    assert snapshot.t_mono > 0 and snapshot.t_wall > 0
+    assert snapshot._fields[3:] == state.STATE_FIELDS
+
+
+def test_published_snapshots_are_consistent(nhq_channel):
+    channel = nhq_channel()
+    first = channel.snapshot
+    channel.voltage = 5.
+    channel.current = 1e-9
+    # Readers see the old state until it is published
+    assert channel.snapshot is first
+    published = channel.publish_snapshot()
+    assert channel.snapshot is published
+    assert published.seq == first.seq + 1
+    assert (published.voltage, published.current) == (5., 1e-9)
+
+
+def test_only_new_readings_are_recorded(nhq_channel, tmp_path):
+    channel = nhq_channel()
+    channel.module.set_archive(archive.ArchiveWriter(str(tmp_path)))
+    channel.voltage = 5.
+    channel.set_voltage = 0.
+    channel.stamp_acquisition("voltage", (10., 1e9 + 10.))
+    channel.record_history(channel.publish_snapshot())
+    # Polls of other quantities publish the same readings again
+    channel.set_voltage = 100.
+    channel.record_history(channel.publish_snapshot())
+    assert len(channel.history) == 1
+    channel.current = 1e-9
+    channel.stamp_acquisition("current", (11., 1e9 + 11.))
+    channel.record_history(channel.publish_snapshot())
+    channel.record_history(channel.publish_snapshot())
+    # Records carry the acquisition time of their newest reading
+    recorded = channel.history.last(5)
+    assert recorded["t_mono"].tolist() == [10., 11.]
+    assert recorded["t_wall"].tolist() == [1e9 + 10., 1e9 + 11.]
+    assert recorded["set_voltage"].tolist() == [0., 100.]
+    channel.module.archive.flush()
+    archived, = archive.ArchiveReader(str(tmp_path)).read(channel.archive_key, 1e9, 1e9 + 20.)
+    assert archived["t_wall"].tolist() == [1e9 + 10., 1e9 + 11.]
+    assert archived["voltage"].tolist() == [5., 5.]
+
+
+def test_poll_settings_of_a_channel_override_the_defaults(iseg, nhq_channel):
+    channel = nhq_channel()
+    assert channel.fast_poll_hold == iseg.defs["fast_poll_hold"]
+    channel = nhq_channel(fast_poll_hold=60, fast_poll_intervals={"voltage": 0.2})
+    assert channel.fast_poll_hold == 60
+    assert channel.fast_poll_intervals["voltage"] == 0.2
+    assert channel.fast_poll_intervals["current"] == iseg.defs["fast_poll_intervals"]["current"]
@@ -0,0 +1,170 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from hexesvm import command_queue as cmdq
+
+
+def test_commands_are_queued_only_with_an_owner():
+    queue = cmdq.CommandQueue()
+    command = cmdq.HvCommand(lambda: 1, cmdq.PRIORITY_SET)
+    assert not queue.submit(command)
+    assert queue.pending() == 0
+    queue.set_owner(threading.get_ident())
+    assert queue.is_owner(threading.get_ident())
+    assert queue.submit(command)
+    assert queue.pending() == 1
+
+
+def test_execute_pending_in_order_of_priority():
+    queue = cmdq.CommandQueue()
+    queue.set_owner(1)
+    executed = []
+    for priority, name in [(cmdq.PRIORITY_READ, "read"), (cmdq.PRIORITY_SET, "set 1"),
+                           (cmdq.PRIORITY_EMERGENCY, "kill"), (cmdq.PRIORITY_SET, "set 2")]:
+        queue.submit(cmdq.HvCommand(lambda name=name: executed.append(name), priority, name))
+    queue.execute_pending()
+    assert executed == ["kill", "set 1", "set 2", "read"]
+    assert queue.pending() == 0
+    assert [command.name for command in queue.history] == executed
+
+
+def test_result_and_error_reach_the_caller():
+    command = cmdq.HvCommand(lambda: 42, cmdq.PRIORITY_SET)
+    assert command.wait(0) is None
+    command.execute()
+    assert command.wait(0) == 42
+    assert command.waiting_time() >= 0 and command.latency() >= command.waiting_time()
+    failing = cmdq.HvCommand(lambda: 1/0, cmdq.PRIORITY_SET)
+    failing.execute()
+    with pytest.raises(ZeroDivisionError):
+        failing.wait(0)
+
+
+def test_owner_handoff():
+    # The owner clears itself and executes what was queued before. Later
+    # commands are refused and executed by their caller
+    queue = cmdq.CommandQueue()
+    queue.set_owner(1)
+    before = cmdq.HvCommand(lambda: "before", cmdq.PRIORITY_SET)
+    assert queue.submit(before)
+    queue.clear_owner()
+    assert not queue.is_owner(1)
+    after = cmdq.HvCommand(lambda: "after", cmdq.PRIORITY_SET)
+    assert not queue.submit(after)
+    queue.execute_pending()
+    assert before.wait(0) == "before"
+    assert after.wait(0) is None
+    # A new owner takes over with an empty queue
+    queue.set_owner(2)
+    assert queue.is_owner(2) and not queue.is_owner(1)
+    assert queue.pending() == 0
+
+
+def test_cancelled_command_is_not_executed():
+    queue = cmdq.CommandQueue()
+    queue.set_owner(1)
+    executed = []
+    command = cmdq.HvCommand(lambda: executed.append(1), cmdq.PRIORITY_SET)
+    queue.submit(command)
+    assert command.cancel()
+    queue.execute_pending()
+    assert executed == []
+    assert not command.done.is_set()
+    # Started commands can not be cancelled any more
+    started = cmdq.HvCommand(lambda: 1, cmdq.PRIORITY_SET)
+    started.execute()
+    assert not started.cancel()
+
+
+def test_wait_wakes_up_on_submit_and_stop():
+    queue = cmdq.CommandQueue()
+    queue.set_owner(1)
+    stop_event = threading.Event()
+    timer = threading.Timer(0.05, queue.submit, [cmdq.HvCommand(lambda: 1, cmdq.PRIORITY_SET)])
+    timer.start()
+    queue.wait(5, stop_event)
+    timer.join()
+    assert queue.pending() == 1
+    queue.execute_pending()
+    stop_event.set()
+    queue.wait(5, stop_event)
+
+
+@pytest.fixture
+def module(iseg):
+    module = iseg.nhq_hv_module("NHQ", "COM1", iseg.defs["modules"][0])
+    module.command_timeout = 0.2
+    return module
+
+
+def test_module_execute_through_the_owner(module):
+    # Commands of other threads are executed by the owner of the board
+    module.acquire_board()
+    owner_thread = threading.current_thread()
+    result = {}
+
+    def call():
+        result["value"] = module.execute(threading.current_thread, name="test", timeout=5)
+    module.command_queue.set_owner(threading.get_ident())
+    caller = threading.Thread(target=call)
+    caller.start()
+    while not module.command_queue.pending():
+        module.command_queue.wait(0.01)
+    module.command_queue.execute_pending()
+    caller.join()
+    assert result["value"] is owner_thread
+    # The owner itself executes right away
+    assert module.execute(lambda: 7) == 7
+    module.command_queue.clear_owner()
+    module.release_board()
+    # Without owner the caller occupies the board itself
+    assert module.execute(lambda: module.board_occupied) is True
+    assert not module.board_occupied
+
+
+def test_module_execute_times_out(module):
+    executed = []
+    # An owner which never serves the queue
+    module.command_queue.set_owner(-1)
+    with pytest.raises(cmdq.CommandTimeout):
+        module.execute(lambda: executed.append(1), name="set")
+    # The late command is dropped, not executed by a later owner
+    module.command_queue.execute_pending()
+    assert executed == []
+    # No owner, but the board is occupied
+    module.command_queue.clear_owner()
+    module.acquire_board()
+    with pytest.raises(cmdq.CommandTimeout):
+        module.execute(lambda: executed.append(2), name="set")
+    module.release_board()
+    assert executed == []
+    assert module.wait_board_free(0.1)
+
+
+class StatusBar():
+
+    def __init__(self):
+        self.messages = []
+
+    def showMessage(self, message):
+        self.messages.append(message)
+
+
+def test_failed_gui_commands_return_the_failure_value(module):
+    from hexesvm.gui_hv_modules import gen_module_tab
+    status_bar = StatusBar()
+    tab = SimpleNamespace(module=module, main_ui=SimpleNamespace(statusBar=lambda: status_bar))
+    assert gen_module_tab.execute_command(tab, lambda: False, cmdq.PRIORITY_SET, "write",
+                                          failed=True) is False
+    # A board which stays occupied
+    module.acquire_board()
+    assert gen_module_tab.execute_command(tab, lambda: False, cmdq.PRIORITY_SET, "write",
+                                          failed=True) is True
+    assert "not free within 0.2 s" in status_bar.messages[-1]
+    module.release_board()
+
+    # Errors of the command are re-raised by HvCommand.wait()
+    def broken():
+        raise OSError("port gone")
+    assert gen_module_tab.execute_command(tab, broken, cmdq.PRIORITY_SET, "write") is None
+    assert status_bar.messages[-1] == "write failed on NHQ: port gone"
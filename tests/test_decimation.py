@@ -0,0 +1,75 @@
+import numpy as np
+from hexesvm.decimation import MinMaxDecimator
+
+
+def filled(n_values, level_size=16, factor=4, n_levels=3):
+    decimator = MinMaxDecimator(level_size, factor, n_levels)
+    for n in range(n_values):
+        decimator.append(float(n), float(n % 7))
+    return decimator
+
+
+def test_raw_values_at_level_0():
+    decimator = filled(10)
+    times, lows, highs = decimator.envelope(0., 9., 100)
+    np.testing.assert_array_equal(times, np.arange(10.))
+    np.testing.assert_array_equal(lows, highs)
+
+
+def test_older_and_repeated_values_are_ignored():
+    decimator = filled(5)
+    decimator.append(4., 100.)
+    decimator.append(2., 100.)
+    times, lows, highs = decimator.envelope(0., 10., 100)
+    assert len(times) == 5 and highs.max() < 100.
+
+
+def test_pending_buckets():
+    # 6 values with factor 4: one full bucket at level 1, 2 values pending
+    decimator = filled(6)
+    assert decimator.pending[1] == [4., 4., 5., 2]
+    assert decimator.pending[2] == [0., 0., 3., 1]
+    times, lows, highs = (buffer.view() for buffer in decimator.levels[1])
+    np.testing.assert_array_equal(times, [0.])
+    np.testing.assert_array_equal(lows, [0.])
+    np.testing.assert_array_equal(highs, [3.])
+
+
+def test_envelope_includes_pending_buckets():
+    # Level 0 only keeps 16 values, the older ones are only in the coarser
+    # levels, the newest level 1 entries are still in a pending bucket
+    decimator = filled(40)
+    times, lows, highs = decimator.envelope(0., 39., 100)
+    assert times[0] == 0.
+    assert np.all(np.diff(times) > 0)
+    # Every value is covered by the envelope
+    assert lows.min() == 0. and highs.max() == 6.
+    # The pending bucket of level 1 holds the values 36 to 39
+    assert times[-1] == 36.
+    assert (lows[-1], highs[-1]) == (min(n % 7 for n in range(36, 40)),
+                                     max(n % 7 for n in range(36, 40)))
+
+
+def test_envelope_limits_the_points():
+    decimator = filled(200)
+    times, lows, highs = decimator.envelope(0., 199., 20)
+    assert 0 < len(times) <= 20 + decimator.factor
+    assert np.all(lows <= highs)
+    # A short recent span is served from the raw values
+    times, lows, highs = decimator.envelope(190., 199., 20)
+    np.testing.assert_array_equal(times, np.arange(190., 200.))
+
+
+def test_append_envelope():
+    decimator = MinMaxDecimator(16, 4, 3)
+    decimator.append_envelope(0., -1., 1.)
+    decimator.append(1., 5.)
+    times, lows, highs = decimator.envelope(0., 1., 10)
+    np.testing.assert_array_equal(lows, [-1., 5.])
+    np.testing.assert_array_equal(highs, [1., 5.])
+    assert decimator.pending[1] == [0., -1., 5., 2]
+
+
+def test_empty():
+    times, lows, highs = MinMaxDecimator().envelope(0., 1., 10)
+    assert len(times) == len(lows) == len(highs) == 0
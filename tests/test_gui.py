@@ -0,0 +1,88 @@
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from hexesvm.decimation import MinMaxDecimator
+from hexesvm.gui import MainWindow
+from hexesvm.threads import LoadTrendHistory
+
+
+class StatusBar():
+
+    def __init__(self):
+        self.messages = []
+
+    def showMessage(self, message):
+        self.messages.append(message)
+
+
+class Writer():
+    # Stand-in for BufferedSqlWriter
+
+    def __init__(self):
+        self.rows = []
+        self.healthy = True
+
+    def put(self, row):
+        self.rows.append(row)
+        return True
+
+
+@pytest.fixture
+def window():
+    # The parts of MainWindow used by insert_values_in_database
+    status_bar = StatusBar()
+    return SimpleNamespace(db_insertion_names=[["M", "A", "u", "i", "u_time", None]],
+                           channels={"M": {"A": None}}, defaults={"db_time_variable": "time"},
+                           last_db_row_time=None, db_rows_skipped=0, db_skipping=False,
+                           db_writer=Writer(), sql_cont=SimpleNamespace(db=SimpleNamespace(healthy=True)),
+                           statusBar=lambda: status_bar, status_bar=status_bar,
+                           acquisition_datetime=MainWindow.acquisition_datetime)
+
+
+def test_rows_without_new_read_outs_are_skipped(window, snapshot):
+    channel = SimpleNamespace(snapshot=snapshot(voltage=5., current=1e-9, voltage_t_wall=1e9,
+                                                current_t_wall=1e9 + 1.))
+    window.channels["M"]["A"] = channel
+    assert MainWindow.insert_values_in_database(window)
+    row = window.db_writer.rows[0]
+    assert row["time"] == datetime.fromtimestamp(1e9 + 1.)
+    assert row["u_time"] == datetime.fromtimestamp(1e9)
+    assert (row["u"], row["i"]) == (5., 1e-9)
+    # Skipped rows are counted, the gap is reported once
+    assert MainWindow.insert_values_in_database(window)
+    assert MainWindow.insert_values_in_database(window)
+    assert len(window.db_writer.rows) == 1
+    assert window.db_rows_skipped == 2
+    assert len(window.status_bar.messages) == 1
+    assert "No new read-out since" in window.status_bar.messages[0]
+    channel.snapshot = snapshot(voltage=6., voltage_t_wall=1e9 + 2., current_t_wall=1e9 + 1.)
+    assert MainWindow.insert_values_in_database(window)
+    assert len(window.db_writer.rows) == 2 and not window.db_skipping
+
+
+def test_trend_history_is_read_by_a_worker():
+    results = []
+    loader = LoadTrendHistory(lambda: {"times": np.zeros(1)})
+    loader.history_loaded.connect(results.append)
+    loader.run()
+    assert list(results[0]) == ["times"]
+
+
+def test_trend_history_fills_only_empty_trends(window):
+    fed = SimpleNamespace(trends={"voltage": MinMaxDecimator(), "current": MinMaxDecimator()})
+    empty = SimpleNamespace(trends={"voltage": MinMaxDecimator(), "current": MinMaxDecimator()})
+    fed.trends["voltage"].append(1e9, 1.)
+    window.channels = {"M": {"A": fed, "B": empty}}
+    window.db_insertion_names = [["M", "A", "u_a", "i_a", None, None],
+                                 ["M", "B", "u_b", "i_b", None, None]]
+    buckets = {column: np.array([1., 2., np.nan]) for column in ("u_a", "i_a", "u_b", "i_b")}
+    history = {"times": np.array([50., 100., 160.]), "t_first": 60.,
+               "min": buckets, "max": {column: values + 1. for column, values in buckets.items()}}
+    MainWindow.fill_trend_history(window, history)
+    MainWindow.fill_trend_history(window, None)
+    assert fed.trends["voltage"].last_time == 1e9
+    assert fed.trends["current"].last_time == 100.
+    # Buckets before t_first and without values are left out
+    times, lows, highs = empty.trends["voltage"].envelope(0., 200., 10)
+    assert times.tolist() == [100.] and lows.tolist() == [2.] and highs.tolist() == [3.]
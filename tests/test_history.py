@@ -0,0 +1,60 @@
+import math
+import time
+import numpy as np
+from hexesvm import history as hist
+
+
+def test_status_bits(snapshot):
+    status = hist.encode_status(snapshot(0., channel_is_tripped=True, hv_switch_off=True))
+    assert status == hist.STATUS_BITS["channel_is_tripped"] | hist.STATUS_BITS["hv_switch_off"]
+    assert hist.status_flag([status, 0], "channel_is_tripped").tolist() == [True, False]
+
+
+def test_capacity_drops_the_oldest(snapshot):
+    history = hist.ChannelHistory(5)
+    for n in range(8):
+        history.append(snapshot(float(n), voltage=n))
+    assert len(history) == 5
+    np.testing.assert_array_equal(history.last(10)["voltage"], np.arange(3., 8.))
+    np.testing.assert_array_equal(history.last(2)["t_mono"], [6., 7.])
+
+
+def test_queries_return_copies(snapshot):
+    history = hist.ChannelHistory(5)
+    history.append(snapshot(0.))
+    values = history.last(1)
+    history.append(snapshot(1., voltage=5.))
+    history.clear()
+    assert values["voltage"].tolist() == [1.]
+    assert len(history) == 0
+
+
+def test_between(snapshot):
+    history = hist.ChannelHistory(20)
+    for n in range(10):
+        history.append(snapshot(float(n), voltage=n))
+    np.testing.assert_array_equal(history.between(2., 4., clock="t_mono")["voltage"],
+                                  [2., 3., 4.])
+    np.testing.assert_array_equal(history.between(1002., 1003.)["voltage"], [2., 3.])
+
+
+def test_window_ends_now_by_default(snapshot):
+    history = hist.ChannelHistory(20)
+    now = time.monotonic()
+    for n in range(10):
+        history.append(snapshot(now - 100. + n, voltage=n))
+    # The read-out stopped 91 s ago, nothing in the last 10 s
+    assert len(history.window(10.)["voltage"]) == 0
+    assert all(math.isnan(value) for value in history.stats("voltage", 10.))
+    # Relative to the last sample
+    last = history.last()["t_mono"][0]
+    np.testing.assert_array_equal(history.window(2., last)["voltage"], [7., 8., 9.])
+    assert history.stats("voltage", 2., last) == (7., 9., 8.)
+
+
+def test_stats_ignore_nan(snapshot):
+    history = hist.ChannelHistory(20)
+    now = time.monotonic()
+    for n, value in enumerate([1., float("nan"), 3.]):
+        history.append(snapshot(now + n, voltage=value))
+    assert history.stats("voltage", 10., now + 2) == (1., 3., 2.)
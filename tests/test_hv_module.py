@@ -0,0 +1,152 @@
+import threading
+import time
+import pytest
+from hexesvm import fake_serial
+
+
+@pytest.fixture
+def module(iseg):
+    return iseg.nhq_hv_module("NHQ", "COM1", iseg.defs["modules"][0])
+
+
+def test_board_is_occupied_by_one_thread(module):
+    assert module.acquire_board()
+    assert module.board_occupied
+    # A second caller waits for the release
+    assert not module.acquire_board(0.05)
+    assert not module.wait_board_free(0.05)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(module.acquire_board(5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert acquired == []
+    module.release_board()
+    waiter.join(5)
+    assert acquired == [True]
+    assert module.board_occupied
+    module.release_board()
+    assert module.wait_board_free(0)
+
+
+def test_waiters_wake_up_on_release(module):
+    module.acquire_board()
+    woken = []
+    waiters = [threading.Thread(target=lambda: woken.append(module.wait_board_free(5)))
+               for n in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    t_release = time.monotonic()
+    module.release_board()
+    for waiter in waiters:
+        waiter.join(5)
+    # Notified, not polled
+    assert woken == [True, True, True]
+    assert time.monotonic() - t_release < 1.
+
+
+def test_stop_request(module):
+    module.stop_running_thread()
+    assert module.stop_thread and module.stop_event.is_set()
+    # Waits of the reader thread end at once
+    assert module.stop_event.wait(5)
+    module.reset_stop_request()
+    assert not module.stop_thread and not module.stop_event.is_set()
+
+
+class KillModule():
+    # Stand-in for a module in kill_modules
+
+    def __init__(self, name, outcomes=(), delay=0., error=None):
+        self.name = name
+        self.child_channels = [Channel(name+"_"+str(n)) for n in range(len(outcomes))]
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.error = error
+        self.started = None
+
+    def kill_hv(self):
+        self.started = time.monotonic()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.outcomes
+
+
+class Channel():
+
+    def __init__(self, name):
+        self.name = name
+
+
+def test_kill_modules_in_parallel(iseg):
+    modules = [KillModule("a", [True, False], delay=0.2), KillModule("b", [True], delay=0.2)]
+    t_start = time.monotonic()
+    results = iseg.kill_modules(modules, timeout=5)
+    assert time.monotonic() - t_start < 0.35
+    # Both kills started at once
+    assert abs(modules[0].started - modules[1].started) < 0.1
+    assert results[0]["module"] == "a"
+    assert results[0]["channels"] == [("a_0", True), ("a_1", False)]
+    assert results[1]["channels"] == [("b_0", True)]
+    assert all(result["error"] is None and result["duration"] >= 0.2 for result in results)
+
+
+def test_kill_modules_errors_and_deadline(iseg):
+    modules = [KillModule("slow", [True], delay=2.), KillModule("broken", error=OSError("port gone")),
+               KillModule("fast", [True])]
+    t_start = time.monotonic()
+    results = iseg.kill_modules(modules, timeout=0.2)
+    # The slow module does not hold up the others beyond the deadline
+    assert time.monotonic() - t_start < 1.
+    assert results[0]["error"] == "no response within 0.2 s"
+    assert results[0]["channels"] == []
+    assert results[1]["error"] == "port gone"
+    assert results[2]["error"] is None and results[2]["channels"] == [("fast_0", True)]
+
+
+def bulk_connect(module, echo=lambda part: part):
+    # Fake NHQ module in bulk mode, echo() may garble the echoed parts.
+    # Returns the log of the written and read parts
+    serial_conn = fake_serial.Serial(port="COM1")
+    log = []
+    write, read = serial_conn.write, serial_conn.read
+
+    def record_write(data):
+        log.append(("write", data.decode()))
+        write(data)
+
+    def record_read(n):
+        answer = echo(read(n).decode())
+        log.append(("read", answer))
+        return answer.encode()
+    serial_conn.write = record_write
+    serial_conn.read = record_read
+    module.serial_conn = serial_conn
+    module.is_connected = True
+    module.bulk_transmit = True
+    return log
+
+
+def test_bulk_command(module):
+    log = bulk_connect(module)
+    assert module.send_long_command("#") == "487472;1.23;1000;2mA"
+    # The terminator is sent after the echo of the body was checked
+    assert log == [("write", "#"), ("read", "#"), ("write", "\r\n"), ("read", "\r\n")]
+    assert module.is_connected
+
+
+def test_bulk_command_with_a_wrong_echo(module, capsys):
+    log = bulk_connect(module, echo=lambda part: part.replace("D1", "D!"))
+    assert module.send_long_command("D1=1000") is None
+    # The module never got the terminator, so it did not act on the command
+    assert log == [("write", "D1=1000"), ("read", "D!=1000")]
+    assert not module.is_connected
+    assert "expected echo 'D1=1000', received 'D!=1000'" in capsys.readouterr().out
+
+
+def test_bulk_command_with_a_wrong_terminator_echo(module, capsys):
+    log = bulk_connect(module, echo=lambda part: part.replace("\n", ""))
+    assert module.send_long_command("U1") is None
+    assert log[-1] == ("read", "\r")
+    assert not module.is_connected
+    assert "expected echo '\\r\\n', received '\\r'" in capsys.readouterr().out
@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta
+import socket
+import threading
+import time
+import psycopg2
+import pytest
+from hexesvm.interlock import Interlock
+
+
+class DbapiConnection():
+
+    def __init__(self):
+        self.autocommit = False
+
+
+class Cursor():
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = False
+
+    def execute(self, statement):
+        if self.pool.error is not None:
+            raise self.pool.error
+        self.pool.statements.append(statement)
+
+    def fetchone(self):
+        return self.pool.row
+
+    def close(self):
+        self.closed = True
+
+
+class PooledConnection():
+    # Stand-in for the pooled DBAPI connection of SqlEngine.raw_connection
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = DbapiConnection()
+        self.closed = False
+        self.invalidated = False
+        self.committed = False
+
+    def cursor(self):
+        return Cursor(self.pool)
+
+    def commit(self):
+        self.committed = True
+
+    def close(self):
+        self.closed = True
+
+    def invalidate(self):
+        self.invalidated = True
+
+
+class Engine():
+    # Hands out pooled connections and records the executed statements
+
+    def __init__(self):
+        self.connections = []
+        self.statements = []
+        self.row = None
+        self.error = None
+
+    def raw_connection(self):
+        self.connections.append(PooledConnection(self))
+        return self.connections[-1]
+
+
+@pytest.fixture
+def interlock():
+    interlock = Interlock()
+    interlock.set_interlock_parameter("p1", 1.2)
+    interlock.set_engine(Engine(), "hexe_sc")
+    return interlock
+
+
+def test_the_latest_value_is_read_with_a_prepared_statement(interlock):
+    engine = interlock.connection
+    engine.row = (datetime.now(), 1.5)
+    assert interlock.read_latest_value() == engine.row
+    assert interlock.read_latest_value() == engine.row
+    # One connection, prepared once, no transaction kept open
+    assert len(engine.connections) == 1
+    assert engine.connections[0].connection.autocommit
+    assert engine.statements == ["PREPARE interlock_latest_value AS SELECT time, p1 "
+                                 "FROM hexe_sc ORDER BY time DESC LIMIT 1",
+                                 "EXECUTE interlock_latest_value",
+                                 "EXECUTE interlock_latest_value"]
+
+
+def test_release_returns_healthy_connections_to_the_pool(interlock):
+    engine = interlock.connection
+    engine.row = (datetime.now(), 1.5)
+    interlock.read_latest_value()
+    interlock.release_db_connection(broken=False)
+    assert engine.statements[-1] == "DEALLOCATE interlock_latest_value"
+    assert engine.connections[0].closed and not engine.connections[0].invalidated
+    assert not engine.connections[0].connection.autocommit
+    # The next read prepares the statement on a new connection
+    interlock.read_latest_value()
+    assert len(engine.connections) == 2
+    assert engine.statements[-2].startswith("PREPARE")
+    interlock.release_db_connection()
+    assert engine.connections[1].invalidated
+    assert interlock.db_conn is None
+
+
+def test_check_interlock(interlock):
+    engine = interlock.connection
+    engine.row = (datetime.now(), 1.5)
+    assert interlock.check_interlock()
+    assert interlock.lock_state and interlock.parameter_value == 1.5
+    engine.row = (datetime.now(), 1.)
+    assert not interlock.check_interlock()
+    assert not interlock.lock_state
+
+
+def test_failed_reads_are_tolerated(interlock):
+    engine = interlock.connection
+    engine.row = (datetime.now(), 1.5)
+    interlock.check_interlock()
+    # Outdated values count as failed reads
+    engine.row = (datetime.now() - timedelta(seconds=300), 1.5)
+    for n in range(interlock.max_read_attempts):
+        assert interlock.check_interlock()
+        assert interlock.lock_state
+    assert not interlock.check_interlock()
+    assert not interlock.lock_state
+
+
+def test_read_errors_discard_the_connection(interlock):
+    engine = interlock.connection
+    engine.row = (datetime.now(), 1.5)
+    interlock.check_interlock()
+    engine.error = psycopg2.OperationalError("server closed the connection")
+    assert interlock.check_interlock()
+    assert interlock.grace_counter == 1
+    assert engine.connections[0].invalidated and interlock.db_conn is None
+    # A new connection after the server is back
+    engine.error = None
+    assert interlock.check_interlock()
+    assert interlock.grace_counter == 0
+    assert len(engine.connections) == 2
+
+
+class ListeningConnection():
+    # DBAPI connection whose notifications arrive through a socket pair, like
+    # the server messages on the socket of a psycopg2 connection
+
+    def __init__(self):
+        self.server, self.client = socket.socketpair()
+        self.notifies = []
+        self.autocommit = False
+
+    def fileno(self):
+        return self.client.fileno()
+
+    def notify(self, channel):
+        self.server.send(channel.encode()+b"\n")
+
+    def poll(self):
+        for channel in self.client.recv(4096).decode().split():
+            self.notifies.append(("pid", channel, ""))
+
+    def close(self):
+        self.server.close()
+        self.client.close()
+
+
+class PooledListeningConnection(PooledConnection):
+
+    def __init__(self, pool, connection):
+        super().__init__(pool)
+        self.connection = connection
+
+
+@pytest.fixture
+def listening(interlock):
+    engine = interlock.connection
+    connection = ListeningConnection()
+    engine.raw_connection = lambda: PooledListeningConnection(engine, connection)
+    interlock.set_notify_channel("hexe_interlock", notify_timeout=0.2)
+    assert interlock.start_listening()
+    yield connection
+    connection.close()
+
+
+def test_notifications_wake_up_the_interlock(interlock, listening):
+    assert interlock.connection.statements == ["LISTEN hexe_interlock"]
+    assert interlock.push_active
+    timer = threading.Timer(0.05, listening.notify, ["hexe_interlock"])
+    t_start = time.monotonic()
+    timer.start()
+    assert interlock.wait_for_notification(5)
+    timer.join()
+    assert time.monotonic() - t_start < 1.
+    assert interlock.notify_count == 1 and listening.notifies == []
+
+
+def test_polling_without_notifications(interlock, listening):
+    assert not interlock.wait_for_notification(0.05)
+    assert interlock.push_active
+    # Silent for longer than notify_timeout: poll instead
+    assert not interlock.wait_for_notification(0.2)
+    assert not interlock.push_active
+    assert interlock.listen_conn is not None
+    listening.notify("hexe_interlock")
+    assert interlock.wait_for_notification(1)
+    assert interlock.push_active
+
+
+def test_lost_notification_connection(interlock, listening):
+    listening.client.close()
+    assert not interlock.wait_for_notification(0.05)
+    assert interlock.listen_conn is None and not interlock.push_active
+    # The next attempt waits for listen_retry_interval
+    assert not interlock.start_listening()
+
+
+def test_install_notify_trigger(interlock):
+    engine = interlock.connection
+    interlock.set_notify_channel("hexe_interlock")
+    assert interlock.install_notify_trigger()
+    assert engine.statements == [interlock.notify_trigger_sql()]
+    assert "CREATE TRIGGER hexe_interlock_trigger AFTER INSERT ON hexe_sc" in engine.statements[0]
+    assert engine.connections[0].committed and engine.connections[0].closed
+    engine.error = psycopg2.ProgrammingError("must be owner of table hexe_sc")
+    assert not interlock.install_notify_trigger()
+    assert engine.connections[1].invalidated
@@ -0,0 +1,128 @@
+import math
+import pytest
+from hexesvm import iseg_replies as rep
+
+
+@pytest.mark.parametrize("answer, signed, value", [
+    ("12345-10", False, 1.2345e-6),
+    ("00000-12", False, 0.),
+    ("-01234-3", True, -1.234),
+    ("+01234-3", True, 1.234),
+    ("12345-40", False, 1.2345e-36),
+])
+def test_nhq_exponent(answer, signed, value):
+    assert rep.parse_nhq_exponent(answer, signed) == pytest.approx(value, rel=1e-12)
+
+
+@pytest.mark.parametrize("answer, signed", [
+    (None, False),
+    ("", False),
+    ("-", True),
+    ("12345", False),
+    ("12345-", False),
+    ("-12345", False),
+    ("12a45-3", False),
+    ("1234-3-3", False),
+    ("1234-²", False),
+    ("１２-3", False),
+    ("?WCN", False),
+    ("-01234-3", False),
+])
+def test_nhq_exponent_malformed(answer, signed):
+    assert math.isnan(rep.parse_nhq_exponent(answer, signed))
+
+
+def test_parse_with_unit():
+    assert rep.parse_with_unit("1.234560E3V", "V") == 1234.56
+    assert rep.parse_with_unit("-5.00000E-9A", "A") == -5e-9
+    assert rep.parse_with_unit("0.01E3V/s", "V/s") == 10.
+    # Answer with another unit
+    assert math.isnan(rep.parse_with_unit("12V", "A"))
+    for answer in (None, "", "V", "abcV", "1.2.3V"):
+        assert math.isnan(rep.parse_with_unit(answer, "V"))
+
+
+def test_parse_int_and_float():
+    assert rep.parse_int("0123") == 123
+    assert rep.parse_int(None) is None
+    assert rep.parse_int("12.5") is None
+    assert rep.parse_int("") is None
+    assert rep.parse_float("-12.5") == -12.5
+    assert math.isnan(rep.parse_float(None))
+    assert math.isnan(rep.parse_float("?WCN"))
+
+
+def test_status_bits():
+    nhq_status = rep.NHQ_STATUS_TRIPPED | rep.NHQ_STATUS_POLARITY_POSITIVE
+    assert nhq_status == int("01000100", 2)
+    assert not nhq_status & rep.NHQ_STATUS_ERROR
+    nhr_status = rep.parse_int(str(rep.NHR_STATUS_INHIBIT | rep.NHR_STATUS_RAMPING))
+    assert nhr_status & rep.NHR_STATUS_INHIBIT
+    assert nhr_status & rep.NHR_STATUS_RAMPING
+    assert not nhr_status & rep.NHR_STATUS_POLARITY_POSITIVE
+
+
+def test_nhq_channel_reads(nhq_channel, script_module):
+    channel = nhq_channel()
+    script_module(channel.module, {"U1": "-01234-1", "I1": "12345-10", "D1": "05000-1",
+                                     "T1": str(rep.NHQ_STATUS_TRIPPED | rep.NHQ_STATUS_INHIBIT),
+                                     "S1": "S1=ON"})
+    assert channel.read_voltage() == pytest.approx(-123.4)
+    assert channel.read_current() == pytest.approx(1.2345e-6)
+    assert channel.read_set_voltage() == pytest.approx(500.)
+    assert channel.read_device_status()
+    assert channel.channel_is_tripped and channel.hardware_inhibit
+    assert not channel.channel_in_error and not channel.hv_switch_off
+    assert channel.read_status() == "ON"
+    assert channel.voltage_t_mono is not None and not math.isnan(channel.voltage_t_wall)
+
+
+def test_nhq_channel_malformed_replies(nhq_channel, script_module):
+    channel = nhq_channel()
+    # Garbage and missing answers (None, e.g. after a failed echo)
+    script_module(channel.module, {"U1": "-01234", "I1": "?WCN", "T1": "1x",
+                                     "S1": "S1", "M1": "abc"})
+    assert math.isnan(channel.read_voltage())
+    assert math.isnan(channel.read_current())
+    assert math.isnan(channel.read_set_voltage())
+    assert math.isnan(channel.read_voltage_limit())
+    assert channel.read_device_status() is False
+    assert channel.read_status() is None
+    assert math.isnan(channel.read_trip_current())
+
+
+def test_nhq_low_precision_voltage(nhq_channel, script_module):
+    channel = nhq_channel(high_precision=False)
+    script_module(channel.module, {"U1": "-123.4", "D1": "bad"})
+    assert channel.read_voltage() == -123.4
+    assert math.isnan(channel.read_set_voltage())
+
+
+def test_nhr_channel_reads(nhr_channels, script_module):
+    channel = nhr_channels()[0]
+    script_module(channel.module, {":MEAS:VOLT? (@0)": "1.234560E3V",
+                                     ":MEAS:CURR? (@0)": "-5.00000E-9A",
+                                     ":READ:CHAN:STAT? (@0)": str(rep.NHR_STATUS_RAMPING),
+                                     ":READ:VOLT:ON? (@0)": "1",
+                                     ":READ:CHAN:EV:STAT? (@0)": str(rep.NHR_EVENT_TRIP),
+                                     ":CONF:TRIP:ACT? (@0)": "2"})
+    channel.read_voltage()
+    channel.read_current()
+    assert channel.voltage == 1234.56
+    assert channel.current == -5e-9
+    assert channel.read_device_status()
+    assert channel.channel_is_ramping and channel.channel_is_tripped
+    assert channel.kill_enable_switch and not channel.hv_switch_off
+
+
+def test_nhr_channel_malformed_replies(nhr_channels, script_module):
+    channel = nhr_channels()[0]
+    script_module(channel.module, {":MEAS:VOLT? (@0)": "1.2.3V",
+                                     ":READ:CHAN:STAT? (@0)": "16",
+                                     ":READ:VOLT:ON? (@0)": "1",
+                                     ":READ:CHAN:EV:STAT? (@0)": "?"})
+    channel.read_voltage()
+    channel.read_current()
+    assert math.isnan(channel.voltage)
+    assert math.isnan(channel.current)
+    assert channel.read_device_status() is False
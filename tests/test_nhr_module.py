@@ -0,0 +1,120 @@
+import math
+from hexesvm import fake_serial
+
+
+def connect(module):
+    # Talk to the simulated NHR module of fake_serial, recording every frame
+    serial_conn = fake_serial.Serial(port="COM3")
+    # No simulated trips
+    serial_conn.ch_tripping_active = serial_conn.n_channels*[False]
+    frames = []
+    write = serial_conn.write
+
+    def record(data):
+        frames.append(data.decode().split("\r\n")[0])
+        write(data)
+    serial_conn.write = record
+    module.serial_conn = serial_conn
+    module.is_connected = True
+    return frames
+
+
+def test_batch_read(nhr_channels):
+    channels = nhr_channels()
+    module = channels[0].module
+    sent = []
+
+    def send_batch_query(queries):
+        sent.append(queries)
+        return ["1.0E3V,2.0E3V,3.0E3V", "1.0E-9A,2.0E-9A,3.0E-9A"]
+    module.send_batch_query = send_batch_query
+    assert module.read_channels(["voltage", "current"])
+    assert sent == [[":MEAS:VOLT? (@0-2)", ":MEAS:CURR? (@0-2)"]]
+    assert [this_channel.voltage for this_channel in channels] == [1e3, 2e3, 3e3]
+    assert [this_channel.current for this_channel in channels] == [1e-9, 2e-9, 3e-9]
+    # All channels of a frame share its acquisition time
+    assert len(set(this_channel.voltage_t_mono for this_channel in channels)) == 1
+
+
+def test_batch_read_of_some_channels(nhr_channels):
+    channels = nhr_channels()
+    module = channels[0].module
+    assert module.channel_list([channels[2], channels[0]]) == "(@0,2)"
+    assert module.channel_list([]) is None
+    frames = connect(module)
+    module.serial_conn.u[2] = 1500.
+    assert module.read_channels(["voltage"], [channels[2], channels[0]])
+    assert frames == [":MEAS:VOLT? (@0,2)"]
+    assert channels[2].voltage == 1500. and channels[0].voltage == 0.
+    assert math.isnan(channels[1].voltage)
+
+
+def test_batch_read_wrong_channel_count(nhr_channels):
+    channels = nhr_channels()
+    module = channels[0].module
+    module.send_batch_query = lambda queries: ["1.0E3V,2.0E3V", "1.0E-9A,2.0E-9A,3.0E-9A"]
+    assert not module.read_channels(["voltage", "current"])
+    assert all(math.isnan(this_channel.voltage) for this_channel in channels)
+    module.send_batch_query = lambda queries: None
+    assert not module.read_channels(["voltage"])
+
+
+def test_batch_query_answer_count(nhr_channels, script_module):
+    module = nhr_channels()[0].module
+    script_module(module, {"A;B": "1;2", "A;B;C": "1;2"})
+    assert module.send_batch_query(["A", "B"]) == ["1", "2"]
+    assert module.send_batch_query(["A", "B", "C"]) is None
+    assert module.send_batch_query(["X"]) is None
+
+
+def test_kill_in_one_frame(nhr_channels):
+    channels = nhr_channels()
+    module = channels[0].module
+    frames = connect(module)
+    serial_conn = module.serial_conn
+    serial_conn.d[:3] = [1000., 2000., 3000.]
+    assert module.kill_channels() == [True, True, True]
+    assert frames == [":CONF:RAMP:VOLT:UP 255.000,(@0-2);:CONF:RAMP:VOLT:DOWN 255.000,(@0-2);"
+                      ":VOLT 0.000,(@0-2);*OPC?",
+                      ":READ:CHAN:STAT? (@0-2);:READ:VOLT:ON? (@0-2);"
+                      ":READ:CHAN:EV:STAT? (@0-2);:CONF:TRIP:ACT? (@0-2)"]
+    assert serial_conn.d[:3] == [0., 0., 0.] and serial_conn.v[:3] == [255., 255., 255.]
+    assert all(this_channel.kill_active and this_channel.hv_switch_off
+               for this_channel in channels)
+
+
+def test_kill_falls_back_to_single_channels(nhr_channels):
+    channels = nhr_channels()
+    module = channels[0].module
+    frames = connect(module)
+    serial_conn = module.serial_conn
+    nhr_command = serial_conn.nhr_command
+    rejected = []
+
+    def reject_first_opc(command, channel_number):
+        # The module does not confirm the multi channel frame
+        if command == "*OPC?" and not rejected:
+            rejected.append(command)
+            return "0"
+        return nhr_command(command, channel_number)
+    serial_conn.nhr_command = reject_first_opc
+    serial_conn.d[:3] = [1000., 2000., 3000.]
+    assert module.kill_channels() == [True, True, True]
+    assert rejected
+    assert ":VOLT 0.000,(@1);*OPC?" in frames
+    assert ":CONF:RAMP:VOLT:DOWN 255.000,(@2);*OPC?" in frames
+    assert serial_conn.d[:3] == [0., 0., 0.]
+
+
+def test_kill_without_connection(nhr_channels, script_module):
+    channels = nhr_channels()
+    module = channels[0].module
+    sent = script_module(module, {})
+
+    def lost(command):
+        # e.g. a wrong echo, send_long_command closed the connection
+        sent.append(command)
+        module.is_connected = False
+    module.send_long_command = lost
+    assert module.kill_channels() == [False, False, False]
+    assert len(sent) == 1
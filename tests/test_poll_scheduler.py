@@ -0,0 +1,78 @@
+import pytest
+from hexesvm.poll_scheduler import PollScheduler, PollTask
+
+
+def make_scheduler(intervals, now=0.):
+    scheduler = PollScheduler()
+    tasks = {}
+    for quantity, interval in intervals.items():
+        tasks[quantity] = PollTask("channel", quantity, interval)
+        scheduler.add_task(tasks[quantity], now)
+    return scheduler, tasks
+
+
+def test_new_tasks_are_due_at_once():
+    scheduler, tasks = make_scheduler({"voltage": 0.5, "status": 2})
+    assert set(scheduler.pop_due(0.)) == set(tasks.values())
+    assert scheduler.pop_due(0.) == []
+
+
+def test_due_tasks_are_ordered_by_deadline():
+    scheduler, tasks = make_scheduler({"voltage": 0.5, "current": 0.5, "status": 2})
+    scheduler.reschedule(scheduler.pop_due(0.), 0.)
+    # voltage and current are due at 0.5, status at 2
+    assert scheduler.pop_due(0.4) == []
+    assert scheduler.pop_due(0.6) == [tasks["voltage"], tasks["current"]]
+    scheduler.reschedule([tasks["voltage"], tasks["current"]], 0.6)
+    due = scheduler.pop_due(2.5)
+    assert [task.deadline for task in due] == sorted(task.deadline for task in due)
+    assert due[0] is tasks["voltage"]
+    assert tasks["status"] in due
+
+
+def test_reschedule_keeps_the_rate_without_drift():
+    scheduler, tasks = make_scheduler({"voltage": 0.5})
+    task = tasks["voltage"]
+    scheduler.reschedule(scheduler.pop_due(0.), 0.)
+    # Executed a little late, the next deadline still follows the previous one
+    assert scheduler.pop_due(0.55) == [task]
+    scheduler.reschedule([task], 0.55)
+    assert task.deadline == 1.
+    assert task.last_run == 0.55
+
+
+def test_late_tasks_do_not_run_in_bursts():
+    scheduler, tasks = make_scheduler({"voltage": 0.5})
+    task = tasks["voltage"]
+    scheduler.reschedule(scheduler.pop_due(0.), 0.)
+    # Several intervals missed: due once, then one interval after now
+    assert scheduler.pop_due(10.) == [task]
+    assert scheduler.lag == 9.5
+    scheduler.reschedule([task], 10.)
+    assert task.deadline == 10.
+    assert scheduler.pop_due(10.) == [task]
+    scheduler.reschedule([task], 10.)
+    assert task.deadline == 10.5
+
+
+def test_shorter_interval_moves_the_deadline_forward():
+    scheduler, tasks = make_scheduler({"voltage": 5., "status": 2.})
+    scheduler.reschedule(scheduler.pop_due(0.), 0.)
+    assert scheduler.time_to_next(0.) == 2.
+    assert scheduler.set_interval("channel", "voltage", 0.1)
+    assert tasks["voltage"].deadline == 0.1
+    assert scheduler.pop_due(0.1) == [tasks["voltage"]]
+    # A longer interval only applies from the next execution on
+    assert scheduler.set_interval("channel", "status", 10.)
+    assert tasks["status"].deadline == 2.
+    assert not scheduler.set_interval("channel", "status", 10.)
+    assert not scheduler.set_interval("channel", "unknown", 1.)
+
+
+def test_time_to_next():
+    scheduler = PollScheduler()
+    assert scheduler.time_to_next(0.) is None
+    scheduler, tasks = make_scheduler({"voltage": 0.5})
+    assert scheduler.time_to_next(1.) == 0.
+    scheduler.reschedule(scheduler.pop_due(0.), 0.)
+    assert scheduler.time_to_next(0.2) == pytest.approx(0.3)
@@ -0,0 +1,54 @@
+import numpy as np
+from hexesvm.ring_buffer import RingBuffer
+
+
+def test_append_and_view():
+    ring = RingBuffer(4)
+    assert len(ring) == 0
+    assert ring.first() is None and ring.last() is None
+    ring.append([1., 2.])
+    ring.append(3.)
+    np.testing.assert_array_equal(ring.view(), [1., 2., 3.])
+    assert ring.first() == 1. and ring.last() == 3.
+
+
+def test_wraparound_keeps_a_contiguous_view():
+    ring = RingBuffer(4)
+    ring.append([1., 2., 3., 4.])
+    for value in range(5, 12):
+        ring.drop(1)
+        ring.append(value)
+        view = ring.view()
+        np.testing.assert_array_equal(view, np.arange(value - 3, value + 1))
+        # A slice of the storage, nothing is copied
+        assert view.base is ring.data
+    assert ring.capacity == 4
+
+
+def test_drop():
+    ring = RingBuffer(4)
+    ring.append([1., 2., 3.])
+    ring.drop(2)
+    np.testing.assert_array_equal(ring.view(), [3.])
+    ring.drop(5)
+    assert len(ring) == 0
+    ring.append([7., 8.])
+    np.testing.assert_array_equal(ring.view(), [7., 8.])
+    ring.clear()
+    assert len(ring) == 0
+
+
+def test_growth_keeps_the_order():
+    ring = RingBuffer(4, np.int64)
+    ring.append([1, 2, 3])
+    ring.drop(2)
+    ring.append([4, 5, 6])
+    # Wrapped around, then grown by an append that does not fit
+    ring.append([7, 8])
+    assert ring.capacity == 8
+    assert ring.view().dtype == np.int64
+    np.testing.assert_array_equal(ring.view(), [3, 4, 5, 6, 7, 8])
+    # Appending more than twice the capacity at once
+    ring.append(np.arange(9, 30))
+    assert ring.capacity >= len(ring) == 27
+    np.testing.assert_array_equal(ring.view(), np.arange(3, 30))
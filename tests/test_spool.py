@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+import os
+import numpy as np
+import pytest
+import sqlalchemy as sql
+from hexesvm.spool import SqlSpool, is_connection_error
+
+T0 = datetime(2026, 1, 1, 12, 0, 0, 250000)
+
+
+class TableWriter():
+    # The parts of SqlWriter used by the spool, on an SQLite table
+
+    def __init__(self, directory):
+        self.engine = sql.create_engine("sqlite:///"+os.path.join(str(directory), "db.sqlite"))
+        meta = sql.MetaData()
+        self.table = sql.Table("hv", meta,
+                               sql.Column("time", sql.DateTime, primary_key=True),
+                               sql.Column("u", sql.Float, nullable=False),
+                               sql.Column("u_time", sql.DateTime))
+        meta.create_all(self.engine)
+
+    def select(self, query):
+        with self.engine.connect() as conn:
+            return conn.execute(query).fetchall()
+
+    def write_rows(self, rows):
+        with self.engine.connect() as conn:
+            conn.execute(self.table.insert(), rows)
+
+    def rows(self):
+        return self.select(sql.select([self.table]).order_by(self.table.c.time))
+
+
+class DownWriter(TableWriter):
+
+    def write_rows(self, rows):
+        raise sql.exc.OperationalError("INSERT", {}, Exception("connection refused"))
+
+
+def make_spool(directory, **kwargs):
+    # The rows of the tests carry the acquisition time u_time
+    return SqlSpool(str(directory), time_columns=("u_time",), **kwargs)
+
+
+def row(seconds, u=1.):
+    return {"time": T0 + timedelta(seconds=seconds), "u": u,
+            "u_time": T0 + timedelta(seconds=seconds - 0.5)}
+
+
+def test_encode_decode(tmp_path):
+    spool = make_spool(tmp_path)
+    original = {"time": T0, "u": np.float32(1.5), "u_time": T0 - timedelta(seconds=1),
+                "status": "ON", "missing": None, "label": "2026-01-01"}
+    decoded = spool._decode_row(spool._encode_row(original))
+    # Strings of other columns are not taken for time stamps
+    assert decoded == {"time": T0, "u": 1.5, "u_time": T0 - timedelta(seconds=1),
+                       "status": "ON", "missing": None, "label": "2026-01-01"}
+    assert type(decoded["u"]) is float
+    assert spool._decode_row(spool._encode_row(dict(original, u_time=None)))["u_time"] is None
+
+
+def test_append_and_read_segments(tmp_path):
+    spool = make_spool(tmp_path, segment_rows=3)
+    spool.append([row(n) for n in range(4)])
+    spool.close()
+    segments = spool.segments()
+    assert len(segments) == 1
+    # A line cut by a crash is skipped
+    with open(segments[0], "a") as segment_file:
+        segment_file.write('{"time": "2026-01-0')
+    assert spool.read_segment(segments[0]) == [row(n) for n in range(4)]
+    assert spool.rows_spooled == 4
+
+
+def test_remove_duplicates(tmp_path):
+    writer = TableWriter(tmp_path)
+    writer.write_rows([row(0), row(1)])
+    spool = make_spool(tmp_path / "spool")
+    new_rows = spool.remove_duplicates(writer, [row(1), row(2), row(2), row(3)])
+    assert new_rows == [row(2), row(3)]
+    assert spool.remove_duplicates(writer, []) == []
+
+
+def test_replay_twice(tmp_path):
+    writer = TableWriter(tmp_path)
+    spool = make_spool(tmp_path / "spool")
+    spool.append([row(0), row(1)])
+    spool.sync()
+    segment = spool.segments()[0]
+    with open(segment) as segment_file:
+        content = segment_file.read()
+    assert spool.replay(writer) == 2
+    assert not spool.has_backlog()
+    # The same segment again, e.g. after a crash before it was deleted
+    with open(segment, "w") as segment_file:
+        segment_file.write(content)
+    assert spool.replay(writer) == 0
+    assert spool.rows_skipped == 2
+    assert len(writer.rows()) == 2
+
+
+def test_replay_keeps_the_spool_on_connection_errors(tmp_path):
+    spool = make_spool(tmp_path / "spool")
+    spool.append([row(0)])
+    with pytest.raises(sql.exc.OperationalError):
+        spool.replay(DownWriter(tmp_path))
+    assert spool.has_backlog()
+    assert spool.segments_quarantined == 0
+
+
+def test_replay_quarantines_refused_segments(tmp_path):
+    writer = TableWriter(tmp_path)
+    spool = make_spool(tmp_path / "spool", segment_rows=1)
+    spool.append([row(0)])
+    # u is NOT NULL
+    spool.append([row(1, None)])
+    spool.append([row(2)])
+    assert len(spool.segments()) == 3
+    assert spool.replay(writer) == 2
+    assert not spool.has_backlog()
+    assert spool.segments_quarantined == 1
+    bad = [name for name in os.listdir(str(tmp_path / "spool")) if name.endswith(".bad")]
+    assert len(bad) == 1
+    assert [stored.time for stored in writer.rows()] == [row(0)["time"], row(2)["time"]]
+
+
+def test_is_connection_error():
+    assert is_connection_error(sql.exc.OperationalError("SELECT", {}, Exception()))
+    assert is_connection_error(ConnectionRefusedError())
+    assert not is_connection_error(sql.exc.IntegrityError("INSERT", {}, Exception()))
+    assert not is_connection_error(sql.exc.DataError("INSERT", {}, Exception()))
+    assert not is_connection_error(ValueError())
+
+    class OperationalError(Exception):
+        # like the errors of the DBAPI module, raised by COPY
+        pass
+    assert is_connection_error(OperationalError())
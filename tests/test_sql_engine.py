@@ -0,0 +1,100 @@
+import pytest
+import sqlalchemy
+from hexesvm import sql_engine as eng
+
+
+@pytest.fixture
+def sqlite(sqlite_db):
+    sqlite_db.execute("CREATE TABLE hexe_sc (time TIMESTAMP, name VARCHAR(20), "
+                      "value NUMERIC(8, 3))")
+    return "sqlite://u:p@/sc"
+
+
+def failing(n_failures, result="conn"):
+    # connect function which fails n_failures times
+    calls = []
+
+    def connect():
+        calls.append(len(calls))
+        if len(calls) <= n_failures:
+            raise sqlalchemy.exc.OperationalError("SELECT 1", {}, Exception("refused"))
+        return result
+    return connect, calls
+
+
+def test_checkout_retries_with_backoff(sqlite, monkeypatch):
+    sql_engine = eng.SqlEngine(sqlite, retry_delay=0.5)
+    assert sql_engine.healthy
+    delays = []
+    monkeypatch.setattr(eng.time, "sleep", delays.append)
+    connect, calls = failing(2)
+    assert sql_engine._checkout(connect) == "conn"
+    assert delays == [0.5, 1.]
+    assert sql_engine.healthy and sql_engine.failed_attempts == 2
+    assert sql_engine.outages == 1
+
+
+def test_checkout_gives_up(sqlite, monkeypatch):
+    sql_engine = eng.SqlEngine(sqlite, max_retries=2)
+    monkeypatch.setattr(eng.time, "sleep", lambda delay: None)
+    connect, calls = failing(10)
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        sql_engine._checkout(connect)
+    assert len(calls) == 3
+    assert not sql_engine.healthy
+    assert "refused" in sql_engine.last_error
+
+
+def test_engines_are_shared(sqlite):
+    sql_engine = eng.get_engine("sqlite", "", "sc", "u", "p")
+    assert eng.get_engine("sqlite", "", "sc", "u", "p") is sql_engine
+    # Tables are reflected once per engine
+    table = sql_engine.get_table("hexe_sc")
+    assert sql_engine.get_table("hexe_sc") is table
+    assert [column.name for column in table.columns] == ["time", "name", "value"]
+
+
+def test_schema_cache(tmp_path, capsys):
+    filename = str(tmp_path / "schema.json")
+    cache = eng.SchemaCache(filename)
+    columns = [{"name": "time", "type": "TIMESTAMP"}]
+    assert cache.get("key", "abc") is None
+    cache.put("key", "abc", columns)
+    cache = eng.SchemaCache(filename)
+    assert cache.get("key", "abc") == columns
+    # A changed table has another checksum
+    assert cache.get("key", "abd") is None
+    with open(filename, "w") as cache_file:
+        cache_file.write("{")
+    assert eng.SchemaCache(filename).entries == {}
+    assert "Ignoring invalid schema cache file" in capsys.readouterr().out
+
+
+def test_cached_structure_is_used_while_the_checksum_matches(sqlite, monkeypatch, tmp_path):
+    eng.set_schema_cache_file(str(tmp_path / "schema.json"))
+    checksum = ["abc"]
+    monkeypatch.setattr(eng.SqlEngine, "schema_checksum", lambda self, name: checksum[0])
+    reflected = []
+    reflect_table = eng.SqlEngine.reflect_table
+
+    def count_reflection(self, tablename):
+        reflected.append(tablename)
+        return reflect_table(self, tablename)
+    monkeypatch.setattr(eng.SqlEngine, "reflect_table", count_reflection)
+    eng.SqlEngine(sqlite).get_table("hexe_sc")
+    table = eng.SqlEngine(sqlite).get_table("hexe_sc")
+    assert reflected == ["hexe_sc"]
+    assert [column.name for column in table.columns] == ["time", "name", "value"]
+    checksum[0] = "abd"
+    eng.SqlEngine(sqlite).get_table("hexe_sc")
+    assert reflected == ["hexe_sc", "hexe_sc"]
+
+
+def test_cached_columns_keep_type_parameters(sqlite, monkeypatch, tmp_path):
+    eng.set_schema_cache_file(str(tmp_path / "schema.json"))
+    monkeypatch.setattr(eng.SqlEngine, "schema_checksum", lambda self, name: "abc")
+    eng.SqlEngine(sqlite).get_table("hexe_sc")
+    table = eng.SqlEngine(sqlite).get_table("hexe_sc")
+    assert table.columns["name"].type.length == 20
+    assert table.columns["value"].type.precision == 8
+    assert table.columns["value"].type.scale == 3
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from hexesvm.sql_io import SqlContainer
+
+
+T0 = datetime(2020, 1, 1)
+EPOCH0 = (T0 - datetime(1970, 1, 1)).total_seconds()
+
+
+@pytest.fixture
+def container(sqlite_db):
+    # Ten rows, one per second from T0
+    sqlite_db.execute("CREATE TABLE hexe_sc (time TIMESTAMP, p1 FLOAT, p2 FLOAT)")
+    container = SqlContainer("sqlite", "", "sc", "hexe_sc", "u", "p")
+    sqlite_db.execute(container.table.insert(), [
+        {"time": T0 + timedelta(seconds=n), "p1": n, "p2": -n} for n in range(10)])
+    container.add_param("p1")
+    container.add_param("p2")
+    return container
+
+
+def test_update_reads_in_chunks(container):
+    container.update("time", T0 + timedelta(seconds=2), T0 + timedelta(seconds=8),
+                     chunk_size=3)
+    assert container.times.dtype == np.float64
+    assert container.times.tolist() == [EPOCH0 + n for n in range(2, 9)]
+    for name, sign in (("p1", 1), ("p2", -1)):
+        assert container.params[name].dtype == np.float32
+        assert container.params[name].tolist() == [sign*n for n in range(2, 9)]
+
+
+def test_update_of_an_empty_range(container):
+    container.update("time", T0 + timedelta(seconds=20), T0 + timedelta(seconds=30))
+    # One row of zeros, like before
+    assert container.times.tolist() == [0.]
+    assert container.params["p1"].tolist() == [0.]
+
+
+class Result():
+    # Stand-in for a streamed result of (epoch, averages, minima, maxima)
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+def test_fetch_chunks_of_buckets(container):
+    rows = [(60.*n, n, 10*n, n - 1, 10*n - 1, n + 1, 10*n + 1) for n in range(5)]
+    result = Result(rows)
+    times, blocks, n_read = container._fetch_chunks(result, 2, 2, 3, True)
+    assert result.closed and n_read == 5
+    assert times.tolist() == [60.*n for n in range(5)]
+    averages, minima, maxima = blocks
+    assert averages[:, 1].tolist() == [10.*n for n in range(5)]
+    assert minima[:, 0].tolist() == [n - 1. for n in range(5)]
+    assert maxima[:, 1].tolist() == [10.*n + 1 for n in range(5)]
+    # The columns of the params are contiguous
+    assert averages.dtype == np.float32 and averages.flags.f_contiguous
+
+
+def test_buckets_need_postgresql(container):
+    # SQLite has no epoch extraction, all rows are read instead
+    container.update("time", T0, T0 + timedelta(seconds=9), bucket_seconds=5)
+    assert len(container.times) == 10
+    assert container.params_min == {} and container.params_max == {}
+
+
+def test_incremental_window_moves_with_the_query_time(container, sqlite_db):
+    assert container.update_incremental("time", 5, now=T0 + timedelta(seconds=9)) == 6
+    assert container.times.tolist() == [EPOCH0 + n for n in range(4, 10)]
+    # Only the new rows are read
+    sqlite_db.execute(container.table.insert(), [
+        {"time": T0 + timedelta(seconds=n), "p1": n, "p2": -n} for n in (10, 11)])
+    assert container.update_incremental("time", 5, now=T0 + timedelta(seconds=11)) == 2
+    assert container.times.tolist() == [EPOCH0 + n for n in range(6, 12)]
+    assert container.params["p2"].tolist() == [-n for n in range(6, 12)]
+    # Without new rows the old ones still leave the window
+    assert container.update_incremental("time", 5, now=T0 + timedelta(seconds=14)) == 0
+    assert container.times.tolist() == [EPOCH0 + n for n in range(9, 12)]
+    container.update_incremental("time", 5, now=T0 + timedelta(seconds=30))
+    assert len(container.times) == 0 and len(container.params["p1"]) == 0
+
+
+def test_incremental_window_restarts_if_the_params_change(container):
+    container.update_incremental("time", 5, now=T0 + timedelta(seconds=9))
+    container.remove_param("p2")
+    assert container.update_incremental("time", 2, now=T0 + timedelta(seconds=9)) == 3
+    assert list(container.params) == ["p1"]
+    assert container.params["p1"].tolist() == [7., 8., 9.]
@@ -0,0 +1,143 @@
+import threading
+import time
+from types import SimpleNamespace
+import sqlalchemy
+from hexesvm.sql_io_writer import BufferedSqlWriter
+
+
+class Writer():
+    # Stand-in for SqlWriter, records the written batches
+
+    def __init__(self):
+        self.engine = SimpleNamespace(dialect=SimpleNamespace(dbapi=None))
+        self.batches = []
+        self.error = None
+
+    def write_rows(self, rows):
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(rows))
+        return len(rows)
+
+
+def connection_lost():
+    return sqlalchemy.exc.OperationalError("INSERT", {}, Exception("connection lost"))
+
+
+def wait_until(condition, timeout=5.):
+    t_end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < t_end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_rows_are_written_in_batches():
+    writer = Writer()
+    buffered = BufferedSqlWriter(writer, batch_size=2, flush_interval=60)
+    for n in range(5):
+        assert buffered.put({"n": n})
+    assert buffered.depth() == 5 and buffered.max_depth == 5
+    thread = threading.Thread(target=buffered.run)
+    thread.start()
+    assert wait_until(lambda: buffered.rows_written == 4)
+    # The last row waits for the flush interval or the end of the thread
+    assert writer.batches == [[{"n": 0}, {"n": 1}], [{"n": 2}, {"n": 3}]]
+    buffered.stop()
+    thread.join(5)
+    assert writer.batches[-1] == [{"n": 4}]
+    assert buffered.rows_written == 5 and buffered.flushes == 3
+
+
+def test_flush_interval():
+    writer = Writer()
+    buffered = BufferedSqlWriter(writer, batch_size=50, flush_interval=0.1)
+    thread = threading.Thread(target=buffered.run)
+    thread.start()
+    buffered.put({"n": 0})
+    assert wait_until(lambda: writer.batches == [[{"n": 0}]], 1.)
+    buffered.stop()
+    thread.join(5)
+
+
+def test_full_queue_drops_rows():
+    buffered = BufferedSqlWriter(Writer(), max_queue_size=2)
+    assert buffered.put({"n": 0}) and buffered.put({"n": 1})
+    assert not buffered.put({"n": 2})
+    assert buffered.dropped == 1 and buffered.depth() == 2
+
+
+def test_failed_flush():
+    writer = Writer()
+    buffered = BufferedSqlWriter(writer)
+    writer.error = connection_lost()
+    assert not buffered.flush([{"n": 0}])
+    assert not buffered.healthy and "connection lost" in buffered.last_error
+    assert buffered.rows_failed == 1
+    writer.error = None
+    assert buffered.flush([{"n": 1}])
+    assert buffered.healthy and buffered.last_error is None
+
+
+class Spool():
+    # Stand-in for SqlSpool
+
+    def __init__(self):
+        self.rows = []
+        self.replay_error = None
+        self.closed = False
+
+    def append(self, rows):
+        self.rows.extend(rows)
+
+    def has_backlog(self):
+        return len(self.rows) > 0
+
+    def replay(self, sql_writer):
+        if self.replay_error is not None:
+            raise self.replay_error
+        sql_writer.write_rows(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.closed = True
+
+
+def test_failed_rows_are_spooled_and_replayed():
+    writer = Writer()
+    spool = Spool()
+    buffered = BufferedSqlWriter(writer, spool=spool)
+    writer.error = connection_lost()
+    assert not buffered.flush([{"n": 0}, {"n": 1}])
+    assert spool.rows == [{"n": 0}, {"n": 1}]
+    # The spool is replayed after the next successful flush
+    writer.error = None
+    assert buffered.flush([{"n": 2}])
+    assert writer.batches == [[{"n": 2}], [{"n": 0}, {"n": 1}]]
+    assert spool.rows == []
+
+
+def test_failed_replay_keeps_the_spool():
+    writer = Writer()
+    spool = Spool()
+    spool.append([{"n": 0}])
+    spool.replay_error = connection_lost()
+    buffered = BufferedSqlWriter(writer, spool=spool)
+    assert buffered.flush([{"n": 1}])
+    assert not buffered.healthy
+    assert spool.rows == [{"n": 0}]
+    spool.replay_error = None
+    assert buffered.replay_spool()
+    assert writer.batches == [[{"n": 1}], [{"n": 0}]]
+
+
+def test_spool_is_closed_with_the_thread():
+    spool = Spool()
+    writer = Writer()
+    buffered = BufferedSqlWriter(writer, flush_interval=0.05, spool=spool)
+    thread = threading.Thread(target=buffered.run)
+    thread.start()
+    buffered.put({"n": 0})
+    assert wait_until(lambda: writer.batches)
+    buffered.stop()
+    thread.join(5)
+    assert spool.closed
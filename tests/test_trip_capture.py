@@ -0,0 +1,78 @@
+import os
+import pytest
+from hexesvm import history as hist
+from hexesvm import trip_capture
+
+
+class Module():
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Channel():
+    # The parts of an HV channel used by the trip recorder
+
+    def __init__(self, name):
+        self.name = name
+        self.module = Module("M")
+        self.archive_key = "M__"+name
+        self.history = hist.ChannelHistory(100)
+
+
+@pytest.fixture
+def channels(snapshot):
+    # Two channels with one read-out per second from t_mono = 0 to 60
+    channels = [Channel("A"), Channel("B")]
+    for t_mono in range(61):
+        for n, channel in enumerate(channels):
+            channel.history.append(snapshot(float(t_mono), voltage=100.*(n + 1)))
+    return channels
+
+
+def test_hardware_trips_trigger_on_the_rising_edge(tmp_path, channels, snapshot):
+    recorder = trip_capture.TripRecorder(str(tmp_path), channels, 5, 5)
+    channel = channels[0]
+    # Unknown state and the first read-out do not trigger
+    recorder.check_hardware_trip(channel, snapshot(1., channel_is_tripped=None))
+    recorder.check_hardware_trip(channel, snapshot(2., channel_is_tripped=True))
+    assert recorder.pending == []
+    recorder.check_hardware_trip(channel, snapshot(3., channel_is_tripped=False))
+    recorder.check_hardware_trip(channel, snapshot(4., channel_is_tripped=True))
+    recorder.check_hardware_trip(channel, snapshot(5., channel_is_tripped=True))
+    assert len(recorder.pending) == 1
+    assert recorder.pending[0].reason == "hardware"
+    assert recorder.pending[0].t_start == -1. and recorder.pending[0].t_end == 9.
+    # Only one capture per channel at a time
+    assert not recorder.trigger(channel, "software", snapshot(6.))
+    assert recorder.trigger(channels[1], "software", snapshot(6.))
+
+
+def test_captures_are_saved_after_the_post_trigger_time(tmp_path, channels, snapshot):
+    recorder = trip_capture.TripRecorder(str(tmp_path / "trips"), channels, 10, 5)
+    recorder.trigger(channels[1], "resistance", snapshot(30., channel_is_tripped=True,
+                                                         voltage=12.))
+    assert recorder.poll(34.) == []
+    saved = recorder.poll(35.)
+    assert len(saved) == 1 and recorder.pending == []
+    assert recorder.captures_saved == 1
+    assert os.path.dirname(saved[0].filename) == str(tmp_path / "trips")
+    metadata, samples = trip_capture.load_capture(saved[0].filename)
+    assert metadata["reason"] == "resistance"
+    assert metadata["trigger_channel"] == "M__B"
+    assert metadata["voltage"] == 12.
+    assert metadata["status_flags"]["channel_is_tripped"]
+    assert metadata["channels"] == ["M__A", "M__B"]
+    # All channels from pre_seconds before to post_seconds after the trip
+    for key, voltage in (("M__A", 100.), ("M__B", 200.)):
+        assert samples[key]["t_mono"].tolist() == [float(t) for t in range(20, 36)]
+        assert set(samples[key]["voltage"]) == {voltage}
+
+
+def test_is_recording(tmp_path, channels, snapshot):
+    recorder = trip_capture.TripRecorder(str(tmp_path), channels, 10, 5)
+    recorder.trigger(channels[0], "software", snapshot(30.))
+    assert recorder.is_recording(channels[0])
+    assert not recorder.is_recording(channels[1])
+    recorder.poll(35.)
+    assert not recorder.is_recording(channels[0])
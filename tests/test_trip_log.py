@@ -0,0 +1,43 @@
+import time
+from hexesvm.trip_log import TripEventStore
+
+
+def test_count_since():
+    store = TripEventStore()
+    for trip_time in (10., 30., 20., 40.):
+        store.add(trip_time)
+    assert store.times == [10., 20., 30., 40.]
+    assert store.count_since(20.) == 3
+    assert store.count_since(41.) == 0
+    assert store.count_last(15., now=40.) == 2
+    assert store.last() == 40. and store.last(2) == 30.
+    assert store.last(5) is None
+
+
+def test_old_trips_are_dropped():
+    store = TripEventStore(max_age=100)
+    store.add(0.)
+    store.add(50.)
+    store.add(160.)
+    assert store.times == [160.]
+
+
+def test_reload(tmp_path):
+    filename = str(tmp_path / "trips" / "channel.jsonl")
+    now = time.time()
+    store = TripEventStore(filename)
+    store.add(now - 20)
+    store.add(now - 10)
+    reloaded = TripEventStore(filename)
+    assert reloaded.times == [now - 20, now - 10]
+    assert reloaded.count_last(15) == 1
+
+
+def test_reload_skips_invalid_and_expired_lines(tmp_path):
+    filename = tmp_path / "channel.jsonl"
+    now = time.time()
+    filename.write_text('{"time": %r}\n{"time": "x"}\n{"time": %r}\n{"time": 1' % (now - 5, now - 500))
+    store = TripEventStore(str(filename), max_age=100)
+    assert store.times == [now - 5]
+    # The expired trip was removed from the file
+    assert TripEventStore(str(filename), max_age=1000).times == [now - 5]